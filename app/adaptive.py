@@ -0,0 +1,71 @@
+"""
+Адаптивный интервал опроса сайтов по наблюдаемой частоте изменений.
+После каждой успешной проверки check_site обновляет статистику сайта
+(change_count, last_change_at, avg_change_gap) и выученный интервал
+adaptive_interval: при новых постах он сокращается, при их отсутствии —
+плавно растет, всегда в пределах [min_interval, max_interval].
+Выученный интервал используется для next_check_at, только если включен
+режим ADAPTIVE_POLLING; иначе действует фиксированный check_interval.
+"""
+from datetime import datetime
+import os
+
+# Режим адаптивного опроса и его параметры (из .env или по умолчанию)
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "0") == "1"
+ADAPTIVE_MIN_INTERVAL = float(os.getenv("ADAPTIVE_MIN_INTERVAL", "5"))      # минуты
+ADAPTIVE_MAX_INTERVAL = float(os.getenv("ADAPTIVE_MAX_INTERVAL", "1440"))   # минуты
+# Во сколько раз сократить интервал при новых постах и увеличить при их отсутствии
+ADAPTIVE_SPEEDUP = float(os.getenv("ADAPTIVE_SPEEDUP", "0.5"))
+ADAPTIVE_SLOWDOWN = float(os.getenv("ADAPTIVE_SLOWDOWN", "1.25"))
+# Сколько проверок делать на один ожидаемый интервал между изменениями
+ADAPTIVE_CHECKS_PER_CHANGE = float(os.getenv("ADAPTIVE_CHECKS_PER_CHANGE", "2"))
+# Вес нового наблюдения в скользящем среднем интервала между изменениями
+ADAPTIVE_GAP_WEIGHT = 0.3
+
+
+def interval_bounds(site) -> tuple:
+    """
+    Границы интервала сайта в минутах: собственные min/max или значения по умолчанию.
+    """
+    low = getattr(site, 'min_interval', None) or ADAPTIVE_MIN_INTERVAL
+    high = getattr(site, 'max_interval', None) or ADAPTIVE_MAX_INTERVAL
+    return low, max(low, high)
+
+
+def effective_interval(site, adaptive: bool = None) -> float:
+    """
+    Интервал до следующей проверки сайта в минутах.
+    :param adaptive: использовать выученный интервал (по умолчанию ADAPTIVE_POLLING)
+    """
+    adaptive = ADAPTIVE_POLLING if adaptive is None else adaptive
+    learned = getattr(site, 'adaptive_interval', None)
+    if adaptive and learned:
+        return learned
+    return getattr(site, 'check_interval', None) or 10
+
+
+def record_check(site, new_posts_count: int, now: datetime):
+    """
+    Обновляет статистику изменений и выученный интервал после успешной проверки.
+    :param site: объект Site (изменяется на месте, коммит — у вызывающего кода)
+    :param new_posts_count: сколько новых постов нашла проверка
+    :param now: время проверки (naive UTC)
+    :return: новый adaptive_interval (минуты)
+    """
+    low, high = interval_bounds(site)
+    current = getattr(site, 'adaptive_interval', None) or getattr(site, 'check_interval', None) or 10
+    if new_posts_count:
+        last_change = getattr(site, 'last_change_at', None)
+        if last_change is not None:
+            gap = (now - last_change).total_seconds() / 60
+            avg = getattr(site, 'avg_change_gap', None)
+            site.avg_change_gap = gap if avg is None else avg + ADAPTIVE_GAP_WEIGHT * (gap - avg)
+        site.last_change_at = now
+        site.change_count = (getattr(site, 'change_count', 0) or 0) + 1
+        interval = current * ADAPTIVE_SPEEDUP
+        if getattr(site, 'avg_change_gap', None):
+            interval = min(interval, site.avg_change_gap / ADAPTIVE_CHECKS_PER_CHANGE)
+    else:
+        interval = current * ADAPTIVE_SLOWDOWN
+    site.adaptive_interval = round(min(high, max(low, interval)), 2)
+    return site.adaptive_interval
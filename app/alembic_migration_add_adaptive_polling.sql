@@ -0,0 +1,7 @@
+-- Migration: Add adaptive polling bounds, learned interval and change statistics to sites table
+ALTER TABLE sites ADD COLUMN min_interval INTEGER;
+ALTER TABLE sites ADD COLUMN max_interval INTEGER;
+ALTER TABLE sites ADD COLUMN adaptive_interval FLOAT;
+ALTER TABLE sites ADD COLUMN avg_change_gap FLOAT;
+ALTER TABLE sites ADD COLUMN change_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sites ADD COLUMN last_change_at DATETIME;
@@ -0,0 +1,16 @@
+-- Migration: Add check_requests table: manual checks queued by the API and run by the scheduler/worker
+CREATE TABLE check_requests (
+    id INTEGER PRIMARY KEY,
+    job_id VARCHAR(32) NOT NULL UNIQUE,
+    site_id INTEGER NOT NULL REFERENCES sites (id),
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    requests INTEGER NOT NULL DEFAULT 1,
+    requested_at DATETIME NOT NULL,
+    started_at DATETIME,
+    finished_at DATETIME,
+    worker VARCHAR(255),
+    outcome TEXT,
+    timings TEXT
+);
+CREATE INDEX ix_check_requests_status_id ON check_requests (status, id);
+CREATE INDEX ix_check_requests_site_id_status ON check_requests (site_id, status);
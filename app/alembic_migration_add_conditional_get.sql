@@ -0,0 +1,7 @@
+-- Migration: Add conditional GET validators and skip counters to sites table
+ALTER TABLE sites ADD COLUMN etag VARCHAR(256);
+ALTER TABLE sites ADD COLUMN last_modified VARCHAR(64);
+ALTER TABLE sites ADD COLUMN content_digest VARCHAR(64);
+ALTER TABLE sites ADD COLUMN checks_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sites ADD COLUMN not_modified_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sites ADD COLUMN unchanged_count INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- Migration: Add RSS/Atom feed ingestion mode and feed URL to sites table
+ALTER TABLE sites ADD COLUMN ingest_mode VARCHAR(16) NOT NULL DEFAULT 'auto';
+ALTER TABLE sites ADD COLUMN feed_url VARCHAR(512);
+ALTER TABLE sites ADD COLUMN active_ingest VARCHAR(16);
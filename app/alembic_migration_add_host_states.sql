@@ -0,0 +1,10 @@
+-- Migration: Add consecutive error counter to sites and persisted per-host circuit breaker state
+ALTER TABLE sites ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0;
+CREATE TABLE host_states (
+    host VARCHAR(255) PRIMARY KEY,
+    state VARCHAR(16) NOT NULL DEFAULT 'closed',
+    failures INTEGER NOT NULL DEFAULT 0,
+    opened_at DATETIME,
+    last_error TEXT,
+    updated_at DATETIME
+);
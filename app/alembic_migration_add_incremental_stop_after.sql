@@ -0,0 +1,2 @@
+-- Migration: Add per-site incremental extraction threshold to sites table
+ALTER TABLE sites ADD COLUMN incremental_stop_after INTEGER;
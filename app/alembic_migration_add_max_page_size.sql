@@ -0,0 +1,2 @@
+-- Migration: Add per-site page size limit (bytes) to sites table
+ALTER TABLE sites ADD COLUMN max_page_size INTEGER;
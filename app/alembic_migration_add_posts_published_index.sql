@@ -0,0 +1,2 @@
+-- Migration: Composite (site_id, published_at) index for bounded "newest N posts" queries
+CREATE INDEX IF NOT EXISTS ix_posts_site_id_published_at ON posts (site_id, published_at);
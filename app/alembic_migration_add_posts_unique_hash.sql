@@ -0,0 +1,6 @@
+-- Migration: Unique (site_id, content_hash) index on posts for set-based deduplication
+-- Remove existing duplicates first (keep the oldest row per site_id + content_hash)
+DELETE FROM posts
+WHERE content_hash IS NOT NULL
+  AND id NOT IN (SELECT MIN(id) FROM posts WHERE content_hash IS NOT NULL GROUP BY site_id, content_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_posts_site_id_content_hash ON posts (site_id, content_hash);
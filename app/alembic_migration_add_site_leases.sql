@@ -0,0 +1,5 @@
+-- Migration: Add check lease columns to sites table
+ALTER TABLE sites ADD COLUMN lease_owner VARCHAR(128);
+ALTER TABLE sites ADD COLUMN lease_until DATETIME;
+ALTER TABLE sites ADD COLUMN next_check_at DATETIME;
+CREATE INDEX ix_sites_next_check_at ON sites (next_check_at);
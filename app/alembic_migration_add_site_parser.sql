@@ -0,0 +1,2 @@
+-- Migration: Add per-site HTML parser backend override to sites table
+ALTER TABLE sites ADD COLUMN parser VARCHAR(32);
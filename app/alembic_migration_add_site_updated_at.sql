@@ -0,0 +1,12 @@
+-- Migration: Add updated_at watermark to sites table for incremental scheduler reconciliation
+ALTER TABLE sites ADD COLUMN updated_at DATETIME;
+UPDATE sites SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') || '000';
+CREATE INDEX ix_sites_updated_at ON sites (updated_at);
+-- Правки настроек в обход API (ручной SQL) тоже сдвигают updated_at; время в формате
+-- SQLAlchemy (с долями секунды), чтобы сравнение с водяным знаком не теряло правки той же секунды
+CREATE TRIGGER sites_touch_updated_at
+AFTER UPDATE OF url, selector, is_active, check_interval, min_interval, max_interval ON sites
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE sites SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') || '000' WHERE id = NEW.id;
+END;
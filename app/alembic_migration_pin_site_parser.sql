@@ -0,0 +1,5 @@
+-- Migration: Keep html.parser for sites created before the lxml default
+-- lxml и selectolax иначе разбирают CDATA и textarea, чем html.parser: у части постов
+-- меняется текст, а с ним content_hash, и уже сохраненные посты пришли бы повторно.
+-- Существующие сайты остаются на html.parser; новые получают SCRAPER_PARSER.
+UPDATE sites SET parser = 'html.parser' WHERE parser IS NULL;
@@ -0,0 +1,108 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Сравнение бэкендов разбора HTML (app.parsers) на сохраненных страницах.
+Для каждой страницы из tests/fixtures выполняет parse_page + extract_posts
+каждым доступным бэкендом, печатает среднее время и проверяет, что
+content_hash постов совпадают с эталоном (html.parser).
+
+С --processes N дополнительно сравнивает пропускную способность разбора
+в текущем потоке и в ParsePool из N процессов.
+
+Запуск: python app/benchmark_parsers.py [--repeat N] [--processes N]
+"""
+import argparse
+import time
+
+from app.parse_pool import ParsePool
+from app.parsers import FALLBACK_PARSER, available_backends
+from app.scraper import WebScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+
+# Страница -> селекторы сайта (как в Site.selector / title_selector / desc_selector / link_selector)
+FIXTURES = {
+    "blog_listing.html": {
+        "post_selector": "article.card",
+        "title_selector": "h2.title",
+        "desc_selector": "p.summary",
+        "link_selector": "h2 a",
+        "base_url": "https://blog.example.com/",
+    },
+    "news_cards.html": {
+        "post_selector": "ul.news > li.news-item",
+        "title_selector": "a.headline",
+        "desc_selector": ".teaser",
+        "link_selector": "h3 a[href]",
+        "base_url": "https://news.example.org/section/",
+    },
+}
+
+
+def run_backend(scraper: WebScraper, html: str, parser: str, selectors: dict) -> list:
+    page = scraper.parse_page(html, parser=parser)
+    return scraper.extract_posts(page, **selectors)
+
+
+def benchmark(repeat: int = 50) -> bool:
+    """
+    Печатает время разбора по бэкендам и страницам.
+    :param repeat: количество повторов для усреднения
+    :return: True, если хеши постов совпали у всех бэкендов
+    """
+    scraper = WebScraper(parser=FALLBACK_PARSER)
+    backends = available_backends()
+    consistent = True
+    for name, selectors in FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+        reference = [p["content_hash"] for p in run_backend(scraper, html, FALLBACK_PARSER, selectors)]
+        print(f"{name}: {len(html)} байт, постов: {len(reference)}")
+        for parser in backends:
+            hashes = [p["content_hash"] for p in run_backend(scraper, html, parser, selectors)]
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run_backend(scraper, html, parser, selectors)
+            elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+            same = hashes == reference
+            consistent = consistent and same
+            print(f"  {parser:<12} {elapsed_ms:8.2f} ms  хеши {'совпадают' if same else 'РАСХОДЯТСЯ'}")
+    return consistent
+
+
+def benchmark_pool(processes: int, repeat: int = 50, parser: str = None):
+    """
+    Печатает число страниц в секунду: разбор в текущем потоке и в ParsePool.
+    :param processes: количество процессов пула
+    :param repeat: сколько раз разобрать каждую страницу
+    :param parser: бэкенд разбора (по умолчанию SCRAPER_PARSER)
+    """
+    jobs = []
+    for name, selectors in FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            jobs.extend([(f.read().encode("utf-8"), selectors)] * repeat)
+    for workers in (0, processes):
+        pool = ParsePool(max_workers=workers)
+        try:
+            pool.submit(*jobs[0], parser).result()  # запуск процессов не входит в замер
+            start = time.perf_counter()
+            for future in [pool.submit(html, selectors, parser) for html, selectors in jobs]:
+                future.result()
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+        label = f"{workers} процессов" if workers else "в потоке"
+        print(f"ParsePool ({label}): {len(jobs) / elapsed:8.1f} страниц/с")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк бэкендов разбора HTML")
+    arg_parser.add_argument("--repeat", type=int, default=50, help="количество повторов")
+    arg_parser.add_argument("--processes", type=int, default=0, help="сравнить с ParsePool из N процессов")
+    args = arg_parser.parse_args()
+    consistent = benchmark(args.repeat)
+    if args.processes:
+        benchmark_pool(args.processes, args.repeat)
+    sys.exit(0 if consistent else 1)
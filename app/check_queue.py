@@ -0,0 +1,259 @@
+"""
+Очередь ручных проверок сайтов (POST /api/sites/{site_id}/check).
+API только ставит задание — строку check_requests с job_id — и отдает его
+статус; загрузку и разбор выполняет процесс с планировщиком (python -m app.worker
+или API с ENABLE_SCHEDULER=1): CheckRequestPoller забирает новые задания
+и отдает их диспетчеру вне очереди (DueQueueDispatcher.run_now), то есть
+раньше наступивших плановых проверок.
+Single-flight: пока задание сайта в очереди или выполняется, повторные
+запросы получают тот же job_id, а не еще одну загрузку. Задание берет один
+воркер (условный UPDATE status queued → running). С плановой проверкой
+того же сайта ручная делится через аренду (app.leases), а без аренды
+(SITE_LEASES=0) — через отметку проверки в процессе (hold_local_check): если
+сайт сейчас проверяет планировщик, задание дожидается ее конца и засчитывает
+ее результат.
+Статус задания: позиция в очереди, длительность фаз и итог (check_status()).
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import func, update
+
+from app.deadline import CHECK_DEADLINE, Deadline
+from app.leases import LEASE_OWNER, LEASE_SECONDS, WORKER_ID, utcnow
+
+# Как часто воркер забирает новые ручные проверки, секунд, и сколько завершенных заданий хранить для статуса
+MANUAL_CHECK_POLL = float(os.getenv("MANUAL_CHECK_POLL", "1"))
+MANUAL_CHECK_HISTORY = int(os.getenv("MANUAL_CHECK_HISTORY", "1000"))
+# Владелец аренды ручных проверок: отличается от планировщика этого же процесса
+MANUAL_LEASE_OWNER = f"{LEASE_OWNER}:manual" if LEASE_OWNER else None
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _seconds(start, end):
+    return round((end - start).total_seconds(), 3) if start and end else None
+
+
+def submit_check(db_session, site_id: int):
+    """
+    Ставит ручную проверку сайта в очередь или присоединяется к уже поставленной.
+    :return: (CheckRequest, created) — created=False, если запрос слит с заданием в очереди или в работе
+    """
+    from app.models import CheckRequest
+    job = (db_session.query(CheckRequest)
+           .filter(CheckRequest.site_id == site_id, CheckRequest.status.in_(ACTIVE))
+           .order_by(CheckRequest.id).first())
+    if job is not None:
+        job.requests += 1
+        db_session.commit()
+        return job, False
+    job = CheckRequest(job_id=uuid.uuid4().hex, site_id=site_id, status=QUEUED, requests=1, requested_at=utcnow())
+    db_session.add(job)
+    db_session.commit()
+    return job, True
+
+
+def queue_position(db_session, job):
+    """:return: сколько ручных заданий выполнится раньше (0 — следующее) или None, если оно уже не в очереди"""
+    from app.models import CheckRequest
+    if job.status != QUEUED:
+        return None
+    return db_session.query(CheckRequest).filter(CheckRequest.status == QUEUED, CheckRequest.id < job.id).count()
+
+
+def check_status(db_session, job_id: str):
+    """:return: словарь статуса задания или None для неизвестного job_id"""
+    from app.models import CheckRequest
+    job = db_session.query(CheckRequest).filter_by(job_id=job_id).first()
+    if job is None:
+        return None
+    timings = {}
+    if job.started_at:
+        timings["queued"] = _seconds(job.requested_at, job.started_at)
+    timings.update(json.loads(job.timings) if job.timings else {})
+    if job.finished_at:
+        timings["total"] = _seconds(job.requested_at, job.finished_at)
+    return {
+        "job_id": job.job_id,
+        "site_id": job.site_id,
+        "status": job.status,
+        "position": queue_position(db_session, job),
+        "requests": job.requests,
+        "worker": job.worker,
+        "created_at": _iso(job.requested_at),
+        "started_at": _iso(job.started_at),
+        "finished_at": _iso(job.finished_at),
+        "timings": timings,
+        "outcome": json.loads(job.outcome) if job.outcome else None,
+    }
+
+
+def queue_stats(db_session) -> dict:
+    from app.models import CheckRequest
+    counts = dict(db_session.query(CheckRequest.status, func.count()).group_by(CheckRequest.status).all())
+    return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+def outcome(result: dict) -> dict:
+    return {
+        "success": result.get("success", False),
+        "error": result.get("error"),
+        "skipped": result.get("skipped"),
+        "new_posts_count": result.get("new_posts_count", 0),
+        "posts_found": len(result.get("posts") or []),
+    }
+
+
+def run_manual_check(site_id: int, requested_at: datetime, db_session_factory, scraper,
+                     lease_owner=MANUAL_LEASE_OWNER, wait_timeout: float = None, poll: float = 0.2):
+    """
+    Ручная проверка сайта без ожидания next_check_at.
+    Если сайт сейчас проверяет другой владелец аренды (планировщик), ждет ее
+    окончания: проверка, завершившаяся после requested_at, засчитывается
+    вместо новой загрузки (skipped="deduplicated").
+    :param wait_timeout: сколько ждать чужую проверку, секунд (по умолчанию CHECK_DEADLINE)
+    """
+    from app.models import Site
+    from app.scheduler import run_site_check
+    waited = Deadline(wait_timeout or CHECK_DEADLINE or 60)
+    while True:
+        result = run_site_check(site_id, db_session_factory, scraper, lease_owner=lease_owner, force=True,
+                                unchecked_since=requested_at)
+        if result is None or result.get("skipped") != "leased" or waited.expired:
+            return result
+        time.sleep(poll)
+        db = db_session_factory()
+        try:
+            site = db.get(Site, site_id)
+            if site is None:
+                return None
+            if site.lease_owner is None and site.last_check is not None and site.last_check.replace(tzinfo=None) >= requested_at:
+                print(f"[check_queue] site.id={site_id}: засчитана плановая проверка, завершившаяся после запроса")
+                return {"site_id": site_id, "success": site.last_error is None, "error": site.last_error,
+                        "posts": [], "skipped": "deduplicated", "next_check_at": site.next_check_at}
+        finally:
+            db.close()
+
+
+def run_requested_check(request_id: int, db_session_factory, scraper, lease_owner=MANUAL_LEASE_OWNER,
+                        worker: str = WORKER_ID):
+    """
+    Выполняет задание check_requests, если удалось его взять (другой воркер
+    мог успеть раньше), и записывает итог.
+    :return: результат проверки или None, если задание взял другой воркер
+    """
+    from app.models import CheckRequest
+    db = db_session_factory()
+    try:
+        now = utcnow()
+        claimed = db.execute(
+            update(CheckRequest)
+            .where(CheckRequest.id == request_id, CheckRequest.status == QUEUED)
+            .values(status=RUNNING, started_at=now, worker=worker)
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return None
+        job = db.get(CheckRequest, request_id)
+        site_id, requested_at = job.site_id, job.requested_at
+        try:
+            result = run_manual_check(site_id, requested_at, db_session_factory, scraper, lease_owner=lease_owner)
+            if result is None:
+                result = {"success": False, "error": "Site not found or inactive", "skipped": None}
+        except Exception as e:
+            print(f"[check_queue] Ошибка проверки site.id={site_id}: {e}")
+            result = {"success": False, "error": str(e), "skipped": None}
+        job = db.get(CheckRequest, request_id)
+        job.status = DONE if result.get("success") else FAILED
+        job.finished_at = utcnow()
+        job.outcome = json.dumps(outcome(result))
+        job.timings = json.dumps(result.get("timings") or {})
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+class CheckRequestPoller:
+    """
+    Забирает новые задания check_requests и отдает их dispatch(request_id, site_id).
+    Задание, взятое упавшим воркером, возвращается в очередь через LEASE_SECONDS.
+    """
+    def __init__(self, db_session_factory, dispatch, history: int = MANUAL_CHECK_HISTORY, stale_after: float = LEASE_SECONDS):
+        """
+        :param dispatch: функция dispatch(request_id, site_id), ставящая выполнение задания
+        :param history: сколько завершенных заданий хранить для статуса
+        :param stale_after: через сколько секунд задание в работе считается брошенным
+        """
+        self.db_session_factory = db_session_factory
+        self.dispatch = dispatch
+        self.history = history
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self._dispatched = set()  # id заданий, отданных и еще не завершенных
+        self.polls = 0
+        self.picked = 0
+        self.requeued = 0
+
+    def done(self, request_id: int):
+        """Отмечает задание завершенным в этом процессе (вызывается после run_requested_check)."""
+        with self._lock:
+            self._dispatched.discard(request_id)
+
+    def run(self) -> int:
+        """
+        Один опрос очереди.
+        :return: сколько новых заданий отдано на выполнение
+        """
+        from app.models import CheckRequest
+        db = self.db_session_factory()
+        try:
+            self.requeued += db.execute(
+                update(CheckRequest)
+                .where(CheckRequest.status == RUNNING,
+                       CheckRequest.started_at < utcnow() - timedelta(seconds=self.stale_after))
+                .values(status=QUEUED, started_at=None, worker=None)
+            ).rowcount
+            rows = (db.query(CheckRequest.id, CheckRequest.site_id)
+                    .filter(CheckRequest.status == QUEUED).order_by(CheckRequest.id).all())
+            self._trim(db)
+            db.commit()
+        finally:
+            db.close()
+        self.polls += 1
+        picked = 0
+        for request_id, site_id in rows:
+            with self._lock:
+                if request_id in self._dispatched:
+                    continue
+                self._dispatched.add(request_id)
+            self.dispatch(request_id, site_id)
+            picked += 1
+        self.picked += picked
+        return picked
+
+    def _trim(self, db):
+        from app.models import CheckRequest
+        finished = (db.query(CheckRequest.id).filter(CheckRequest.status.in_((DONE, FAILED)))
+                    .order_by(CheckRequest.id.desc()).offset(self.history).limit(1).scalar())
+        if finished is not None:
+            db.query(CheckRequest).filter(CheckRequest.status.in_((DONE, FAILED)),
+                                          CheckRequest.id <= finished).delete(synchronize_session=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            dispatched = len(self._dispatched)
+        return {"polls": self.polls, "picked": self.picked, "requeued": self.requeued, "pending": dispatched}
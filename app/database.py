@@ -1,16 +1,60 @@
 """
 Database setup for RSSify project.
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
 # SQLite database URL (from .env or default)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///app/rssify2.db")
+# Режим хранения SQLite: wal — WAL, synchronous=NORMAL и прагмы ниже на каждом
+# подключении, а результаты проверок пишет один поток (app.result_writer);
+# rollback — журнал отката SQLite по умолчанию, запись из потоков проверок
+SQLITE_STORAGE_MODE = os.getenv("SQLITE_STORAGE_MODE", "wal")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # мс ожидания блокировки
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # байт, 0 — без mmap
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # отрицательное — в КиБ (64 МБ)
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def wal_enabled(url: str = DATABASE_URL) -> bool:
+    """WAL-режим включен для этого URL (SQLite и SQLITE_STORAGE_MODE=wal)."""
+    return is_sqlite(url) and SQLITE_STORAGE_MODE == "wal"
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """
+    Прагмы WAL-режима для нового подключения SQLite (обработчик события connect).
+    Читатели в WAL не блокируются записью, а synchronous=NORMAL не вызывает
+    fsync на каждый коммит (при сбое питания теряются лишь последние коммиты).
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    finally:
+        cursor.close()
+
+
+def make_engine(url: str = DATABASE_URL, **kwargs):
+    """
+    Создает engine; для SQLite в режиме wal прагмы применяются на каждом подключении.
+    :param kwargs: дополнительные параметры create_engine (например, pool_size)
+    """
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    if wal_enabled(url):
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+# Пул подключений для чтения (API, ленты) и записи вне проверок сайтов
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -0,0 +1,98 @@
+"""
+Бюджеты времени проверок.
+Каждая проверка сайта получает Deadline на все фазы (запрос, разбор, запись
+в БД): загрузка отменяется в event loop движка, ожидание разбора в пуле
+прерывается, а незакоммиченная запись откатывается. У прогона check_all_sites
+есть общий бюджет: когда он исчерпан, незавершенные загрузки отменяются,
+а оставшиеся сайты (наименее просроченные) пропускаются до следующего цикла.
+Счетчики таймаутов и пропусков — deadline_stats (/scheduler/stats).
+"""
+import os
+import threading
+import time
+
+# Бюджет одной проверки сайта в секундах (0 — без ограничения)
+CHECK_DEADLINE = float(os.getenv("CHECK_DEADLINE", "60"))
+# Бюджет прогона check_all_sites в секундах (0 — 90% интервала периодической задачи)
+CYCLE_BUDGET = float(os.getenv("CYCLE_BUDGET", "0"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Бюджет времени исчерпан в фазе phase ("fetch", "parse", "db" или "cycle")."""
+    def __init__(self, phase: str, budget: float = None):
+        self.phase = phase
+        self.budget = budget
+        limit = f" ({budget:.1f}s)" if budget is not None else ""
+        super().__init__(f"Deadline exceeded during {phase}{limit}")
+
+
+class Deadline:
+    """
+    Момент, к которому работа должна завершиться (по time.monotonic).
+    seconds=None или 0 — без ограничения.
+    """
+    def __init__(self, seconds: float = None, clock=time.monotonic):
+        self.clock = clock
+        self.budget = seconds or None
+        self.expires_at = clock() + seconds if seconds else None
+
+    def remaining(self):
+        """:return: секунд до истечения (не меньше 0) или None без ограничения"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.clock() >= self.expires_at
+
+    def check(self, phase: str):
+        """:raises DeadlineExceeded: если срок уже истек"""
+        if self.expired:
+            raise DeadlineExceeded(phase, self.budget)
+
+    def child(self, seconds: float = None) -> "Deadline":
+        """Вложенный срок: seconds от текущего момента, но не позже собственного."""
+        child = Deadline(seconds, clock=self.clock)
+        if self.expires_at is not None and (child.expires_at is None or child.expires_at > self.expires_at):
+            child.expires_at = self.expires_at
+        return child
+
+
+class DeadlineCounters:
+    """Потокобезопасные счетчики таймаутов по фазам и пропусков по бюджету цикла."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timeouts = {}
+            self.skipped = 0
+            self.cycles = 0
+            self.cycles_over_budget = 0
+
+    def record_timeout(self, phase: str):
+        with self._lock:
+            self.timeouts[phase] = self.timeouts.get(phase, 0) + 1
+
+    def record_cycle(self, skipped: int):
+        with self._lock:
+            self.cycles += 1
+            self.skipped += skipped
+            if skipped:
+                self.cycles_over_budget += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "timeouts": sum(self.timeouts.values()),
+                "timeouts_by_phase": dict(self.timeouts),
+                "skipped": self.skipped,
+                "cycles": self.cycles,
+                "cycles_over_budget": self.cycles_over_budget,
+            }
+
+
+# Глобальные счетчики процесса
+deadline_stats = DeadlineCounters()
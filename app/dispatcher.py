@@ -0,0 +1,285 @@
+"""
+Диспетчер периодических проверок на одной очереди с приоритетом по времени.
+Вместо отдельной задачи APScheduler на каждый сайт хранится куча
+(next_due, site_id) и словарь расписаний: память — O(число сайтов) кортежей,
+а один поток-диспетчер отдает наступившие проверки в ограниченный пул
+воркеров. Отставание (lag), глубина очереди и пропуски (misfires) считаются
+явно, а не теряются молча, как при переполнении пула APScheduler.
+Внеочередные проверки (run_now, например ручные из app.check_queue)
+отдаются воркерам раньше любых наступивших плановых.
+При остановке новые проверки не запускаются, а уже запущенные дорабатывают
+(drain), чтобы их результат и next_check_at успели записаться в БД.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import os
+import threading
+import time
+
+# Размер пула воркеров и допустимое опоздание запуска (из .env или по умолчанию)
+DISPATCHER_MAX_WORKERS = int(os.getenv("DISPATCHER_MAX_WORKERS", "20"))
+DISPATCHER_MISFIRE_GRACE = float(os.getenv("DISPATCHER_MISFIRE_GRACE", "60"))
+# Сколько секунд при остановке ждать завершения уже запущенных проверок
+DISPATCHER_DRAIN_TIMEOUT = float(os.getenv("DISPATCHER_DRAIN_TIMEOUT", "30"))
+
+
+class DueQueueDispatcher:
+    """
+    Планировщик проверок сайтов: куча (next_due, site_id) + пул воркеров.
+    Проверка одного сайта никогда не выполняется параллельно сама с собой;
+    следующий запуск назначается после завершения: max(due + interval, сейчас).
+    """
+    def __init__(self, run_check, max_workers: int = DISPATCHER_MAX_WORKERS, misfire_grace: float = DISPATCHER_MISFIRE_GRACE, clock=time.monotonic):
+        """
+        :param run_check: функция run_check(site_id), выполняемая в воркере
+        :param max_workers: максимальное количество одновременных проверок
+        :param misfire_grace: опоздание запуска (секунды), после которого он считается пропуском
+        :param clock: источник монотонного времени (для тестов)
+        """
+        self.run_check = run_check
+        self.max_workers = max_workers
+        self.misfire_grace = misfire_grace
+        self.clock = clock
+        self._heap = []
+        # site_id -> (next_due, interval_sec); записи кучи, не совпадающие со словарем, устарели
+        self._schedule = {}
+        self._in_flight = set()
+        # site_id -> due наступивших проверок, ждущих воркера (в порядке наступления);
+        # их число — queue_depth в stats() без обхода кучи
+        self._ready = {}
+        # (site_id, call) внеочередных проверок в порядке поступления
+        self._urgent = deque()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._running = False
+        self.dispatched = 0
+        self.urgent_dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.misfires = 0
+        self.lag_max = 0.0
+        self.lag_last = 0.0
+        self._lag_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def schedule(self, site_id: int, interval_sec: float, next_due: float = None):
+        """
+        Добавляет сайт или меняет его расписание.
+        :param site_id: ID сайта
+        :param interval_sec: интервал проверки (секунды)
+        :param next_due: время следующей проверки по clock (по умолчанию сейчас + интервал)
+        """
+        due = self.clock() + interval_sec if next_due is None else next_due
+        with self._cond:
+            self._schedule[site_id] = (due, interval_sec)
+            self._ready.pop(site_id, None)
+            if site_id not in self._in_flight:
+                heapq.heappush(self._heap, (due, site_id))
+            self._cond.notify()
+
+    def defer(self, site_id: int, delay: float):
+        """
+        Переносит следующую проверку сайта на delay секунд от текущего момента
+        (интервал сохраняется). Для незапланированного сайта ничего не делает.
+        """
+        with self._cond:
+            entry = self._schedule.get(site_id)
+            if entry is None:
+                return
+            due = self.clock() + max(0.0, delay)
+            self._schedule[site_id] = (due, entry[1])
+            self._ready.pop(site_id, None)
+            if site_id not in self._in_flight:
+                heapq.heappush(self._heap, (due, site_id))
+            self._cond.notify()
+
+    def run_now(self, site_id: int, call):
+        """
+        Ставит внеочередную проверку сайта: call() выполняется в воркере раньше
+        плановых проверок, но не параллельно с идущей проверкой того же сайта.
+        Плановое расписание сайта не меняется.
+        """
+        with self._cond:
+            self._urgent.append((site_id, call))
+            self._cond.notify()
+
+    def entry(self, site_id: int):
+        """:return: (next_due, interval_sec) сайта или None, если он не запланирован"""
+        with self._cond:
+            return self._schedule.get(site_id)
+
+    def remove(self, site_id: int):
+        """Убирает сайт из расписания (запись в куче отбрасывается лениво)."""
+        with self._cond:
+            self._schedule.pop(site_id, None)
+            self._ready.pop(site_id, None)
+
+    def start(self):
+        """Запускает поток-диспетчер и пул воркеров."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="site-check")
+            self._thread = threading.Thread(target=self._loop, name="due-queue-dispatcher", daemon=True)
+            self._thread.start()
+
+    def shutdown(self, wait: bool = True, timeout: float = None):
+        """
+        Останавливает диспетчер: новые проверки не запускаются.
+        :param wait: дождаться завершения проверок, уже отданных воркерам
+        :param timeout: сколько ждать их, секунд (по умолчанию DISPATCHER_DRAIN_TIMEOUT)
+        :return: сколько проверок не завершилось за timeout
+        """
+        with self._cond:
+            if not self._running:
+                return 0
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+        unfinished = 0
+        if wait:
+            timeout = DISPATCHER_DRAIN_TIMEOUT if timeout is None else timeout
+            with self._cond:
+                draining = len(self._in_flight)
+                self._cond.wait_for(lambda: not self._in_flight, timeout)
+                unfinished = len(self._in_flight)
+            if draining:
+                print(f"[dispatcher] Drain: {draining - unfinished} из {draining} проверок завершены"
+                      + (f", {unfinished} не успели за {timeout:.0f}s" if unfinished else ""))
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return unfinished
+
+    def _pop_urgent(self):
+        """Снимает первую внеочередную проверку сайта, который сейчас не проверяется."""
+        for index, (site_id, call) in enumerate(self._urgent):
+            if site_id not in self._in_flight:
+                del self._urgent[index]
+                return site_id, call
+        return None
+
+    def _promote(self, now: float):
+        """Переносит наступившие актуальные записи кучи в _ready (устаревшие отбрасываются)."""
+        while self._heap:
+            due, site_id = self._heap[0]
+            entry = self._schedule.get(site_id)
+            if entry is None or entry[0] != due or site_id in self._in_flight:
+                heapq.heappop(self._heap)  # устаревшая запись
+                continue
+            if due > now:
+                return
+            heapq.heappop(self._heap)
+            self._ready[site_id] = due
+
+    def _pop_due(self, now: float):
+        """Снимает самую раннюю наступившую проверку или возвращает None."""
+        self._promote(now)
+        if not self._ready:
+            return None
+        site_id = next(iter(self._ready))
+        return self._ready.pop(site_id), site_id
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    if len(self._in_flight) < self.max_workers:
+                        urgent = self._pop_urgent()
+                        if urgent is not None:
+                            break
+                        now = self.clock()
+                        item = self._pop_due(now)
+                        if item is not None:
+                            break
+                    else:
+                        # Ждем освобождения воркера, но наступающие проверки учитываем в очереди
+                        now = self.clock()
+                        self._promote(now)
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                if urgent is not None:
+                    site_id, call = urgent
+                    # Плановая запись вернется в кучу после проверки (_run_urgent)
+                    self._ready.pop(site_id, None)
+                    self._in_flight.add(site_id)
+                    self.urgent_dispatched += 1
+                    self._executor.submit(self._run_urgent, site_id, call)
+                    continue
+                due, site_id = item
+                lag = max(0.0, now - due)
+                self.lag_last = lag
+                self.lag_max = max(self.lag_max, lag)
+                self._lag_total += lag
+                if lag > self.misfire_grace:
+                    self.misfires += 1
+                    print(f"[dispatcher] Misfire: site.id={site_id} запущен с опозданием {lag:.1f}s")
+                self._in_flight.add(site_id)
+                self.dispatched += 1
+            self._executor.submit(self._run, site_id, due)
+
+    def _run(self, site_id: int, due: float):
+        try:
+            self.run_check(site_id)
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            print(f"[dispatcher] Ошибка проверки site.id={site_id}: {e}")
+        finally:
+            with self._cond:
+                self._in_flight.discard(site_id)
+                self.completed += 1
+                entry = self._schedule.get(site_id)
+                if entry is not None:
+                    scheduled_due, interval = entry
+                    # Если расписание изменили во время проверки — берем новое
+                    next_due = scheduled_due if scheduled_due != due else max(due + interval, self.clock())
+                    self._schedule[site_id] = (next_due, interval)
+                    heapq.heappush(self._heap, (next_due, site_id))
+                self._cond.notify()
+
+    def _run_urgent(self, site_id: int, call):
+        try:
+            call()
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            print(f"[dispatcher] Ошибка внеочередной проверки site.id={site_id}: {e}")
+        finally:
+            with self._cond:
+                self._in_flight.discard(site_id)
+                self.completed += 1
+                # Запись кучи, снятая как устаревшая на время проверки, возвращается
+                entry = self._schedule.get(site_id)
+                if entry is not None:
+                    heapq.heappush(self._heap, (entry[0], site_id))
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        """
+        Метрики: sites, queue_depth (наступившие, но не запущенные проверки),
+        urgent (ждущие внеочередные), in_flight, dispatched, completed, failed, misfires, lag_* (секунды).
+        """
+        with self._cond:
+            self._promote(self.clock())
+            return {
+                "sites": len(self._schedule),
+                "queue_depth": len(self._ready),
+                "urgent": len(self._urgent),
+                "in_flight": len(self._in_flight),
+                "max_workers": self.max_workers,
+                "dispatched": self.dispatched,
+                "urgent_dispatched": self.urgent_dispatched,
+                "completed": self.completed,
+                "failed": self.failed,
+                "misfires": self.misfires,
+                "lag_last": round(self.lag_last, 3),
+                "lag_max": round(self.lag_max, 3),
+                "lag_avg": round(self._lag_total / self.dispatched, 3) if self.dispatched else 0.0,
+            }
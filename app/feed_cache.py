@@ -0,0 +1,119 @@
+"""
+Кеш отрендеренных RSS/Atom фидов.
+Ключ — (site_id, формат, лимит элементов). Кеш ограничен по числу записей
+и по суммарному размеру (LRU) и сбрасывается для сайта, когда check_site
+добавляет новые посты или сайт редактируется через API.
+Запись хранится вместе с валидатором (ETag фида из БД): проверки в другом
+процессе (worker, несколько uvicorn-воркеров) не сбрасывают этот кеш,
+поэтому запись с другим ETag считается промахом.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+# Ограничения кеша (из .env или по умолчанию)
+FEED_CACHE_MAX_ENTRIES = int(os.getenv("FEED_CACHE_MAX_ENTRIES", "512"))
+FEED_CACHE_MAX_BYTES = int(os.getenv("FEED_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class FeedCache:
+    """
+    Потокобезопасный LRU-кеш отрендеренных фидов с метриками попаданий.
+    """
+    def __init__(self, max_entries: int = FEED_CACHE_MAX_ENTRIES, max_bytes: int = FEED_CACHE_MAX_BYTES):
+        """
+        :param max_entries: Максимальное количество фидов в кеше
+        :param max_bytes: Максимальный суммарный размер фидов (байты UTF-8)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    @staticmethod
+    def make_key(site_id: int, fmt: str, limit: int = None) -> tuple:
+        return (site_id, fmt, limit)
+
+    def get(self, key, validator: str = None):
+        """
+        Возвращает отрендеренный фид или None (учитывается как hit/miss).
+        :param validator: текущий ETag фида; запись с другим валидатором устарела и удаляется
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] != validator:
+                del self._entries[key]
+                self._bytes -= entry[1]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value: str, validator: str = None):
+        """
+        Кладет фид в кеш, вытесняя самые старые записи при превышении лимитов.
+        Фиды больше max_bytes не кешируются.
+        :param validator: ETag, по которому фид был отрендерен
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, validator)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate_site(self, site_id: int):
+        """
+        Удаляет из кеша все фиды сайта (все форматы и лимиты).
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == site_id]
+            for key in keys:
+                _, size, _ = self._entries.pop(key)
+                self._bytes -= size
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Метрики кеша: hits, misses, hit_ratio, evictions, invalidations, stale, entries, bytes.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Общий кеш фидов процесса
+feed_cache = FeedCache()
@@ -0,0 +1,244 @@
+"""
+Загрузка постов напрямую из RSS/Atom-лент сайтов.
+Если сайт публикует ленту (<link rel="alternate" type="application/rss+xml">
+на странице или feed_url в настройках), check_site загружает ее вместо HTML:
+лента разбирается потоковым XML-парсером (XMLPullParser) в строки Post
+с настоящими датами публикации, без дерева страницы и CSS-селекторов.
+Разбор HTML остается запасным путем (Site.ingest_mode, Site.active_ingest).
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+import os
+import re
+from urllib.parse import urljoin
+import xml.etree.ElementTree as ET
+
+from app.known_posts import INCREMENTAL_STOP_AFTER
+from app.scraper import compute_content_hash
+
+# Режимы загрузки сайта (Site.ingest_mode): auto — лента, если она настроена
+# или найдена на странице, иначе HTML; feed — только лента; html — только селекторы
+INGEST_AUTO = "auto"
+INGEST_FEED = "feed"
+INGEST_HTML = "html"
+INGEST_MODES = (INGEST_AUTO, INGEST_FEED, INGEST_HTML)
+# 1 — искать ленту на страницах сайтов в режиме auto. По умолчанию выключено:
+# лента всего сайта в <head> может не совпадать с разделом, заданным селекторами
+FEED_DISCOVERY = os.getenv("FEED_DISCOVERY", "0") == "1"
+
+FEED_TYPES = ("application/rss+xml", "application/atom+xml", "application/rdf+xml")
+FEED_ROOTS = ("rss", "feed", "RDF")
+# Размер порции текста, подаваемой потоковому парсеру
+FEED_CHUNK_SIZE = 64 * 1024
+
+_BODY_RE = re.compile(r"<body[\s>]", re.IGNORECASE)
+_FEED_START_RE = re.compile(r"^\s*(<\?xml[^>]*>\s*)?(<!--.*?-->\s*)*<(rss|feed|rdf:RDF)[\s>]", re.DOTALL)
+
+
+class FeedParseError(ValueError):
+    """Ответ не является корректной RSS/Atom-лентой."""
+
+
+def uses_feed(site) -> bool:
+    """Проверка сайта загружает ленту (feed_url), а не HTML-страницу."""
+    mode = getattr(site, 'ingest_mode', None) or INGEST_AUTO
+    if mode == INGEST_HTML or not getattr(site, 'feed_url', None):
+        return False
+    return mode == INGEST_FEED or getattr(site, 'active_ingest', None) != INGEST_HTML
+
+
+def ingest_url(site) -> str:
+    """URL, который загружает проверка сайта."""
+    return site.feed_url if uses_feed(site) else site.url
+
+
+def can_discover(site) -> bool:
+    """
+    На странице сайта стоит искать ленту: лента еще не известна, режим feed
+    или auto, и в режиме auto поиск еще не завершался неудачей
+    (тогда active_ingest="html" до смены настроек сайта).
+    """
+    mode = getattr(site, 'ingest_mode', None) or INGEST_AUTO
+    if mode == INGEST_HTML or getattr(site, 'feed_url', None):
+        return False
+    if mode == INGEST_FEED:
+        return True
+    return FEED_DISCOVERY and getattr(site, 'active_ingest', None) is None
+
+
+def feed_response(site, fetched) -> bool:
+    """
+    Ответ проверки обрабатывается путем ленты: это лента сайта или на HTML-странице
+    без известной ленты нашлась ссылка на ленту (иначе ответ можно разбирать как HTML).
+    """
+    if uses_feed(site):
+        return True
+    return can_discover(site) and discover_feed_url(fetched.text, site.url) is not None
+
+
+def drop_stored_urls(db_session, site_id: int, posts) -> list:
+    """
+    Убирает записи ленты, чьи ссылки уже есть среди постов сайта. Хеш записи
+    ленты строится по guid / id, а у постов из HTML — по заголовку, описанию
+    и ссылке, поэтому при переходе сайта на ленту дедупликация по content_hash
+    не узнает уже собранные посты.
+    """
+    from app.models import Post
+    urls = {post["url"] for post in posts if post.get("url")}
+    if not urls:
+        return list(posts)
+    stored = {
+        url for (url,) in db_session.query(Post.url).filter(Post.site_id == site_id, Post.url.in_(list(urls)))
+    }
+    return [post for post in posts if post.get("url") not in stored]
+
+
+def reset_validators(site):
+    """Сбрасывает валидаторы условного GET и хеш тела при смене загружаемого URL."""
+    site.etag = None
+    site.last_modified = None
+    site.content_digest = None
+
+
+def looks_like_feed(text) -> bool:
+    """Тело ответа начинается с корня RSS/Atom (сам URL сайта — лента)."""
+    return bool(text) and _FEED_START_RE.match(text[:4096].lstrip("﻿")) is not None
+
+
+class _FeedLinkFinder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "link":
+            return
+        attrs = {name: (value or "") for name, value in attrs}
+        rel = attrs.get("rel", "").lower().split()
+        if "alternate" in rel and attrs.get("type", "").lower() in FEED_TYPES and attrs.get("href"):
+            self.links.append(attrs["href"].strip())
+
+
+def discover_feed_url(html, base_url: str = None):
+    """
+    Ищет ленту сайта в <head> страницы (<link rel="alternate" type="application/rss+xml">).
+    Если сама страница — лента, возвращает base_url.
+    :return: абсолютный URL ленты или None
+    """
+    if not html:
+        return None
+    if looks_like_feed(html):
+        return base_url
+    body = _BODY_RE.search(html)
+    finder = _FeedLinkFinder()
+    finder.feed(html[:body.start()] if body else html[:FEED_CHUNK_SIZE])
+    if not finder.links:
+        return None
+    return urljoin(base_url, finder.links[0]) if base_url else finder.links[0]
+
+
+def parse_feed_date(value):
+    """
+    Дата из RFC 822 (RSS pubDate) или ISO 8601 (Atom, dc:date).
+    :return: naive UTC datetime или None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _text(elem):
+    value = "".join(elem.itertext()).strip()
+    return value or None
+
+
+def _entry_post(elem, base_url: str = None):
+    """Пост из <item> (RSS) или <entry> (Atom); None, если нет ни заголовка, ни ссылки."""
+    fields = {}
+    link = None
+    for child in elem:
+        name = _local(child.tag)
+        if name == "link":
+            href = child.get("href")
+            if href is None:
+                link = link or _text(child)
+            elif child.get("rel", "alternate") == "alternate" and link is None:
+                link = href.strip()
+        elif name not in fields:
+            fields[name] = _text(child)
+    url = urljoin(base_url, link) if base_url and link else link
+    title = fields.get("title")
+    description = fields.get("description") or fields.get("summary") or fields.get("encoded") or fields.get("content")
+    if not title and not url:
+        return None
+    identity = fields.get("guid") or fields.get("id") or url
+    return {
+        "title": title or url,
+        "description": description,
+        "url": url,
+        # Идентичность записи ленты — guid / id / ссылка: правка текста не дает дубликата
+        "content_hash": compute_content_hash(None, None, identity) if identity else compute_content_hash(title, description, url),
+        "pub_date": parse_feed_date(fields.get("pubDate") or fields.get("published") or fields.get("date") or fields.get("updated")),
+    }
+
+
+def iter_feed_posts(text, base_url: str = None, known_hashes=None, stop_after: int = INCREMENTAL_STOP_AFTER):
+    """
+    Потоково разбирает RSS 2.0 / RSS 1.0 / Atom (str или сырые байты — тогда
+    кодировку задает XML-объявление) и отдает посты по одному
+    (словари как у WebScraper.extract_posts плюс pub_date). Разобранные
+    записи сразу освобождаются; с known_hashes обход прекращается после
+    stop_after известных записей подряд, остаток документа не разбирается.
+    :raises FeedParseError: не XML или корень не rss / feed / rdf:RDF
+    """
+    if not text:
+        raise FeedParseError("Empty feed")
+    parser = ET.XMLPullParser(events=("start", "end"))
+    incremental = bool(known_hashes) and stop_after > 0
+    known_run = 0
+    root = None
+    for offset in range(0, len(text), FEED_CHUNK_SIZE):
+        try:
+            parser.feed(text[offset:offset + FEED_CHUNK_SIZE])
+            events = list(parser.read_events())
+        except ET.ParseError as e:
+            raise FeedParseError(f"Invalid feed XML: {e}") from e
+        for event, elem in events:
+            name = _local(elem.tag)
+            if root is None:
+                root = name
+                if root not in FEED_ROOTS:
+                    raise FeedParseError(f"Not a feed: <{root}>")
+                continue
+            if event != "end" or name not in ("item", "entry"):
+                continue
+            post = _entry_post(elem, base_url)
+            elem.clear()
+            if post is None:
+                continue
+            yield post
+            if incremental:
+                known_run = known_run + 1 if post["content_hash"] in known_hashes else 0
+                if known_run >= stop_after:
+                    return
+    try:
+        parser.close()
+    except ET.ParseError as e:
+        raise FeedParseError(f"Invalid feed XML: {e}") from e
+    if root is None:
+        raise FeedParseError("Empty feed")
@@ -0,0 +1,136 @@
+"""
+Потоковая генерация RSS 2.0 / Atom фидов.
+В отличие от RSSGenerator (feedgen + lxml) документ не строится в памяти:
+экранированные XML-фрагменты отдаются по одному элементу прямо из итератора
+постов, поэтому их можно сразу передавать в StreamingResponse.
+Вывод побайтно совпадает с feedgen (pretty=True и pretty=False) для полей,
+которые использует роутер фидов.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from feedgen.version import version_str as FEEDGEN_VERSION
+
+RSS_NAMESPACES = 'xmlns:atom="http://www.w3.org/2005/Atom" xmlns:content="http://purl.org/rss/1.0/modules/content/"'
+RSS_DOCS = "http://www.rssboard.org/rss-specification"
+GENERATOR = "python-feedgen"
+GENERATOR_URI = "https://lkiesow.github.io/python-feedgen"
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+
+def escape_text(value) -> str:
+    """Экранирует текст элемента так же, как lxml."""
+    return (str(value).replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace("\r", "&#13;"))
+
+
+def escape_attr(value) -> str:
+    """Экранирует значение атрибута так же, как lxml."""
+    return (escape_text(value).replace('"', "&quot;").replace("\n", "&#10;")
+            .replace("\t", "&#9;"))
+
+
+def _utc(dt):
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def format_rfc2822(dt) -> str:
+    """Дата в формате RFC 2822, как feedgen.util.formatRFC2822."""
+    return format_datetime(_utc(dt))
+
+
+class StreamingFeedWriter:
+    """
+    Потоковый сериализатор RSS 2.0 / Atom.
+    Элементы — словари с ключами title, link, description, guid, pubdate
+    (как у RSSGenerator.add_item) в порядке вывода (новые первыми).
+    """
+
+    def __init__(self, title: str, link: str, description: str, pretty: bool = True):
+        """
+        :param title: Заголовок фида
+        :param link: Ссылка на сайт (также id Atom-фида)
+        :param description: Описание фида
+        :param pretty: Форматировать с отступами (как feedgen pretty=True) или компактно
+        """
+        self.title = title
+        self.link = link
+        self.description = description
+        self.pretty = pretty
+
+    def _line(self, depth: int, xml: str) -> str:
+        if self.pretty:
+            return "  " * depth + xml + "\n"
+        return xml
+
+    def iter_rss(self, items, now: datetime = None):
+        """
+        Генерирует RSS 2.0 по частям.
+        :param items: итерируемое элементов фида
+        :param now: время сборки (lastBuildDate), по умолчанию текущее
+        :return: генератор строк
+        """
+        now = now or datetime.now(timezone.utc)
+        line = self._line
+        yield XML_DECLARATION + line(0, f'<rss {RSS_NAMESPACES} version="2.0">') + line(1, "<channel>") + \
+            line(2, f"<title>{escape_text(self.title)}</title>") + \
+            line(2, f"<link>{escape_text(self.link)}</link>") + \
+            line(2, f"<description>{escape_text(self.description)}</description>") + \
+            line(2, f"<docs>{RSS_DOCS}</docs>") + \
+            line(2, f"<generator>{GENERATOR}</generator>") + \
+            line(2, f"<lastBuildDate>{format_rfc2822(now)}</lastBuildDate>")
+        for item in items:
+            link = str(item["link"])
+            parts = [line(2, "<item>"), line(3, f"<title>{escape_text(item['title'])}</title>"),
+                     line(3, f"<link>{escape_text(link)}</link>")]
+            if item.get("description"):
+                parts.append(line(3, f"<description>{escape_text(item['description'])}</description>"))
+            parts.append(line(3, f'<guid isPermaLink="true">{escape_text(item.get("guid") or link)}</guid>'))
+            if item.get("pubdate"):
+                parts.append(line(3, f"<pubDate>{format_rfc2822(item['pubdate'])}</pubDate>"))
+            parts.append(line(2, "</item>"))
+            yield "".join(parts)
+        yield line(1, "</channel>") + ("</rss>\n" if self.pretty else "</rss>")
+
+    def iter_atom(self, items, now: datetime = None):
+        """
+        Генерирует Atom по частям.
+        :param items: итерируемое элементов фида
+        :param now: время обновления (updated фида и записей), по умолчанию текущее
+        :return: генератор строк
+        """
+        now = now or datetime.now(timezone.utc)
+        updated = now.isoformat()
+        line = self._line
+        yield XML_DECLARATION + line(0, '<feed xmlns="http://www.w3.org/2005/Atom">') + \
+            line(1, f"<id>{escape_text(self.link)}</id>") + \
+            line(1, f"<title>{escape_text(self.title)}</title>") + \
+            line(1, f"<updated>{updated}</updated>") + \
+            line(1, f'<link href="{escape_attr(self.link)}" rel="alternate"/>') + \
+            line(1, f'<generator uri="{GENERATOR_URI}" version="{FEEDGEN_VERSION}">{GENERATOR}</generator>') + \
+            line(1, f"<subtitle>{escape_text(self.description)}</subtitle>")
+        for item in items:
+            link = str(item["link"])
+            parts = [line(1, "<entry>"), line(2, f"<id>{escape_text(item.get('guid') or link)}</id>"),
+                     line(2, f"<title>{escape_text(item['title'])}</title>"),
+                     line(2, f"<updated>{updated}</updated>")]
+            if item.get("description"):
+                parts.append(line(2, f"<content>{escape_text(item['description'])}</content>"))
+            parts.append(line(2, f'<link href="{escape_attr(link)}"/>'))
+            if item.get("pubdate"):
+                parts.append(line(2, f"<published>{_utc(item['pubdate']).isoformat()}</published>"))
+            parts.append(line(1, "</entry>"))
+            yield "".join(parts)
+        yield "</feed>\n" if self.pretty else "</feed>"
+
+    def render(self, items, fmt: str = "rss", now: datetime = None) -> str:
+        """
+        Собирает фид целиком в строку (для кеша и тестов).
+        :param fmt: "rss" или "atom"
+        """
+        chunks = self.iter_rss(items, now) if fmt == "rss" else self.iter_atom(items, now)
+        return "".join(chunks)
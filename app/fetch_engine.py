@@ -0,0 +1,375 @@
+"""
+Асинхронный движок загрузки страниц для RSSify.
+Все запросы выполняются в одном долгоживущем event loop через общий
+httpx.AsyncClient (пул соединений, keep-alive, опционально HTTP/2)
+с общим лимитом параллельности и отдельным лимитом на каждый хост.
+Перед запросом HostGuard выдерживает паузу по token bucket хоста и сразу
+отклоняет запросы к хостам с разомкнутой цепью (app.host_guard).
+Сроки (timeout на запрос, deadline на весь прогон) отменяют корутину
+загрузки в event loop — соединение закрывается, а не висит в фоне.
+Тело читается потоком (gzip / brotli / zstd распаковываются по мере чтения)
+с лимитом размера: огромная или бесконечная страница обрывается, как только
+лимит превышен. Кодировка определяется по заголовку / BOM / <meta> / XML-объявлению,
+без статистического угадывания по всему телу; сырые байты отдаются разбору.
+"""
+
+import asyncio
+import codecs
+import concurrent.futures
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.deadline import DeadlineExceeded
+from app.host_guard import CircuitOpenError, HostGuard
+
+try:
+    import h2  # noqa: F401  (нужен httpx для HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Сжатия, которые httpx распакует: brotli и zstd — если установлены пакеты
+ACCEPT_ENCODINGS = ["gzip", "deflate"]
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODINGS.append("br")
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODINGS.append("br")
+    except ImportError:
+        pass
+try:
+    import zstandard  # noqa: F401
+    ACCEPT_ENCODINGS.append("zstd")
+except ImportError:
+    pass
+ACCEPT_ENCODING = ", ".join(ACCEPT_ENCODINGS)
+
+# Лимит размера распакованного тела страницы по умолчанию, байт (0 — без лимита);
+# для сайта переопределяется Site.max_page_size
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+# Сколько начальных байт тела просматривать в поисках <meta charset> / <?xml encoding?>
+CHARSET_SNIFF_BYTES = 4096
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([-\w.:]+)""", re.IGNORECASE)
+_XML_ENCODING_RE = re.compile(rb"""^\s*<\?xml[^>]*\sencoding\s*=\s*["']([-\w.:]+)["']""")
+_BOMS = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+class ResponseTooLarge(Exception):
+    """Тело ответа больше лимита: загрузка прервана."""
+    def __init__(self, url: str, limit: int, size: int = None):
+        self.url = url
+        self.limit = limit
+        self.size = size
+        detail = f"declared {size} bytes" if size is not None else "read"
+        super().__init__(f"Response body exceeds limit of {limit} bytes ({detail}): {url}")
+
+
+def _codec(name):
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.decode("ascii", "ignore") if isinstance(name, bytes) else name).name
+    except LookupError:
+        return None
+
+
+def sniff_charset(content_type: str = None, content: bytes = None) -> str:
+    """
+    Кодировка тела без угадывания: BOM, charset из Content-Type,
+    <meta charset> / http-equiv или encoding XML-объявления в начале тела.
+    :return: имя кодека Python (по умолчанию utf-8)
+    """
+    head = (content or b"")[:CHARSET_SNIFF_BYTES]
+    for bom, name in _BOMS:
+        if head.startswith(bom):
+            return name
+    if content_type:
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "charset":
+                found = _codec(value.strip().strip('"\''))
+                if found:
+                    return found
+    match = _XML_ENCODING_RE.match(head) or _CHARSET_RE.search(head)
+    return (_codec(match.group(1)) if match else None) or "utf-8"
+
+
+class FetchResult:
+    """
+    Результат загрузки одной страницы.
+    key: ключ, переданный вызывающим кодом (например, site.id)
+    url: запрошенный URL
+    status_code: HTTP-статус ответа (None при сетевой ошибке)
+    text: тело ответа строкой (None при ошибке и при 304 Not Modified);
+          для загруженных страниц декодируется из content лениво, при первом обращении
+    content: сырые (распакованные) байты тела
+    encoding: кодировка content по sniff_charset
+    headers: заголовки ответа
+    error: исключение, если загрузка не удалась
+    elapsed: время загрузки в секундах
+    """
+    def __init__(self, key, url, status_code=None, text=None, headers=None, error=None, elapsed=0.0,
+                 content: bytes = None, encoding: str = None):
+        self.key = key
+        self.url = url
+        self.status_code = status_code
+        self._text = text
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers or {}
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def text(self):
+        if self._text is None and self.content is not None:
+            self._text = self.content.decode(self.encoding or "utf-8", errors="replace")
+        return self._text
+
+    @property
+    def markup(self):
+        """Тело для разбора: сырые байты (разбираются в кодировке encoding) или текст."""
+        return self.content if self.content is not None else self._text
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+def is_host_failure(error: httpx.HTTPError) -> bool:
+    """
+    Ошибка хоста (таймаут, соединение, 5xx, 429), а не конкретной страницы (404 и т.п.).
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return True
+
+
+class AsyncFetchEngine:
+    """
+    Параллельная загрузка страниц в одном event loop.
+    Event loop и httpx.AsyncClient живут в отдельном потоке от первого запроса
+    до close(), поэтому соединения к хостам переиспользуются между проверками.
+    Результаты отдаются вызывающему потоку — разбор HTML и запись в БД
+    не блокируют loop.
+    """
+    def __init__(self, user_agent: str, timeout: int = 10, max_concurrency: int = 50, per_host_concurrency: int = 4,
+                 max_connections: int = 200, max_keepalive_connections: int = 100, keepalive_expiry: float = 60.0,
+                 http2: bool = False, transport=None, host_guard: HostGuard = None, max_bytes: int = FETCH_MAX_BYTES):
+        """
+        :param user_agent: User-Agent для HTTP-запросов
+        :param timeout: Таймаут для запросов (секунды)
+        :param max_concurrency: Общий лимит одновременных запросов
+        :param per_host_concurrency: Лимит одновременных запросов к одному хосту
+        :param max_connections: Размер пула соединений (на все хосты)
+        :param max_keepalive_connections: Сколько простаивающих соединений держать открытыми
+        :param keepalive_expiry: Через сколько секунд простоя закрывать keep-alive соединение
+        :param http2: Включить HTTP/2 (требует пакет h2)
+        :param transport: Опциональный httpx-транспорт (для тестов)
+        :param host_guard: Лимитер и circuit breaker по хостам (по умолчанию HostGuard с настройками из .env)
+        :param max_bytes: Лимит размера распакованного тела по умолчанию (0 — без лимита)
+        """
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not HTTP2_AVAILABLE:
+            print("[AsyncFetchEngine] HTTP/2 запрошен, но пакет h2 не установлен — используется HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.transport = transport
+        self.host_guard = host_guard if host_guard is not None else HostGuard()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._global_limit = None
+        self._host_limits = {}
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self):
+        """Запускает event loop и открывает HTTP-клиент (идемпотентно)."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="fetch-engine", daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self._loop, self._thread = loop, thread
+
+    def close(self):
+        """Закрывает HTTP-клиент со всеми соединениями и останавливает event loop."""
+        with self._lock:
+            if self._loop is None:
+                return
+            loop, thread = self._loop, self._thread
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            self._loop = self._thread = self._client = None
+            self._host_limits = {}
+
+    def fetch(self, url: str, key=None, headers: dict = None, timeout: float = None, max_bytes: int = None) -> FetchResult:
+        """
+        Загружает одну страницу (блокирующий вызов).
+        :param url: URL страницы
+        :param key: ключ, который попадет в FetchResult.key
+        :param headers: дополнительные заголовки запроса (например, If-None-Match)
+        :param timeout: срок запроса в секундах с момента отправки (None — только self.timeout);
+                        по истечении запрос отменяется, error — DeadlineExceeded("fetch")
+        :param max_bytes: лимит размера тела (None — self.max_bytes, 0 — без лимита);
+                          при превышении error — ResponseTooLarge
+        :return: FetchResult
+        """
+        return self._submit(self._fetch(key, url, headers, timeout, max_bytes=max_bytes)).result()
+
+    def fetch_many(self, targets, timeout: float = None, deadline=None):
+        """
+        Загружает страницы параллельно и отдает результаты по мере завершения.
+        :param targets: итерируемое кортежей (key, url), (key, url, headers) или (key, url, headers, max_bytes)
+        :param timeout: срок каждого запроса в секундах с момента отправки
+        :param deadline: общий срок (app.deadline.Deadline), включая ожидание в очереди лимитов;
+                         незавершенные к нему загрузки отменяются с DeadlineExceeded("cycle")
+        :return: генератор FetchResult в порядке завершения загрузок
+        """
+        futures = []
+        for target in targets:
+            key, url, headers, max_bytes = self._target(target)
+            futures.append(self._submit(self._fetch(key, url, headers, timeout, deadline, max_bytes)))
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+    @staticmethod
+    def _target(target):
+        key, url, *rest = target
+        rest += [None] * (2 - len(rest))
+        return key, url, rest[0], rest[1]
+
+    def _submit(self, coro):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            headers={"User-Agent": self.user_agent, "Accept-Encoding": ACCEPT_ENCODING},
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=self.limits,
+            http2=self.http2,
+            transport=self.transport,
+        )
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits = {}
+
+    def _host_limit(self, host):
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    async def _fetch(self, key, url, headers=None, timeout=None, deadline=None, max_bytes=None):
+        budget = deadline.remaining() if deadline is not None else None
+        try:
+            return await asyncio.wait_for(self._request(key, url, headers, timeout, max_bytes), budget)
+        except asyncio.TimeoutError:
+            print(f"[AsyncFetchEngine] Отмена {url}: исчерпан общий срок")
+            return FetchResult(key, url, error=DeadlineExceeded("cycle", deadline.budget))
+
+    async def _request(self, key, url, headers=None, timeout=None, max_bytes=None):
+        # Ошибка одного URL (некорректный адрес и т.п.) не должна прерывать fetch_many
+        try:
+            host = urlsplit(url).netloc.lower()
+        except Exception as e:
+            print(f"[AsyncFetchEngine] Некорректный URL {url!r}: {e}")
+            return FetchResult(key, url, error=e)
+        try:
+            delay = self.host_guard.before_request(host)
+        except CircuitOpenError as e:
+            print(f"[AsyncFetchEngine] Пропуск {url}: {e}")
+            return FetchResult(key, url, error=e)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            async with self._global_limit, self._host_limit(host):
+                return await self._get(key, url, host, headers, timeout, max_bytes)
+        except asyncio.CancelledError:
+            self.host_guard.cancel(host)
+            raise
+        except Exception as e:
+            # Исход не учитывается: пробный запрос полуоткрытой цепи освобождается
+            print(f"[AsyncFetchEngine] Ошибка при запросе {url!r}: {e!r}")
+            self.host_guard.cancel(host)
+            return FetchResult(key, url, error=e)
+
+    async def _download(self, url, headers, limit):
+        """
+        Читает тело потоком (распакованным) и обрывает загрузку при превышении limit.
+        :return: (response, байты тела или None при 304)
+        """
+        async with self._client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return response, None
+            response.raise_for_status()
+            declared = response.headers.get("content-length", "")
+            if limit and declared.isdigit() and int(declared) > limit:
+                raise ResponseTooLarge(url, limit, int(declared))
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if limit and size > limit:
+                    raise ResponseTooLarge(url, limit)
+                chunks.append(chunk)
+            return response, b"".join(chunks)
+
+    async def _get(self, key, url, host, headers=None, timeout=None, max_bytes=None):
+        started = time.monotonic()
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        try:
+            response, content = await asyncio.wait_for(self._download(url, headers, limit), timeout)
+        except asyncio.TimeoutError:
+            print(f"[AsyncFetchEngine] Отмена {url}: срок {timeout:.1f}s истек")
+            self.host_guard.cancel(host)
+            return FetchResult(key, url, error=DeadlineExceeded("fetch", timeout), elapsed=time.monotonic() - started)
+        except ResponseTooLarge as e:
+            # Хост ответил — это проблема страницы, а не хоста
+            print(f"[AsyncFetchEngine] Загрузка прервана: {e}")
+            self.host_guard.record(host, ok=True)
+            return FetchResult(key, url, error=e, elapsed=time.monotonic() - started)
+        except httpx.HTTPError as e:
+            print(f"[AsyncFetchEngine] Ошибка при запросе {url}: {e}")
+            self.host_guard.record(host, ok=not is_host_failure(e), error=str(e))
+            return FetchResult(key, url, error=e, elapsed=time.monotonic() - started)
+        self.host_guard.record(host, ok=True)
+        return FetchResult(
+            key,
+            url,
+            status_code=response.status_code,
+            content=content,
+            encoding=None if content is None else sniff_charset(response.headers.get("content-type"), content),
+            headers=dict(response.headers),
+            elapsed=time.monotonic() - started,
+        )
@@ -0,0 +1,263 @@
+"""
+Вежливость и защита от неработающих хостов в слое загрузки.
+Для каждого хоста AsyncFetchEngine держит token bucket (не чаще rate
+запросов в секунду с запасом burst) и circuit breaker:
+closed → (failure_threshold ошибок подряд) → open → (reset_timeout) →
+half_open (один пробный запрос) → closed или снова open.
+Пока цепь разомкнута, запросы к хосту отклоняются сразу, без ожидания
+таймаута. Состояние цепей сохраняется в таблицу host_states
+(persist_host_states / restore_host_states).
+"""
+from datetime import datetime, timezone
+import os
+import threading
+import time
+
+# Параметры по умолчанию (из .env)
+HOST_RATE = float(os.getenv("HOST_RATE", "2"))                            # запросов в секунду на хост
+HOST_BURST = float(os.getenv("HOST_BURST", "4"))
+HOST_FAILURE_THRESHOLD = int(os.getenv("HOST_FAILURE_THRESHOLD", "5"))    # ошибок подряд до размыкания
+HOST_RESET_TIMEOUT = float(os.getenv("HOST_RESET_TIMEOUT", "300"))        # секунд до пробного запроса
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: цепь хоста разомкнута после серии ошибок."""
+    def __init__(self, host: str, retry_at: float):
+        self.host = host
+        self.retry_at = retry_at
+        super().__init__(f"Circuit open for host {host} (последние запросы завершились ошибкой)")
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: каждый запрос забирает токен, а при их
+    нехватке получает задержку, после которой его очередь наступит.
+    """
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def reserve(self) -> float:
+        """
+        Резервирует один запрос.
+        :return: сколько секунд подождать перед запросом (0 — сразу)
+        """
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker одного хоста. Время — wall clock, чтобы состояние
+    можно было сохранить в БД и восстановить в другом процессе.
+    """
+    def __init__(self, failure_threshold: int = HOST_FAILURE_THRESHOLD, reset_timeout: float = HOST_RESET_TIMEOUT, clock=time.time):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+
+    @property
+    def retry_at(self) -> float:
+        return (self.opened_at or 0) + self.reset_timeout
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос (в half_open — только один пробный)."""
+        if self.state == OPEN:
+            if self.clock() < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> bool:
+        """:return: True, если состояние изменилось"""
+        changed = self.state != CLOSED or self.failures != 0
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        return changed
+
+    def record_failure(self, error: str = None) -> bool:
+        """:return: True, если цепь разомкнулась"""
+        self.failures += 1
+        self.last_error = error
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = self.clock()
+            return True
+        return False
+
+
+class HostGuard:
+    """
+    Token bucket и circuit breaker по хостам. before_request / record
+    вызываются из event loop движка, pop_dirty / restore — из других потоков.
+    """
+    def __init__(self, rate: float = HOST_RATE, burst: float = HOST_BURST,
+                 failure_threshold: int = HOST_FAILURE_THRESHOLD, reset_timeout: float = HOST_RESET_TIMEOUT):
+        """
+        :param rate: запросов в секунду на хост (0 — без ограничения)
+        :param burst: сколько запросов подряд допускается без паузы
+        :param failure_threshold: ошибок подряд до размыкания цепи (0 — без circuit breaker)
+        :param reset_timeout: секунд до пробного запроса к хосту с разомкнутой цепью
+        """
+        self.rate = rate
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._buckets = {}
+        self._breakers = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.delayed = 0
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def before_request(self, host: str) -> float:
+        """
+        Проверяет цепь хоста и резервирует токен.
+        :return: задержка перед запросом в секундах
+        :raises CircuitOpenError: цепь разомкнута
+        """
+        with self._lock:
+            if self.failure_threshold > 0:
+                breaker = self._breaker(host)
+                if not breaker.allow():
+                    self.rejected += 1
+                    raise CircuitOpenError(host, breaker.retry_at)
+            if self.rate <= 0:
+                return 0.0
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            delay = bucket.reserve()
+            if delay:
+                self.delayed += 1
+            return delay
+
+    def record(self, host: str, ok: bool, error: str = None):
+        """Учитывает исход запроса к хосту."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            breaker = self._breaker(host)
+            if ok:
+                if breaker.record_success():
+                    self._dirty.add(host)
+            else:
+                breaker.record_failure(error)
+                self._dirty.add(host)
+
+    def cancel(self, host: str):
+        """Запрос отменен по сроку до получения ответа: исход не учитывается, пробный слот освобождается."""
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is not None:
+                breaker._probing = False
+
+    def state(self, host: str) -> str:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            return breaker.state if breaker else CLOSED
+
+    def pop_dirty(self) -> list:
+        """
+        Возвращает и сбрасывает изменившиеся состояния хостов.
+        :return: список словарей с полями таблицы host_states
+        """
+        with self._lock:
+            rows = []
+            for host in self._dirty:
+                breaker = self._breakers[host]
+                rows.append({
+                    "host": host,
+                    "state": breaker.state,
+                    "failures": breaker.failures,
+                    "opened_at": datetime.fromtimestamp(breaker.opened_at, timezone.utc).replace(tzinfo=None) if breaker.opened_at else None,
+                    "last_error": breaker.last_error,
+                })
+            self._dirty.clear()
+            return rows
+
+    def restore(self, rows):
+        """
+        Восстанавливает состояния хостов (строки host_states).
+        Полуоткрытая при сохранении цепь восстанавливается как разомкнутая.
+        """
+        with self._lock:
+            for row in rows:
+                breaker = self._breaker(row.host)
+                breaker.failures = row.failures or 0
+                breaker.last_error = row.last_error
+                if row.state in (OPEN, HALF_OPEN) and row.opened_at is not None:
+                    breaker.state = OPEN
+                    breaker.opened_at = row.opened_at.replace(tzinfo=timezone.utc).timestamp()
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = [breaker.state for breaker in self._breakers.values()]
+            return {
+                "hosts": len(set(self._buckets) | set(self._breakers)),
+                "open": states.count(OPEN),
+                "half_open": states.count(HALF_OPEN),
+                "rejected": self.rejected,
+                "delayed": self.delayed,
+            }
+
+
+def persist_host_states(db_session, guard):
+    """
+    Сохраняет изменившиеся состояния цепей в host_states (без коммита).
+    :param guard: HostGuard движка (другие объекты игнорируются)
+    """
+    if not isinstance(guard, HostGuard):
+        return
+    save_host_rows(db_session, guard.pop_dirty())
+
+
+def save_host_rows(db_session, rows):
+    """
+    Записывает строки состояний цепей (HostGuard.pop_dirty) в host_states (без коммита).
+    """
+    if not rows:
+        return
+    from app.models import HostState
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for row in rows:
+        db_session.merge(HostState(updated_at=now, **row))
+
+
+def restore_host_states(db_session, guard):
+    """
+    Загружает сохраненные состояния цепей в HostGuard (при старте процесса).
+    """
+    if not isinstance(guard, HostGuard):
+        return
+    from app.models import HostState
+    guard.restore(db_session.query(HostState).filter(HostState.state != CLOSED).all())
@@ -0,0 +1,109 @@
+"""
+Окно последних известных content_hash постов по сайтам для инкрементального
+извлечения. Ленты на страницах почти всегда идут от новых к старым, поэтому
+WebScraper.iter_posts прекращает обход, встретив INCREMENTAL_STOP_AFTER
+известных постов подряд: при типичной проверке с 0–2 новыми постами
+остальные элементы страницы не разбираются и не хешируются.
+Режим включается для сайта (Site.incremental_stop_after) или для всех
+сайтов (INCREMENTAL_STOP_AFTER): на страницах с закрепленными постами над
+лентой он пропустил бы новые посты под ними, поэтому по умолчанию выключен.
+Окно сайта заполняется из БД при первой проверке в процессе и обновляется
+после записи результата проверки (check_site).
+"""
+from collections import OrderedDict
+import os
+import threading
+
+# Сколько известных постов подряд завершают извлечение, если у сайта не задано свое
+# значение (0 — извлекать всю страницу)
+INCREMENTAL_STOP_AFTER = int(os.getenv("INCREMENTAL_STOP_AFTER", "0"))
+# Сколько последних хешей помнить на сайт и для скольких сайтов
+INCREMENTAL_WINDOW = int(os.getenv("INCREMENTAL_WINDOW", "50"))
+INCREMENTAL_MAX_SITES = int(os.getenv("INCREMENTAL_MAX_SITES", "10000"))
+
+
+def stop_after_for(site) -> int:
+    """
+    :return: после скольких известных постов подряд прекращать обход страницы сайта (0 — не прекращать)
+    """
+    value = getattr(site, 'incremental_stop_after', None)
+    return INCREMENTAL_STOP_AFTER if value is None else value
+
+
+class KnownPostWindow:
+    """
+    Потокобезопасный LRU по сайтам: для каждого — последние window хешей
+    в порядке страницы (новые первыми).
+    """
+    def __init__(self, window: int = INCREMENTAL_WINDOW, max_sites: int = INCREMENTAL_MAX_SITES):
+        """
+        :param window: хешей на сайт
+        :param max_sites: сайтов в памяти (дольше всех не проверявшиеся вытесняются)
+        """
+        self.window = window
+        self.max_sites = max_sites
+        self._sites = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.seeded = 0
+
+    def hashes(self, db_session, site_id: int) -> frozenset:
+        """
+        Известные хеши сайта; при промахе окно заполняется последними постами из БД.
+        :return: frozenset хешей (пустой, если БД недоступна — тогда обход полный)
+        """
+        with self._lock:
+            known = self._sites.get(site_id)
+            if known is not None:
+                self._sites.move_to_end(site_id)
+                self.hits += 1
+                return frozenset(known)
+        try:
+            from app.models import Post
+            rows = (
+                db_session.query(Post.content_hash)
+                .filter(Post.site_id == site_id)
+                # Последние записанные пакеты; внутри пакета — в порядке страницы
+                .order_by(Post.created_at.desc(), Post.id.asc())
+                .limit(self.window)
+                .all()
+            )
+            seed = [content_hash for (content_hash,) in rows if content_hash]
+        except Exception as e:
+            print(f"[known_posts] Не удалось загрузить хеши site.id={site_id}: {e}")
+            return frozenset()
+        self.remember(site_id, seed)
+        with self._lock:
+            self.seeded += 1
+        return frozenset(seed)
+
+    def remember(self, site_id: int, hashes):
+        """
+        Добавляет хеши последней проверки (в порядке страницы) в начало окна сайта.
+        """
+        with self._lock:
+            merged = OrderedDict.fromkeys(h for h in hashes if h)
+            for content_hash in self._sites.get(site_id, ()):
+                if len(merged) >= self.window:
+                    break
+                merged.setdefault(content_hash)
+            self._sites[site_id] = list(merged)[:self.window]
+            self._sites.move_to_end(site_id)
+            while len(self._sites) > self.max_sites:
+                self._sites.popitem(last=False)
+
+    def invalidate_site(self, site_id: int):
+        with self._lock:
+            self._sites.pop(site_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sites.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sites": len(self._sites), "window": self.window, "hits": self.hits, "seeded": self.seeded}
+
+
+# Глобальное окно известных постов процесса
+known_posts = KnownPostWindow()
@@ -0,0 +1,189 @@
+"""
+Аренда (lease) проверок сайтов в БД.
+Перед проверкой процесс захватывает сайт одним условным UPDATE:
+строка обновляется, только если сайт активен, его время проверки
+(next_check_at) наступило и аренда свободна или истекла. Поэтому любое
+число процессов и узлов может делить один набор сайтов без двойных
+проверок, а сайты упавшего процесса подхватываются после lease_until.
+Если для engine сессии запущен поток записи (app.result_writer), захват
+и освобождение аренды выполняются им, в одной транзакции с результатами
+проверок других сайтов: у SQLite остается один писатель.
+Внутри процесса проверки одного сайта дополнительно исключают друг друга
+через hold_local_check: без аренды (SITE_LEASES=0) это единственная
+защита от одновременной ручной и плановой проверки.
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import socket
+import threading
+
+from sqlalchemy import or_, select, update
+
+from app.result_writer import result_writer_for
+
+# Имя этого процесса в lease_owner и длительность аренды (из .env или по умолчанию)
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))
+# 0 — не использовать аренду (один процесс-планировщик)
+SITE_LEASES = os.getenv("SITE_LEASES", "1") == "1"
+# Владелец аренды для планировщика этого процесса
+LEASE_OWNER = WORKER_ID if SITE_LEASES else None
+
+# Сайты, которые сейчас проверяет этот процесс (любой поток)
+_local_checks = set()
+_local_checks_lock = threading.Lock()
+
+
+def utcnow() -> datetime:
+    """Текущее время UTC без tzinfo (так же хранятся даты в таблицах)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def hold_local_check(site_id: int) -> bool:
+    """
+    Отмечает сайт как проверяемый в этом процессе.
+    :return: False, если сайт уже проверяет другой поток процесса
+    """
+    with _local_checks_lock:
+        if site_id in _local_checks:
+            return False
+        _local_checks.add(site_id)
+        return True
+
+
+def release_local_check(site_id: int):
+    with _local_checks_lock:
+        _local_checks.discard(site_id)
+
+
+def _write(db_session, call, pending_writes: list = None):
+    """
+    Выполняет call(db) и коммитит: в потоке записи сессии или в самой сессии.
+    :param pending_writes: с потоком записи — не ждать, а добавить Future в этот список
+    :return: результат call (None, если запись отложена в pending_writes)
+    """
+    writer = result_writer_for(db_session)
+    if writer is None:
+        value = call(db_session)
+        db_session.commit()
+        return value
+    future = writer.execute(call)
+    if pending_writes is not None:
+        pending_writes.append(future)
+        return None
+    value = future.result()
+    # Новая транзакция чтения сессии видит записанное потоком
+    db_session.commit()
+    return value
+
+
+def _claimable(now: datetime, owner: str, force: bool = False):
+    from app.models import Site
+    conditions = (
+        Site.is_active == 1,
+        or_(Site.lease_until.is_(None), Site.lease_until < now, Site.lease_owner == owner),
+    )
+    if force:
+        return conditions
+    return conditions + (or_(Site.next_check_at.is_(None), Site.next_check_at <= now),)
+
+
+def claim_site(db_session, site_id: int, owner: str = WORKER_ID, lease_seconds: int = LEASE_SECONDS, now: datetime = None, force: bool = False,
+               unchecked_since: datetime = None) -> bool:
+    """
+    Захватывает проверку сайта атомарным условным UPDATE и коммитит.
+    :param db_session: сессия БД
+    :param site_id: ID сайта
+    :param owner: идентификатор процесса (lease_owner)
+    :param lease_seconds: длительность аренды
+    :param now: текущее время (naive UTC), для тестов
+    :param force: не ждать next_check_at (ручная проверка); чужая аренда по-прежнему мешает
+    :param unchecked_since: захватывать, только если сайт не проверялся с этого момента
+                            (ручная проверка засчитывает чужую, завершившуюся после запроса)
+    :return: True, если аренда получена этим процессом
+    """
+    from app.models import Site
+    now = now or utcnow()
+    conditions = _claimable(now, owner, force)
+    if unchecked_since is not None:
+        conditions += (or_(Site.last_check.is_(None), Site.last_check < unchecked_since),)
+    stmt = (
+        update(Site)
+        .where(Site.id == site_id, *conditions)
+        .values(lease_owner=owner, lease_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    return _write(db_session, lambda db: db.execute(stmt).rowcount == 1)
+
+
+def claim_due_sites(db_session, owner: str = WORKER_ID, limit: int = 100, lease_seconds: int = LEASE_SECONDS, now: datetime = None) -> list:
+    """
+    Захватывает до limit сайтов, время проверки которых наступило
+    (сначала самые просроченные), одним условным UPDATE ... WHERE id IN (...)
+    и одним коммитом. Сайты, перехваченные другим процессом между выборкой
+    и UPDATE, условие _claimable отсекает.
+    :return: список ID захваченных сайтов
+    """
+    from app.models import Site
+    now = now or utcnow()
+    until = now + timedelta(seconds=lease_seconds)
+    candidates = (
+        select(Site.id)
+        .where(*_claimable(now, owner))
+        .order_by(Site.next_check_at.asc().nulls_first(), Site.id)
+        .limit(limit)
+    )
+    stmt = (
+        update(Site)
+        .where(Site.id.in_(candidates.scalar_subquery()), *_claimable(now, owner))
+        .values(lease_owner=owner, lease_until=until)
+        .execution_options(synchronize_session=False)
+    )
+
+    def claim(db):
+        if db.get_bind().dialect.update_returning:
+            return sorted(site_id for (site_id,) in db.execute(stmt.returning(Site.id)))
+        # Без RETURNING: свои строки с только что выставленным lease_until, в той же транзакции
+        db.execute(stmt)
+        return sorted(site_id for (site_id,) in db.query(Site.id).filter(Site.lease_owner == owner, Site.lease_until == until))
+    return _write(db_session, claim)
+
+
+def renew_leases(db_session, site_ids, owner: str = WORKER_ID, lease_seconds: int = LEASE_SECONDS, now: datetime = None,
+                 pending_writes: list = None):
+    """
+    Продлевает аренду еще не проверенных сайтов долгого прогона (check_all_sites),
+    чтобы она не истекла до их проверки и сайт не взял другой процесс.
+    Продлеваются только аренды, которые все еще принадлежат owner.
+    :param pending_writes: с потоком записи — не ждать записи, а добавить ее Future в список
+    :return: сколько аренд продлено (None, если запись отложена)
+    """
+    from app.models import Site
+    site_ids = list(site_ids)
+    if not site_ids:
+        return 0
+    stmt = (
+        update(Site)
+        .where(Site.id.in_(site_ids), Site.lease_owner == owner)
+        .values(lease_until=(now or utcnow()) + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    return _write(db_session, lambda db: db.execute(stmt).rowcount, pending_writes)
+
+
+def release_site(db_session, site_id: int, owner: str = WORKER_ID, next_check_at: datetime = None, pending_writes: list = None) -> bool:
+    """
+    Освобождает аренду и назначает следующую проверку. Коммит выполняется здесь.
+    Если аренда уже истекла и перешла к другому процессу, строка не меняется.
+    :param next_check_at: время следующей проверки (naive UTC)
+    :param pending_writes: с потоком записи — не ждать записи, а добавить ее Future в список
+    :return: True, если аренда принадлежала owner (None, если запись отложена)
+    """
+    from app.models import Site
+    stmt = (
+        update(Site)
+        .where(Site.id == site_id, Site.lease_owner == owner)
+        .values(lease_owner=None, lease_until=None, next_check_at=next_check_at)
+        .execution_options(synchronize_session=False)
+    )
+    return _write(db_session, lambda db: db.execute(stmt).rowcount == 1, pending_writes)
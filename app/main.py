@@ -1,6 +1,8 @@
 """
 RSSify main FastAPI application entrypoint.
 """
+import os
+
 from fastapi import FastAPI, Request, Depends, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -13,7 +15,10 @@ from app.routers import sites, feeds
 from app.scheduler import TaskScheduler, schedule_individual_site_checks
 from app.database import SessionLocal, get_db
 from app.models import Site
-from app.scraper import WebScraper
+from app.scraper import get_shared_scraper, close_shared_scraper
+from app.parse_pool import PARSE_WORKERS, get_shared_parse_pool, close_shared_parse_pool
+from app.site_sync import site_changes
+from app.result_writer import close_shared_result_writer, get_shared_result_writer, shared_result_writer_stats
 
 app = FastAPI()
 app.include_router(sites.router)
@@ -31,17 +36,33 @@ def index(request: Request, db: Session = Depends(get_db)):
     sites = db.query(Site).all()
     return templates.TemplateResponse("sites_list.html", {"request": request, "sites": sites})
 
+# 0 — не проверять сайты в процессе API (проверки идут в python -m app.worker)
+ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "1") == "1"
+
 scheduler = TaskScheduler()
 
 @app.on_event("startup")
 def start_scheduler():
+    # Общий HTTP-клиент с пулом соединений для планировщика и API
+    scraper = get_shared_scraper()
+    scraper.start()
+    # Один поток записи результатов проверок (SQLite в режиме wal)
+    get_shared_result_writer()
+    if not ENABLE_SCHEDULER:
+        print("[main] ENABLE_SCHEDULER=0: встроенный планировщик отключен")
+        return
+    # Разбор HTML в пуле процессов (PARSE_WORKERS=0 — в потоках планировщика)
+    parse_pool = get_shared_parse_pool() if PARSE_WORKERS > 0 else None
     scheduler.start()
     # Индивидуальные задачи для каждого сайта с учетом check_interval
-    schedule_individual_site_checks(scheduler, SessionLocal, WebScraper())
+    schedule_individual_site_checks(scheduler, SessionLocal, scraper, parse_pool=parse_pool)
 
 @app.on_event("shutdown")
 def shutdown_scheduler():
     scheduler.shutdown()
+    close_shared_scraper()
+    close_shared_parse_pool()
+    close_shared_result_writer()
 
 @app.get("/health", tags=["admin"])
 def healthcheck():
@@ -50,6 +71,18 @@ def healthcheck():
     """
     return {"status": "ok"}
 
+@app.get("/scheduler/stats", tags=["admin"])
+def scheduler_stats():
+    """
+    Метрики планировщика: режим, глубина очереди, отставание (lag), пропуски (misfires),
+    лимитера и circuit breaker хостов (hosts), а также потока записи результатов (writer).
+    """
+    return {
+        **scheduler.stats(),
+        "hosts": get_shared_scraper().engine.host_guard.stats(),
+        "writer": shared_result_writer_stats(),
+    }
+
 @app.post("/add-site", tags=["web"])
 def add_site(
     request: Request,
@@ -81,6 +114,7 @@ def add_site(
     db.add(site)
     try:
         db.commit()
+        site_changes.site_saved(site)
     except IntegrityError:
         db.rollback()
         # Можно добавить flash-сообщение об ошибке (например, дублирующий URL)
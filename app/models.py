@@ -1,7 +1,7 @@
 """
 SQLAlchemy models for RSSify project.
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy import DDL, Column, Integer, Float, String, Text, ForeignKey, DateTime, Index, event
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -16,11 +16,46 @@ class Site(Base):
     title_selector = Column(String(256), nullable=True)
     desc_selector = Column(String(256), nullable=True)
     link_selector = Column(String(256), nullable=True)
+    # Бэкенд разбора HTML для сайта (None — SCRAPER_PARSER по умолчанию)
+    parser = Column(String(32), nullable=True)
+    # Загрузка постов (app.feed_ingest): режим auto / feed / html, URL RSS/Atom-ленты
+    # (настроенный или найденный на странице) и фактически используемый путь: feed / html
+    ingest_mode = Column(String(16), default="auto", nullable=False)
+    feed_url = Column(String(512), nullable=True)
+    active_ingest = Column(String(16), nullable=True)
+    # Лимит размера страницы в байтах (None — FETCH_MAX_BYTES, 0 — без лимита)
+    max_page_size = Column(Integer, nullable=True)
+    # Инкрементальное извлечение (app.known_posts): после скольких известных постов подряд
+    # прекращать обход страницы (None — INCREMENTAL_STOP_AFTER, 0 — всегда вся страница)
+    incremental_stop_after = Column(Integer, nullable=True)
     description = Column(Text, nullable=True)
     is_active = Column(Integer, default=1)
     check_interval = Column(Integer, default=10, nullable=False)  # Интервал проверки в минутах
     last_check = Column(DateTime, nullable=True)
     last_error = Column(Text, nullable=True)
+    error_count = Column(Integer, default=0, nullable=False)  # Ошибок подряд (exponential backoff)
+    # Условный GET: валидаторы последнего ответа и хеш тела страницы
+    etag = Column(String(256), nullable=True)
+    last_modified = Column(String(64), nullable=True)
+    content_digest = Column(String(64), nullable=True)
+    # Счетчики проверок и пропущенной работы (304 / неизменившееся тело)
+    checks_count = Column(Integer, default=0, nullable=False)
+    not_modified_count = Column(Integer, default=0, nullable=False)
+    unchanged_count = Column(Integer, default=0, nullable=False)
+    # Аренда проверки между процессами/узлами (см. app.leases)
+    lease_owner = Column(String(128), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    next_check_at = Column(DateTime, nullable=True)
+    # Адаптивный опрос (см. app.adaptive): границы и выученный интервал в минутах,
+    # статистика изменений
+    min_interval = Column(Integer, nullable=True)
+    max_interval = Column(Integer, nullable=True)
+    adaptive_interval = Column(Float, nullable=True)
+    avg_change_gap = Column(Float, nullable=True)
+    change_count = Column(Integer, default=0, nullable=False)
+    last_change_at = Column(DateTime, nullable=True)
+    # Время последнего изменения настроек сайта (сверка расписания, app.site_sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=True)
     # Можно добавить другие поля: created_at, updated_at, etc.
 
     posts = relationship("Post", back_populates="site", cascade="all, delete-orphan")
@@ -28,17 +63,32 @@ class Site(Base):
     __table_args__ = (
         Index("ix_sites_url", "url"),
         Index("ix_sites_name", "name"),
+        Index("ix_sites_next_check_at", "next_check_at"),
+        Index("ix_sites_updated_at", "updated_at"),
     )
 
+# Тот же триггер, что в alembic_migration_add_site_updated_at.sql: базы, созданные
+# через create_all, тоже сдвигают updated_at при правках настроек в обход API.
+# Время пишется в формате SQLAlchemy (микросекунды, здесь с точностью до миллисекунд):
+# у CURRENT_TIMESTAMP только секунды, и правка в ту же секунду оказалась бы раньше водяного знака
+event.listen(Site.__table__, "after_create", DDL("""
+CREATE TRIGGER IF NOT EXISTS sites_touch_updated_at
+AFTER UPDATE OF url, selector, is_active, check_interval, min_interval, max_interval ON sites
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE sites SET updated_at = strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now') || '000' WHERE id = NEW.id;
+END
+""").execute_if(dialect="sqlite"))
+
 class Post(Base):
     __tablename__ = "posts"
 
     id = Column(Integer, primary_key=True, index=True)
-    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False, index=True)
+    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False)
     title = Column(String(256), nullable=False)
     description = Column(Text, nullable=True)
     url = Column(String(512), nullable=False)
-    content_hash = Column(String(64), nullable=True, index=True)
+    content_hash = Column(String(64), nullable=True)
     published_at = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -48,4 +98,45 @@ class Post(Base):
         Index("ix_posts_site_id", "site_id"),
         Index("ix_posts_content_hash", "content_hash"),
         Index("ix_posts_url", "url"),
+        # Выборка последних N постов сайта для фидов и API
+        Index("ix_posts_site_id_published_at", "site_id", "published_at"),
+        # Дедупликация постов: один content_hash на сайт
+        Index("ux_posts_site_id_content_hash", "site_id", "content_hash", unique=True),
+    )
+
+
+class HostState(Base):
+    """Сохраненное состояние circuit breaker хоста (app.host_guard)."""
+    __tablename__ = "host_states"
+
+    host = Column(String(255), primary_key=True)
+    state = Column(String(16), default="closed", nullable=False)
+    failures = Column(Integer, default=0, nullable=False)
+    opened_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+
+class CheckRequest(Base):
+    """Ручная проверка сайта (app.check_queue): API ставит строку, воркер выполняет."""
+    __tablename__ = "check_requests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), nullable=False, unique=True)
+    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False)
+    status = Column(String(16), default="queued", nullable=False)
+    # Сколько запросов API слито в это задание (single-flight)
+    requests = Column(Integer, default=1, nullable=False)
+    requested_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Воркер, взявший задание (lease_owner / WORKER_ID)
+    worker = Column(String(255), nullable=True)
+    # JSON: итог проверки и длительность фаз
+    outcome = Column(Text, nullable=True)
+    timings = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_check_requests_status_id", "status", "id"),
+        Index("ix_check_requests_site_id_status", "site_id", "status"),
     )
@@ -0,0 +1,144 @@
+"""
+Пул процессов для разбора HTML и извлечения постов.
+Разбор и CSS-селекторы — чистый CPU под GIL, поэтому потоки планировщика
+не дают прироста; здесь страница и набор селекторов сайта отправляются
+в ProcessPoolExecutor, а обратно приходят компактные записи постов
+(кортежи). Загрузка страниц остается в асинхронном движке и потоках.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from app.known_posts import INCREMENTAL_STOP_AFTER
+
+# Количество процессов разбора: 0 — разбор в вызывающем потоке (из .env или по числу ядер)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Способ запуска процессов: spawn безопасен при работающих потоках (loop httpx, APScheduler)
+PARSE_MP_CONTEXT = os.getenv("PARSE_MP_CONTEXT", "spawn")
+
+# Порядок полей в компактной записи поста
+RECORD_FIELDS = ("title", "description", "url", "content_hash")
+
+_worker_scraper = None
+
+def site_selectors(site) -> dict:
+    """
+    Набор селекторов сайта в виде аргументов WebScraper.extract_posts.
+    """
+    return {
+        "post_selector": site.selector,
+        "title_selector": site.title_selector,
+        "desc_selector": site.desc_selector,
+        "link_selector": site.link_selector,
+        "base_url": site.url,
+    }
+
+def extract_records(html, selectors: dict, parser: str = None, site_id: int = None, known_hashes=None, encoding: str = None,
+                    stop_after: int = INCREMENTAL_STOP_AFTER) -> list:
+    """
+    Разбирает страницу и возвращает посты как кортежи RECORD_FIELDS.
+    Выполняется в процессе пула (или в текущем потоке, если пул отключен).
+    :param html: HTML страницы (str или сырые байты ответа)
+    :param selectors: результат site_selectors
+    :param parser: бэкенд разбора (см. app.parsers)
+    :param site_id: ID сайта для кеша планов селекторов внутри процесса
+    :param known_hashes: известные content_hash сайта для инкрементального извлечения
+    :param encoding: кодировка байтов html (FetchResult.encoding; None — UTF-8 / объявленная в документе)
+    :param stop_after: после скольких известных постов подряд остановиться (см. stop_after_for)
+    """
+    global _worker_scraper
+    if _worker_scraper is None:
+        from app.scraper import WebScraper
+        # HTTP-клиент в процессе разбора не открывается: нужны только parse/extract
+        _worker_scraper = WebScraper()
+    page = _worker_scraper.parse_page(html, parser=parser, encoding=encoding)
+    posts = _worker_scraper.extract_posts(page, site_id=site_id, known_hashes=known_hashes, stop_after=stop_after,
+                                           **selectors)
+    return [tuple(post[field] for field in RECORD_FIELDS) for post in posts]
+
+def records_to_posts(records) -> list:
+    """Превращает компактные записи обратно в словари постов."""
+    return [dict(zip(RECORD_FIELDS, record)) for record in records]
+
+
+class ParsePool:
+    """
+    Стадия разбора на пуле процессов. Процессы создаются при первой задаче
+    и переживают проверки, поэтому кеш планов селекторов в них сохраняется.
+    """
+    def __init__(self, max_workers: int = PARSE_WORKERS, mp_context: str = PARSE_MP_CONTEXT):
+        """
+        :param max_workers: количество процессов; 0 — разбор в вызывающем потоке
+        :param mp_context: способ запуска процессов ("spawn", "forkserver", "fork")
+        """
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.mp_context),
+                )
+            return self._executor
+
+    def submit(self, html, selectors: dict, parser: str = None, site_id: int = None, known_hashes=None, encoding: str = None,
+               stop_after: int = INCREMENTAL_STOP_AFTER) -> Future:
+        """
+        Отправляет страницу на разбор.
+        :param known_hashes: известные content_hash сайта (передаются в процесс вместе со страницей)
+        :param encoding: кодировка байтов html (сырые байты дешевле передавать в процесс, чем str)
+        :param stop_after: порог инкрементального извлечения сайта
+        :return: Future со списком записей (см. extract_records)
+        """
+        if self.max_workers <= 0:
+            future = Future()
+            try:
+                future.set_result(extract_records(html, selectors, parser, site_id, known_hashes, encoding, stop_after))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._get_executor().submit(extract_records, html, selectors, parser, site_id, known_hashes, encoding,
+                                            stop_after)
+
+    def extract_posts(self, html, selectors: dict, parser: str = None, site_id: int = None) -> list:
+        """
+        Разбирает страницу в пуле и ждет результат.
+        :return: список словарей постов (как WebScraper.extract_posts)
+        """
+        return records_to_posts(self.submit(html, selectors, parser, site_id).result())
+
+    def close(self, wait: bool = True):
+        """Останавливает процессы пула (пул можно использовать снова — он пересоздастся)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_shared_parse_pool = None
+_shared_parse_pool_lock = threading.Lock()
+
+def get_shared_parse_pool() -> ParsePool:
+    """
+    Возвращает общий для процесса ParsePool (создается при первом вызове).
+    """
+    global _shared_parse_pool
+    with _shared_parse_pool_lock:
+        if _shared_parse_pool is None:
+            _shared_parse_pool = ParsePool()
+        return _shared_parse_pool
+
+def close_shared_parse_pool():
+    """
+    Останавливает общий ParsePool (вызывается при остановке приложения).
+    """
+    global _shared_parse_pool
+    with _shared_parse_pool_lock:
+        if _shared_parse_pool is not None:
+            _shared_parse_pool.close()
+            _shared_parse_pool = None
@@ -0,0 +1,213 @@
+"""
+Бэкенды разбора HTML для WebScraper.
+Каждый бэкенд умеет разобрать страницу и выполнить CSS-селекторы семейства
+Site.selector / title_selector / desc_selector / link_selector.
+BeautifulSoup (html.parser) — эталон и запасной вариант; lxml (lxml.html +
+cssselect) и selectolax (lexbor) — быстрые пути, если пакеты установлены.
+Текст извлекается по правилам BeautifulSoup.get_text(strip=True), чтобы
+content_hash постов не зависел от бэкенда.
+Селекторы сначала компилируются (backend.compile), а select / select_one
+принимают уже скомпилированный селектор — см. ExtractionPlan.
+parse принимает и сырые байты ответа с кодировкой из заголовков
+(FetchResult.encoding): lxml и BeautifulSoup декодируют их сами.
+"""
+import os
+
+from bs4 import BeautifulSoup
+import soupsieve
+from soupsieve import SelectorSyntaxError
+
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector  # требует пакет cssselect
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser, SelectolaxError
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+# Бэкенд по умолчанию (из .env); html.parser используется, если выбранный недоступен
+DEFAULT_PARSER = os.getenv("SCRAPER_PARSER", "lxml")
+FALLBACK_PARSER = "html.parser"
+# Допустимые значения Site.parser и SCRAPER_PARSER
+PARSER_NAMES = ("html.parser", "lxml", "selectolax")
+
+# Содержимое этих тегов BeautifulSoup не включает в get_text() (template — как TemplateString)
+NON_TEXT_TAGS = ("script", "style", "template")
+
+
+class ParsedPage:
+    """
+    Разобранная страница: корень документа и бэкенд, который его построил.
+    html: исходный текст или байты (нужны для повторного разбора запасным бэкендом)
+    encoding: кодировка байтов html (None — str или определяется парсером)
+    """
+    def __init__(self, backend, root, html, encoding: str = None):
+        self.backend = backend
+        self.root = root
+        self.html = html
+        self.encoding = encoding
+
+
+class SoupBackend:
+    """
+    BeautifulSoup с выбранным tree builder (по умолчанию html.parser).
+    """
+    selector_errors = (SelectorSyntaxError,)
+
+    def __init__(self, features: str = "html.parser"):
+        self.name = features
+        self.features = features
+
+    def parse(self, html, encoding: str = None) -> ParsedPage:
+        if isinstance(html, bytes):
+            return ParsedPage(self, BeautifulSoup(html, self.features, from_encoding=encoding), html, encoding)
+        return ParsedPage(self, BeautifulSoup(html, self.features), html)
+
+    def compile(self, selector: str):
+        return soupsieve.compile(selector)
+
+    def select(self, node, compiled) -> list:
+        return compiled.select(node)
+
+    def select_one(self, node, compiled):
+        return compiled.select_one(node)
+
+    def text(self, node) -> str:
+        return node.get_text(strip=True)
+
+    def attr(self, node, name: str):
+        return node[name] if node.has_attr(name) else None
+
+
+class LxmlBackend:
+    """
+    lxml.html + cssselect: селекторы транслируются в XPath и выполняются в C.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        from cssselect import SelectorError
+        from lxml.etree import XPathError
+        # Селекторы, которые cssselect не поддерживает (например, :has)
+        self.selector_errors = (SelectorError, XPathError)
+
+    def parse(self, html, encoding: str = None) -> ParsedPage:
+        if not html or not html.strip():
+            html = "<html></html>"
+        if isinstance(html, bytes):
+            # Байты декодирует libxml2 в кодировке из заголовков, без промежуточной str
+            root = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(encoding=encoding))
+        else:
+            try:
+                root = lxml.html.document_fromstring(html)
+            except ValueError:
+                # Строка с объявлением кодировки (<?xml ... encoding=...?>)
+                root = lxml.html.document_fromstring(html.encode("utf-8"))
+        for element in list(root.iter(*NON_TEXT_TAGS)):
+            # Не drop_tree: он склеил бы хвост тега с текстом перед ним, а get_text
+            # и text() обрезают пробелы у каждого текстового узла отдельно
+            element.clear(keep_tail=True)
+        return ParsedPage(self, root, html, encoding)
+
+    def compile(self, selector: str):
+        return CSSSelector(selector, translator="html")
+
+    def select(self, node, compiled) -> list:
+        return compiled(node)
+
+    def select_one(self, node, compiled):
+        found = compiled(node)
+        return found[0] if found else None
+
+    def text(self, node) -> str:
+        return "".join(part.strip() for part in node.itertext())
+
+    def attr(self, node, name: str):
+        return node.get(name)
+
+
+class SelectolaxBackend:
+    """
+    selectolax (lexbor): самый быстрый разбор и CSS-движок на C.
+    """
+    name = "selectolax"
+    selector_errors = (SelectolaxError, ValueError)
+
+    def parse(self, html, encoding: str = None) -> ParsedPage:
+        if isinstance(html, bytes):
+            html = html.decode(encoding or "utf-8", errors="replace")
+        tree = LexborHTMLParser(html or "")
+        tree.strip_tags(list(NON_TEXT_TAGS))
+        return ParsedPage(self, tree, html)
+
+    def compile(self, selector: str):
+        # selectolax не отдает скомпилированные селекторы: проверяем синтаксис
+        # один раз на пустом документе и дальше передаем строку в lexbor
+        LexborHTMLParser("").css(selector)
+        return selector
+
+    def select(self, node, compiled) -> list:
+        return node.css(compiled)
+
+    def select_one(self, node, compiled):
+        return node.css_first(compiled)
+
+    def text(self, node) -> str:
+        return node.text(strip=True)
+
+    def attr(self, node, name: str):
+        attributes = node.attributes
+        if name not in attributes:
+            return None
+        return attributes[name] or ""
+
+class ExtractionPlan:
+    """
+    Скомпилированные селекторы сайта для одного бэкенда:
+    post (контейнер поста), title, desc, link (относительно контейнера; None — не задан).
+    """
+    def __init__(self, backend, post_selector: str, title_selector: str = None, desc_selector: str = None, link_selector: str = None):
+        """
+        :raises backend.selector_errors: если бэкенд не поддерживает один из селекторов
+        """
+        self.backend = backend
+        self.post = backend.compile(post_selector)
+        self.title = backend.compile(title_selector) if title_selector else None
+        self.desc = backend.compile(desc_selector) if desc_selector else None
+        self.link = backend.compile(link_selector) if link_selector else None
+
+
+_backends = {}
+
+def get_backend(name: str = None):
+    """
+    Возвращает бэкенд разбора по имени ("html.parser", "lxml", "selectolax").
+    Если бэкенд неизвестен или его пакеты не установлены — html.parser.
+    :param name: имя бэкенда; None — SCRAPER_PARSER из окружения
+    """
+    name = name or DEFAULT_PARSER
+    if name not in _backends:
+        if name == "lxml" and LXML_AVAILABLE:
+            _backends[name] = LxmlBackend()
+        elif name == "selectolax" and SELECTOLAX_AVAILABLE:
+            _backends[name] = SelectolaxBackend()
+        elif name == FALLBACK_PARSER:
+            _backends[name] = SoupBackend(FALLBACK_PARSER)
+        else:
+            print(f"[parsers] Бэкенд {name!r} недоступен — используется {FALLBACK_PARSER}")
+            _backends[name] = get_backend(FALLBACK_PARSER)
+    return _backends[name]
+
+def available_backends() -> list:
+    """Имена бэкендов, которые можно использовать в текущем окружении."""
+    names = [FALLBACK_PARSER]
+    if LXML_AVAILABLE:
+        names.append("lxml")
+    if SELECTOLAX_AVAILABLE:
+        names.append("selectolax")
+    return names
@@ -0,0 +1,283 @@
+"""
+Единый поток записи результатов проверок (режим хранения SQLITE_STORAGE_MODE=wal).
+check_site не коммитит сам, а отдает потоку новые посты, изменившиеся поля
+сайта (last_check, last_error, счетчики, next_check_at...) и состояния цепей
+хостов. Поток собирает операции многих сайтов в пакет и записывает его одной
+транзакцией, поэтому SQLite видит одного писателя, а чтения (API, ленты)
+идут через свой пул подключений и в WAL не ждут записи.
+Поток привязан к engine сессий планировщика (register_result_writer):
+check_site находит его по сессии (result_writer_for), без регистрации
+запись идет по-старому, в сессии вызывающего кода. Аренды проверок
+(app.leases) тоже пишутся этим потоком (execute), поэтому других
+писателей в БД у планировщика нет.
+"""
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+# Сколько операций (сайтов) писать одной транзакцией и сколько ждать
+# следующие операции для пакета, секунд
+RESULT_WRITER_BATCH = int(os.getenv("RESULT_WRITER_BATCH", "200"))
+RESULT_WRITER_DELAY = float(os.getenv("RESULT_WRITER_DELAY", "0.02"))
+
+_STOP = object()
+
+
+class WriteOp:
+    """Результат проверки одного сайта для записи (или произвольная запись call(db))."""
+    __slots__ = ("site_id", "post_rows", "values", "host_rows", "call", "future")
+
+    def __init__(self, site_id: int, post_rows=(), values: dict = None, host_rows=(), call=None):
+        self.site_id = site_id
+        self.post_rows = list(post_rows or ())
+        self.values = values or {}
+        self.host_rows = list(host_rows or ())
+        self.call = call
+        self.future = Future()
+
+
+def pending_site_values(site) -> dict:
+    """
+    Измененные, но не записанные колонки объекта Site (для UPDATE в потоке записи).
+    """
+    from sqlalchemy import inspect
+    state = inspect(site)
+    values = {}
+    for prop in state.mapper.column_attrs:
+        history = state.attrs[prop.key].history
+        if history.added:
+            values[prop.key] = history.added[0]
+    return values
+
+
+class ResultWriter:
+    """
+    Один поток, пишущий операции пакетами в одной транзакции.
+    Если пакет не записался, операции повторяются по одной, чтобы ошибка
+    одного сайта не теряла результаты остальных.
+    """
+    def __init__(self, session_factory, max_batch: int = RESULT_WRITER_BATCH, max_delay: float = RESULT_WRITER_DELAY):
+        """
+        :param session_factory: фабрика сессий для записи (лучше отдельный engine с pool_size=1)
+        :param max_batch: максимум операций в транзакции
+        :param max_delay: сколько ждать следующие операции пакета, секунд
+        """
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = False
+        self.ops = 0
+        self.batches = 0
+        self.posts = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.last_batch_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, wait: bool = True):
+        """Останавливает поток, предварительно записав уже поставленные операции."""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def submit(self, site_id: int, post_rows=(), values: dict = None, host_rows=()) -> Future:
+        """
+        Ставит результат проверки сайта в очередь записи.
+        :param post_rows: строки новых постов (new_post_rows)
+        :param values: колонки Site для UPDATE
+        :param host_rows: состояния цепей хостов (HostGuard.pop_dirty)
+        :return: Future с числом вставленных постов; отмена возможна, пока запись не началась
+        """
+        if not self.running:
+            raise RuntimeError("ResultWriter is not running")
+        op = WriteOp(site_id, post_rows, values, host_rows)
+        self._queue.put(op)
+        return op.future
+
+    def execute(self, call) -> Future:
+        """
+        Ставит в очередь произвольную запись: call(db) выполняется в транзакции пакета
+        (без коммита — его делает поток). Используется для аренд (app.leases).
+        :return: Future с результатом call
+        """
+        if not self.running:
+            raise RuntimeError("ResultWriter is not running")
+        op = WriteOp(None, call=call)
+        self._queue.put(op)
+        return op.future
+
+    def _run(self):
+        stop = False
+        while not stop:
+            op = self._queue.get()
+            if op is _STOP:
+                break
+            batch = [op]
+            until = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    op = self._queue.get(timeout=max(0.0, until - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is _STOP:
+                    stop = True
+                    break
+                batch.append(op)
+            self._write(batch)
+
+    def _apply(self, db, op: WriteOp):
+        from sqlalchemy import update
+        from app.host_guard import save_host_rows
+        from app.models import Site
+        from app.scheduler import insert_post_rows
+        if op.call is not None:
+            return op.call(db)
+        inserted = insert_post_rows(db, op.post_rows) if op.post_rows else 0
+        if op.values:
+            db.execute(update(Site).where(Site.id == op.site_id).values(**op.values))
+        save_host_rows(db, op.host_rows)
+        return inserted
+
+    def _write(self, batch):
+        batch = [op for op in batch if op.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            try:
+                counts = [self._apply(db, op) for op in batch]
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[result_writer] Ошибка записи пакета из {len(batch)} операций: {e}")
+                self._write_each(db, batch)
+            else:
+                for op, count in zip(batch, counts):
+                    op.future.set_result(count)
+                self.posts += sum(count for op, count in zip(batch, counts) if op.call is None)
+        finally:
+            db.close()
+        self.ops += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.last_batch_ms = round((time.monotonic() - started) * 1000, 1)
+
+    def _write_each(self, db, batch):
+        for op in batch:
+            try:
+                count = self._apply(db, op)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.errors += 1
+                print(f"[result_writer] Ошибка записи site.id={op.site_id}: {e}")
+                op.future.set_exception(e)
+            else:
+                if op.call is None:
+                    self.posts += count
+                op.future.set_result(count)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "ops": self.ops,
+            "batches": self.batches,
+            "avg_batch": round(self.ops / self.batches, 1) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "last_batch_ms": self.last_batch_ms,
+            "posts": self.posts,
+            "errors": self.errors,
+        }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def register_result_writer(engine, writer: ResultWriter):
+    """Направляет результаты проверок сессий этого engine в writer."""
+    with _writers_lock:
+        _writers[engine] = writer
+
+def unregister_result_writer(engine):
+    with _writers_lock:
+        _writers.pop(engine, None)
+
+def result_writer_for(db_session):
+    """
+    :return: запущенный ResultWriter для engine сессии или None (запись в самой сессии)
+    """
+    if not _writers:
+        return None
+    try:
+        bind = db_session.get_bind()
+    except Exception:
+        return None
+    with _writers_lock:
+        writer = _writers.get(bind)
+    return writer if writer is not None and writer.running else None
+
+
+_shared_result_writer = None
+_shared_writer_engine = None
+_shared_result_writer_lock = threading.Lock()
+
+def get_shared_result_writer():
+    """
+    Запускает общий поток записи для основной БД (при первом вызове).
+    Пишет через отдельный engine с одним подключением; чтения остаются в пуле SessionLocal.
+    :return: ResultWriter или None, если режим wal выключен (не SQLite или SQLITE_STORAGE_MODE != wal)
+    """
+    global _shared_result_writer, _shared_writer_engine
+    from app.database import DATABASE_URL, SessionLocal, engine, make_engine, wal_enabled
+    with _shared_result_writer_lock:
+        if _shared_result_writer is None and wal_enabled(DATABASE_URL):
+            from sqlalchemy.orm import sessionmaker
+            if ":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") == "sqlite:":
+                # Отдельное подключение к in-memory БД увидело бы другую (пустую) БД
+                factory = SessionLocal
+            else:
+                _shared_writer_engine = make_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=_shared_writer_engine)
+            _shared_result_writer = ResultWriter(factory)
+            _shared_result_writer.start()
+            register_result_writer(engine, _shared_result_writer)
+            print(f"[result_writer] Запущен поток записи результатов (batch={_shared_result_writer.max_batch})")
+        return _shared_result_writer
+
+def shared_result_writer_stats():
+    """:return: метрики общего потока записи или None, если он не запущен"""
+    writer = _shared_result_writer
+    return writer.stats() if writer is not None else None
+
+def close_shared_result_writer():
+    """
+    Дописывает очередь и останавливает общий поток записи (при остановке процесса).
+    """
+    global _shared_result_writer, _shared_writer_engine
+    from app.database import engine
+    with _shared_result_writer_lock:
+        if _shared_result_writer is not None:
+            unregister_result_writer(engine)
+            _shared_result_writer.close()
+            _shared_result_writer = None
+        if _shared_writer_engine is not None:
+            _shared_writer_engine.dispose()
+            _shared_writer_engine = None
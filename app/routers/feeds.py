@@ -1,62 +1,130 @@
 """
 Feeds API router for RSS and Atom endpoints.
 """
-from fastapi import APIRouter, Depends, Response, HTTPException
+import hashlib
+import os
+from datetime import timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app import models, database, rss_generator
+from app.feed_cache import feed_cache
+from app.feed_writer import StreamingFeedWriter
+from app.utils import etag_matches, format_http_date, parse_http_date
 
 router = APIRouter(
     tags=["feeds"]
 )
 
-@router.get("/feed/{site_id}", response_class=Response, tags=["feeds"])
-def get_rss_feed(site_id: int, db: Session = Depends(database.get_db)):
+FEED_MEDIA_TYPES = {
+    "rss": "application/rss+xml; charset=utf-8",
+    "atom": "application/atom+xml; charset=utf-8",
+}
+
+# Сколько секунд клиентам можно не перезапрашивать фид (Cache-Control: max-age)
+FEED_HTTP_MAX_AGE = int(os.getenv("FEED_HTTP_MAX_AGE", "300"))
+# Сериализатор фидов: "feedgen" (RSSGenerator) или "stream" (StreamingFeedWriter)
+FEED_RENDERER = os.getenv("FEED_RENDERER", "feedgen")
+# Компактный XML без отступов
+FEED_COMPACT = os.getenv("FEED_COMPACT", "0") == "1"
+
+def feed_validators(db: Session, site, fmt: str, limit: Optional[int] = None):
     """
-    Получить RSS фид для сайта по его ID.
+    Вычисляет валидаторы фида одним агрегатным запросом по индексу posts.site_id,
+    не загружая сами посты.
+    :return: (ETag в кавычках, datetime последнего Post.created_at или None)
+    """
+    max_id, count, last_created = db.query(
+        func.max(models.Post.id), func.count(models.Post.id), func.max(models.Post.created_at)
+    ).filter(models.Post.site_id == site.id).one()
+    raw = f"{site.id}|{fmt}|{limit}|{site.name}|{site.url}|{site.description}|{max_id}|{count}|{last_created}"
+    etag = '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+    return etag, last_created
+
+def is_not_modified(request: Request, etag: str, last_modified) -> bool:
+    """
+    Проверяет условные заголовки запроса. If-None-Match имеет приоритет
+    над If-Modified-Since (RFC 7232).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    since = parse_http_date(request.headers.get("if-modified-since"))
+    if since is None or last_modified is None:
+        return False
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def render_feed(request: Request, db: Session, site_id: int, fmt: str, limit: int = rss_generator.MAX_FEED_ITEMS) -> Response:
+    """
+    Отдает фид сайта в формате fmt ("rss" или "atom").
+    Сначала дешево проверяет валидаторы (ETag / Last-Modified) и при совпадении
+    отвечает 304; иначе берет фид из кеша или рендерит и кладет его в кеш
+    (потоковый рендер FEED_RENDERER=stream отдается без кеширования).
     """
     site = db.query(models.Site).filter(models.Site.id == site_id, models.Site.is_active == 1).first()
     if not site:
         raise HTTPException(status_code=404, detail="Site not found or inactive")
-    posts = site.posts
+    etag, last_modified = feed_validators(db, site, fmt, limit)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={FEED_HTTP_MAX_AGE}"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_http_date(last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    key = feed_cache.make_key(site_id, fmt, limit)
+    # ETag из БД видит посты, записанные другими процессами, даже если кеш не сброшен
+    xml = feed_cache.get(key, etag)
+    if xml is not None:
+        return Response(content=xml, media_type=FEED_MEDIA_TYPES[fmt], headers={**headers, "X-Feed-Cache": "HIT"})
+    # Только последние limit постов: ORDER BY ... LIMIT по индексу (site_id, published_at)
+    rows = db.query(
+        models.Post.title, models.Post.url, models.Post.description,
+        models.Post.content_hash, models.Post.published_at
+    ).filter(models.Post.site_id == site.id).order_by(
+        models.Post.published_at.desc(), models.Post.id.desc()
+    ).limit(limit).all()
+    items = [
+        {"title": title, "link": url, "description": description, "guid": content_hash or url, "pubdate": published_at}
+        for title, url, description, content_hash, published_at in rows
+    ]
+    feed_title, feed_link, feed_description = site.name, site.url, site.description or site.name
+    headers = {**headers, "X-Feed-Cache": "MISS"}
+    if FEED_RENDERER == "stream":
+        # Потоковый фид не кешируется: иначе весь документ пришлось бы собрать в памяти
+        writer = StreamingFeedWriter(feed_title, feed_link, feed_description, pretty=not FEED_COMPACT)
+        chunks = writer.iter_rss(items) if fmt == "rss" else writer.iter_atom(items)
+        return StreamingResponse((chunk.encode("utf-8") for chunk in chunks), media_type=FEED_MEDIA_TYPES[fmt],
+                                 headers=headers)
     gen = rss_generator.RSSGenerator(
-        title=site.name,
-        link=site.url,
-        description=site.description or site.name
+        title=feed_title,
+        link=feed_link,
+        description=feed_description,
+        max_items=limit
     )
-    for post in posts:
-        gen.add_item(
-            title=post.title,
-            link=post.url,
-            description=post.description,
-            pubdate=post.published_at,
-            guid=post.content_hash or post.url
-        )
-    xml = gen.generate_feed()
-    return Response(content=xml, media_type="application/rss+xml; charset=utf-8")
+    # RSSGenerator выводит последний добавленный элемент первым
+    for item in reversed(items):
+        gen.add_item(**item)
+    xml = gen.generate_feed(pretty=not FEED_COMPACT) if fmt == "rss" else gen.generate_atom_feed(pretty=not FEED_COMPACT)
+    feed_cache.set(key, xml, etag)
+    return Response(content=xml, media_type=FEED_MEDIA_TYPES[fmt], headers=headers)
+
+@router.get("/feed/{site_id}", response_class=Response, tags=["feeds"])
+def get_rss_feed(site_id: int, request: Request, limit: int = Query(rss_generator.MAX_FEED_ITEMS, ge=1, le=1000), db: Session = Depends(database.get_db)):
+    """
+    Получить RSS фид для сайта по его ID.
+    Поддерживает условные запросы (If-None-Match / If-Modified-Since → 304).
+    limit: количество последних постов в фиде (по умолчанию MAX_FEED_ITEMS)
+    """
+    return render_feed(request, db, site_id, "rss", limit)
 
 @router.get("/feed/{site_id}/atom", response_class=Response, tags=["feeds"])
-def get_atom_feed(site_id: int, db: Session = Depends(database.get_db)):
+def get_atom_feed(site_id: int, request: Request, limit: int = Query(rss_generator.MAX_FEED_ITEMS, ge=1, le=1000), db: Session = Depends(database.get_db)):
     """
     Получить Atom фид для сайта по его ID.
+    Поддерживает условные запросы (If-None-Match / If-Modified-Since → 304).
+    limit: количество последних постов в фиде (по умолчанию MAX_FEED_ITEMS)
     """
-    site = db.query(models.Site).filter(models.Site.id == site_id, models.Site.is_active == 1).first()
-    if not site:
-        raise HTTPException(status_code=404, detail="Site not found or inactive")
-    posts = site.posts
-    gen = rss_generator.RSSGenerator(
-        title=site.name,
-        link=site.url,
-        description=site.description or site.name
-    )
-    for post in posts:
-        gen.add_item(
-            title=post.title,
-            link=post.url,
-            description=post.description,
-            pubdate=post.published_at,
-            guid=post.content_hash or post.url
-        )
-    xml = gen.generate_atom_feed()
-    return Response(content=xml, media_type="application/atom+xml; charset=utf-8")
+    return render_feed(request, db, site_id, "atom", limit)
 
 # Обработка ошибок уже реализована: если сайт не найден или неактивен, возвращается 404 с detail.
@@ -1,12 +1,20 @@
 """
 Sites API router for CRUD operations on Site model.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
 from app import models, schemas, database
-from typing import List
-from fastapi import BackgroundTasks
-from app.scraper import WebScraper
+from app.rss_generator import MAX_FEED_ITEMS
+from typing import List, Optional
+from app.check_queue import check_status as check_job_status, queue_position, submit_check
+from app.feed_cache import feed_cache
+from app.feed_ingest import reset_validators
+from app.selector_cache import selector_plans
+from app.known_posts import known_posts
+from app.parse_pool import PARSE_WORKERS, get_shared_parse_pool
+from app.site_sync import site_changes, touch_site
+from app.snapshots import preview_selectors, reextract_in_background, snapshots
 
 router = APIRouter(
     prefix="/api/sites",
@@ -21,23 +29,71 @@ def get_db():
     finally:
         pass
 
+def load_recent_posts(db: Session, site_ids, per_site: int) -> dict:
+    """
+    Загружает до per_site последних постов для каждого сайта одним запросом
+    (оконная функция row_number по индексу (site_id, published_at)).
+    :return: dict site_id -> список Post (новые первыми)
+    """
+    if not site_ids or per_site <= 0:
+        return {}
+    order = (models.Post.published_at.desc(), models.Post.id.desc())
+    ranked = db.query(
+        models.Post.id.label("id"),
+        func.row_number().over(partition_by=models.Post.site_id, order_by=order).label("rn"),
+    ).filter(models.Post.site_id.in_(list(site_ids))).subquery()
+    posts = db.query(models.Post).join(ranked, models.Post.id == ranked.c.id).filter(
+        ranked.c.rn <= per_site
+    ).order_by(models.Post.site_id, *order).all()
+    posts_by_site = {}
+    for post in posts:
+        posts_by_site.setdefault(post.site_id, []).append(post)
+    return posts_by_site
+
+def site_with_posts(site, posts) -> schemas.SiteWithPosts:
+    """
+    Собирает SiteWithPosts из сайта и заранее загруженных постов,
+    не трогая ленивую связь site.posts.
+    """
+    data = schemas.Site.model_validate(site, from_attributes=True).model_dump()
+    return schemas.SiteWithPosts(**data, posts=[schemas.Post.model_validate(post, from_attributes=True) for post in posts])
+
 @router.get("/", response_model=List[schemas.SiteWithPosts])
-def list_sites(db: Session = Depends(database.get_db)):
+def list_sites(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None),
+    include_posts: bool = True,
+    posts_limit: int = Query(MAX_FEED_ITEMS, ge=0, le=1000),
+    db: Session = Depends(database.get_db),
+):
     """
-    Получить список всех сайтов с вложенными постами.
+    Получить список сайтов с вложенными постами (keyset-пагинация по id).
+    limit: размер страницы
+    after_id: курсор — id последнего сайта предыдущей страницы
+    include_posts: включать ли посты (false — posts всегда пустой)
+    posts_limit: сколько последних постов каждого сайта включать
+    Если есть следующая страница, ее курсор возвращается в заголовке X-Next-Cursor.
     """
-    sites = db.query(models.Site).all()
-    return sites
+    query = db.query(models.Site).order_by(models.Site.id)
+    if after_id is not None:
+        query = query.filter(models.Site.id > after_id)
+    sites = query.limit(limit + 1).all()
+    if len(sites) > limit:
+        sites = sites[:limit]
+        response.headers["X-Next-Cursor"] = str(sites[-1].id)
+    posts_by_site = load_recent_posts(db, [site.id for site in sites], posts_limit) if include_posts else {}
+    return [site_with_posts(site, posts_by_site.get(site.id, [])) for site in sites]
 
 @router.get("/{site_id}", response_model=schemas.SiteWithPosts)
-def get_site(site_id: int, db: Session = Depends(database.get_db)):
+def get_site(site_id: int, posts_limit: int = Query(MAX_FEED_ITEMS, ge=0, le=1000), db: Session = Depends(database.get_db)):
     """
-    Получить конкретный сайт по ID с вложенными постами.
+    Получить конкретный сайт по ID с последними posts_limit постами.
     """
     site = db.query(models.Site).filter(models.Site.id == site_id).first()
     if not site:
         raise HTTPException(status_code=404, detail="Site not found")
-    return site
+    return site_with_posts(site, load_recent_posts(db, [site.id], posts_limit).get(site.id, []))
 
 @router.post("/", response_model=schemas.SiteWithPosts, status_code=status.HTTP_201_CREATED)
 def create_site(site: schemas.SiteCreate, db: Session = Depends(database.get_db)):
@@ -56,14 +112,22 @@ def create_site(site: schemas.SiteCreate, db: Session = Depends(database.get_db)
         title_selector=site.title_selector,
         desc_selector=site.desc_selector,
         link_selector=site.link_selector,
+        parser=site.parser,
+        ingest_mode=site.ingest_mode or "auto",
+        feed_url=str(site.feed_url) if site.feed_url else None,
+        max_page_size=site.max_page_size,
+        incremental_stop_after=site.incremental_stop_after,
         description=site.description,
         is_active=1 if site.is_active else 0,
-        check_interval=site.check_interval if site.check_interval is not None else 10
+        check_interval=site.check_interval if site.check_interval is not None else 10,
+        min_interval=site.min_interval,
+        max_interval=site.max_interval
     )
     db.add(db_site)
     db.commit()
     db.refresh(db_site)
-    return db_site
+    site_changes.site_saved(db_site)
+    return site_with_posts(db_site, [])
 
 @router.put("/{site_id}", response_model=schemas.SiteWithPosts)
 def update_site(site_id: int, site_update: schemas.SiteUpdate, db: Session = Depends(database.get_db)):
@@ -89,15 +153,45 @@ def update_site(site_id: int, site_update: schemas.SiteUpdate, db: Session = Dep
         site.desc_selector = site_update.desc_selector
     if site_update.link_selector is not None:
         site.link_selector = site_update.link_selector
+    if site_update.parser is not None:
+        site.parser = site_update.parser
+    if site_update.ingest_mode is not None:
+        site.ingest_mode = site_update.ingest_mode
+    if site_update.feed_url is not None:
+        site.feed_url = str(site_update.feed_url)
+    if site_update.max_page_size is not None:
+        site.max_page_size = site_update.max_page_size
+    if site_update.incremental_stop_after is not None:
+        site.incremental_stop_after = site_update.incremental_stop_after
     if site_update.description is not None:
         site.description = site_update.description
     if site_update.is_active is not None:
         site.is_active = 1 if site_update.is_active else 0
     if site_update.check_interval is not None:
         site.check_interval = site_update.check_interval
+    if site_update.min_interval is not None:
+        site.min_interval = site_update.min_interval
+    if site_update.max_interval is not None:
+        site.max_interval = site_update.max_interval
+    # Смена URL или селекторов требует полного разбора при следующей проверке
+    if any(getattr(site_update, field) is not None for field in ("url", "selector", "title_selector", "desc_selector", "link_selector", "parser")):
+        site.etag = None
+        site.last_modified = None
+        site.content_digest = None
+    # Смена ленты или режима загрузки: путь выбирается заново при следующей проверке
+    if any(getattr(site_update, field) is not None for field in ("url", "ingest_mode", "feed_url")):
+        if site_update.url is not None and site_update.feed_url is None:
+            site.feed_url = None
+        site.active_ingest = None
+        reset_validators(site)
+    touch_site(site)
     db.commit()
     db.refresh(site)
-    return site
+    feed_cache.invalidate_site(site_id)
+    selector_plans.invalidate_site(site_id)
+    known_posts.invalidate_site(site_id)
+    site_changes.site_saved(site)
+    return site_with_posts(site, load_recent_posts(db, [site.id], MAX_FEED_ITEMS).get(site.id, []))
 
 @router.delete("/{site_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_site(site_id: int, db: Session = Depends(database.get_db)):
@@ -107,37 +201,127 @@ def delete_site(site_id: int, db: Session = Depends(database.get_db)):
     site = db.query(models.Site).filter(models.Site.id == site_id).first()
     if not site:
         raise HTTPException(status_code=404, detail="Site not found")
+    db.query(models.CheckRequest).filter(models.CheckRequest.site_id == site_id).delete(synchronize_session=False)
     db.delete(site)
     db.commit()
+    feed_cache.invalidate_site(site_id)
+    selector_plans.invalidate_site(site_id)
+    known_posts.invalidate_site(site_id)
+    snapshots.delete_site(site_id)
+    site_changes.site_deleted(site_id)
     return None
 
 @router.post("/{site_id}/check", status_code=200)
-def check_site(site_id: int, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
+def check_site(site_id: int, db: Session = Depends(database.get_db)):
     """
-    Принудительно запустить проверку сайта (асинхронно через background task).
+    Поставить ручную проверку сайта в очередь check_requests: ее выполнит процесс
+    с планировщиком (воркер) раньше плановых проверок.
+    Повторные запросы, пока проверка в очереди или выполняется, получают тот же job_id.
+    Статус — GET /api/sites/checks/{job_id}.
     """
     site = db.query(models.Site).filter(models.Site.id == site_id, models.Site.is_active == 1).first()
     if not site:
         raise HTTPException(status_code=404, detail="Site not found or inactive")
-    def do_check():
-        from app.scheduler import check_site as scheduler_check_site
-        from app.scraper import WebScraper
-        scraper = WebScraper()
-        try:
-            scheduler_check_site(site, db, scraper)
-        except Exception:
-            pass  # Ошибки логируются внутри scheduler_check_site
-    background_tasks.add_task(do_check)
-    return {"detail": "Check started"}
+    job, created = submit_check(db, site_id)
+    return {
+        "detail": "Check started" if created else "Check already in progress",
+        "job_id": job.job_id,
+        "status": job.status,
+        "position": queue_position(db, job),
+    }
+
+@router.get("/checks/{job_id}")
+def check_status(job_id: str, db: Session = Depends(database.get_db)):
+    """
+    Статус ручной проверки: позиция в очереди, длительность фаз (queued, fetch, parse, db, total) и итог.
+    """
+    status_info = check_job_status(db, job_id)
+    if status_info is None:
+        raise HTTPException(status_code=404, detail="Check job not found")
+    return status_info
+
+def get_reextract_pool():
+    """Пул разбора для повторного извлечения (None — разбор в потоке запроса)."""
+    return get_shared_parse_pool() if PARSE_WORKERS > 0 else None
+
+@router.get("/{site_id}/snapshots")
+def list_snapshots(site_id: int, db: Session = Depends(database.get_db)):
+    """
+    Сохраненные страницы сайта (от новых к старым), см. SNAPSHOT_KEEP.
+    """
+    if not db.get(models.Site, site_id):
+        raise HTTPException(status_code=404, detail="Site not found")
+    return {"enabled": snapshots.enabled, "snapshots": snapshots.entries(site_id)}
+
+@router.post("/{site_id}/preview")
+def preview_site_selectors(site_id: int, preview: schemas.SelectorPreview, db: Session = Depends(database.get_db)):
+    """
+    Предпросмотр селекторов на сохраненной странице сайта, без загрузки сайта.
+    Не заданные в запросе селекторы берутся из настроек сайта; посты не сохраняются.
+    """
+    site = db.get(models.Site, site_id)
+    if not site:
+        raise HTTPException(status_code=404, detail="Site not found")
+    selectors = {
+        "post_selector": preview.selector,
+        "title_selector": preview.title_selector,
+        "desc_selector": preview.desc_selector,
+        "link_selector": preview.link_selector,
+    }
+    try:
+        found = preview_selectors(site, selectors, preview.parser, preview.snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Extraction failed: {e}")
+    if found is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    snapshot, posts = found
+    hashes = [post["content_hash"] for post in posts if post["content_hash"]]
+    known = {h for (h,) in db.query(models.Post.content_hash).filter(
+        models.Post.site_id == site_id, models.Post.content_hash.in_(hashes))} if hashes else set()
+    return {
+        "snapshot": snapshot.info(),
+        "count": len(posts),
+        "new_count": sum(1 for post in posts if post["content_hash"] not in known),
+        "posts": posts[:preview.limit],
+    }
+
+def schedule_reextract(background_tasks: BackgroundTasks, db: Session, site_ids: list, parse_pool) -> dict:
+    """Ставит повторное извлечение в фоновую задачу (своя сессия поверх engine запроса)."""
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    background_tasks.add_task(reextract_in_background, factory, site_ids, parse_pool)
+    return {"detail": "Re-extraction started", "sites": len(site_ids), "site_ids": site_ids}
+
+@router.post("/{site_id}/reextract", status_code=status.HTTP_202_ACCEPTED)
+def reextract_site(site_id: int, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db),
+                   parse_pool=Depends(get_reextract_pool)):
+    """
+    Извлечь посты из сохраненных страниц сайта текущими селекторами и сохранить новые.
+    Выполняется в фоне после ответа; итог — в логе и в постах сайта.
+    """
+    if not db.get(models.Site, site_id):
+        raise HTTPException(status_code=404, detail="Site not found")
+    return schedule_reextract(background_tasks, db, [site_id], parse_pool)
+
+@router.post("/reextract", status_code=status.HTTP_202_ACCEPTED)
+def reextract_all(background_tasks: BackgroundTasks, site_id: Optional[List[int]] = Query(None),
+                  db: Session = Depends(database.get_db), parse_pool=Depends(get_reextract_pool)):
+    """
+    Пакетное повторное извлечение по сохраненным страницам в фоне: все сайты или перечисленные в site_id.
+    """
+    query = db.query(models.Site.id)
+    if site_id:
+        query = query.filter(models.Site.id.in_(site_id))
+    return schedule_reextract(background_tasks, db, [row_id for (row_id,) in query.order_by(models.Site.id)], parse_pool)
 
 @router.get("/api/stats", tags=["admin"])
 def get_stats(db: Session = Depends(database.get_db)):
     """
-    Получить статистику сервиса (количество сайтов, постов).
+    Получить статистику сервиса (количество сайтов, постов, метрики кеша фидов).
     """
     sites_count = db.query(models.Site).count()
     posts_count = db.query(models.Post).count()
-    return {"sites": sites_count, "posts": posts_count}
+    return {"sites": sites_count, "posts": posts_count, "feed_cache": feed_cache.stats(), "selector_plans": selector_plans.stats(),
+            "known_posts": known_posts.stats(), "site_changes": site_changes.stats(), "snapshots": snapshots.stats()}
 
 @router.get("/api/logs", tags=["admin"])
 def get_logs():
@@ -1,9 +1,14 @@
 """
 Модуль для генерации RSS-фидов.
 """
+import os
+
 # feedgen используется для генерации RSS/Atom
 from feedgen.feed import FeedGenerator
 
+# Количество элементов в фиде по умолчанию (из .env или по умолчанию)
+MAX_FEED_ITEMS = int(os.getenv("MAX_FEED_ITEMS", "50"))
+
 
 class RSSGenerator:
     """
@@ -19,9 +24,10 @@ class RSSGenerator:
         self._items = []
         self._max_items = max_items
 
-    def generate_feed(self) -> str:
+    def generate_feed(self, pretty: bool = True) -> str:
         """
         Генерирует RSS-фид в формате XML.
+        :param pretty: Форматировать XML с отступами
         :return: Строка с RSS XML
         """
         # Добавляем только последние max_items, если лимит задан
@@ -33,11 +39,12 @@ class RSSGenerator:
         self.fg._FeedGenerator__entries = []
         for item in items:
             self._add_entry_to_feed(**item)
-        return self.fg.rss_str(pretty=True).decode("utf-8")
+        return self.fg.rss_str(pretty=pretty).decode("utf-8")
 
-    def generate_atom_feed(self) -> str:
+    def generate_atom_feed(self, pretty: bool = True) -> str:
         """
         Генерирует Atom-фид в формате XML.
+        :param pretty: Форматировать XML с отступами
         :return: Строка с Atom XML
         """
         if self._max_items is not None:
@@ -47,7 +54,7 @@ class RSSGenerator:
         self.fg._FeedGenerator__entries = []
         for item in items:
             self._add_entry_to_feed(**item)
-        return self.fg.atom_str(pretty=True).decode("utf-8")
+        return self.fg.atom_str(pretty=pretty).decode("utf-8")
 
     def set_metadata(self, title: str = None, link: str = None, description: str = None, language: str = None):
         """
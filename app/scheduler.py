@@ -1,31 +1,204 @@
 """
 Task scheduler module for RSSify project.
-Uses APScheduler for background job scheduling.
+Uses APScheduler for background job scheduling and, in "dispatcher" mode,
+a single due-time queue (app.dispatcher) for per-site checks.
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
 import signal
-import threading
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError, as_completed, wait as wait_futures
+
+from app.adaptive import effective_interval, record_check
+from app.check_queue import MANUAL_CHECK_POLL, CheckRequestPoller, run_requested_check
+from app.deadline import CHECK_DEADLINE, CYCLE_BUDGET, Deadline, DeadlineExceeded, deadline_stats
+from app.dispatcher import DISPATCHER_MAX_WORKERS, DueQueueDispatcher
+from app.feed_ingest import (
+    INGEST_AUTO, INGEST_FEED, INGEST_HTML, FeedParseError,
+    can_discover, discover_feed_url, drop_stored_urls, feed_response, ingest_url, iter_feed_posts, uses_feed,
+)
+from app.host_guard import HostGuard, persist_host_states, restore_host_states
+from app.known_posts import known_posts, stop_after_for
+from app.leases import (
+    LEASE_OWNER, LEASE_SECONDS, claim_due_sites, claim_site, hold_local_check, release_local_check, release_site,
+    renew_leases, utcnow
+)
+from app.parse_pool import records_to_posts, site_selectors
+from app.result_writer import pending_site_values, result_writer_for
+from app.site_sync import SITE_SYNC_INTERVAL, SiteChange, SiteReconciler, site_changes
+from app.snapshots import snapshots
+
+# Режим проверок сайтов: "dispatcher" — одна очередь с пулом воркеров,
+# "jobs" — отдельная задача APScheduler на каждый сайт
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "dispatcher")
 
 class TaskScheduler:
     """
     TaskScheduler manages background jobs using APScheduler.
+    In "dispatcher" mode per-site checks go to a DueQueueDispatcher instead
+    of one APScheduler job per site (see schedule_individual_site_checks).
+    Site CRUD changes reach the schedule through sync_site (app.site_sync).
     """
-    def __init__(self):
+    def __init__(self, mode: str = None, max_workers: int = None):
+        """
+        :param mode: "dispatcher" или "jobs" (по умолчанию SCHEDULER_MODE)
+        :param max_workers: размер пула воркеров диспетчера (по умолчанию DISPATCHER_MAX_WORKERS)
+        """
         self.scheduler = BackgroundScheduler()
+        self.mode = mode or SCHEDULER_MODE
+        self.max_workers = max_workers or DISPATCHER_MAX_WORKERS
+        self.dispatcher = None
+        # site_job_factory(site_id, interval) -> job для режима "jobs"
+        self.site_job_factory = None
+        self.reconciler = None
+        self.check_requests = None
+
+    def set_site_check(self, run_check):
+        """
+        Создает диспетчер проверок сайтов (только в режиме "dispatcher").
+        :param run_check: функция run_check(site_id), выполняемая в воркере
+        :return: DueQueueDispatcher
+        """
+        if self.dispatcher is None:
+            self.dispatcher = DueQueueDispatcher(run_check, max_workers=self.max_workers)
+            if self.scheduler.running:
+                self.dispatcher.start()
+        return self.dispatcher
+
+    def sync_site(self, change):
+        """
+        Добавляет, перенастраивает или убирает проверку одного сайта (идемпотентно).
+        Новый сайт ставится по first_check_delay; при смене интервала следующая
+        проверка не откладывается дальше, чем на новый интервал от текущего момента.
+        :param change: app.site_sync.SiteChange
+        :return: "added" / "updated" / "removed" или None, если расписание не изменилось
+        """
+        interval = change.check_interval or 10
+        if self.mode == "dispatcher":
+            if self.dispatcher is None:
+                return None
+            entry = self.dispatcher.entry(change.site_id)
+            if not change.active:
+                if entry is None:
+                    return None
+                self.dispatcher.remove(change.site_id)
+                return "removed"
+            if entry is not None and entry[1] == interval * 60:
+                return None
+            now = self.dispatcher.clock()
+            if entry is None:
+                due = now + first_check_delay(change.site_id, interval, change.next_check_at)
+            else:
+                due = min(entry[0], now + interval * 60)
+            self.dispatcher.schedule(change.site_id, interval * 60, next_due=due)
+            return "added" if entry is None else "updated"
+        job_id = f'check_site_{change.site_id}'
+        job = self.scheduler.get_job(job_id)
+        if not change.active:
+            if job is None:
+                return None
+            self.scheduler.remove_job(job_id)
+            return "removed"
+        if job is not None and job.trigger.interval == timedelta(minutes=interval):
+            return None
+        if self.site_job_factory is None:
+            return None
+        now = datetime.now(timezone.utc)
+        next_run = now + timedelta(seconds=first_check_delay(change.site_id, interval, change.next_check_at))
+        current = getattr(job, 'next_run_time', None)
+        if current is not None:
+            next_run = min(current, now + timedelta(minutes=interval))
+        self.add_job(
+            self.site_job_factory(change.site_id, interval),
+            'interval',
+            minutes=interval,
+            next_run_time=next_run,
+            coalesce=True,
+            id=job_id,
+            replace_existing=True
+        )
+        return "added" if job is None else "updated"
+
+    def watch_sites(self, db_session_factory, sync_interval: int = SITE_SYNC_INTERVAL):
+        """
+        Подписывает планировщик на изменения сайтов (site_changes) и добавляет
+        периодическую сверку по updated_at (SiteReconciler). Вызывать после
+        полной загрузки сайтов — водяной знак ставится на текущий момент.
+        """
+        if self.reconciler is None:
+            self.reconciler = SiteReconciler(db_session_factory, self.sync_site)
+            db = db_session_factory()
+            try:
+                self.reconciler.mark(db)
+            finally:
+                db.close()
+            site_changes.subscribe(self.sync_site)
+        if sync_interval > 0:
+            self.add_job(self.reconciler.run, 'interval', seconds=sync_interval,
+                         id='reconcile_sites', coalesce=True, replace_existing=True)
+
+    def watch_check_requests(self, db_session_factory, scraper, lease_owner=LEASE_OWNER, poll_interval: float = MANUAL_CHECK_POLL):
+        """
+        Забирает ручные проверки из check_requests (app.check_queue) раз в poll_interval
+        секунд. В режиме "dispatcher" задание идет вне очереди (run_now) — раньше
+        наступивших плановых проверок, иначе — разовой задачей APScheduler.
+        :param lease_owner: владелец аренды плановых проверок; ручные идут под "<owner>:manual"
+        """
+        manual_owner = f"{lease_owner}:manual" if lease_owner else None
+
+        def dispatch(request_id, site_id):
+            def call():
+                try:
+                    run_requested_check(request_id, db_session_factory, scraper, lease_owner=manual_owner)
+                finally:
+                    self.check_requests.done(request_id)
+            if self.dispatcher is not None:
+                self.dispatcher.run_now(site_id, call)
+            else:
+                self.add_job(call, 'date', id=f'check_request_{request_id}', replace_existing=True)
+
+        if self.check_requests is None:
+            self.check_requests = CheckRequestPoller(db_session_factory, dispatch)
+        if poll_interval > 0:
+            self.add_job(self.check_requests.run, 'interval', seconds=poll_interval,
+                         id='check_requests', coalesce=True, max_instances=1, replace_existing=True)
 
     def start(self):
         """Start the background scheduler."""
         if not self.scheduler.running:
             self.scheduler.start()
+        if self.dispatcher is not None:
+            self.dispatcher.start()
 
     def shutdown(self, wait=True):
-        """Shutdown the scheduler gracefully."""
+        """
+        Shutdown the scheduler gracefully.
+        With wait=True running site checks are drained first, so their
+        results and next_check_at are stored and not repeated after restart.
+        """
+        site_changes.unsubscribe(self.sync_site)
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown(wait=wait)
         if self.scheduler.running:
             self.scheduler.shutdown(wait=wait)
 
+    def stats(self) -> dict:
+        """
+        Метрики планировщика: режим, число задач APScheduler, метрики диспетчера,
+        счетчики таймаутов проверок и пропусков по бюджету цикла.
+        """
+        return {
+            "mode": self.mode,
+            "jobs": len(self.scheduler.get_jobs()),
+            "dispatcher": self.dispatcher.stats() if self.dispatcher is not None else None,
+            "deadlines": deadline_stats.stats(),
+            "sync": self.reconciler.stats() if self.reconciler is not None else None,
+            "manual": self.check_requests.stats() if self.check_requests is not None else None,
+        }
+
     def add_job(self, func, trigger, **kwargs):
         """
         Add a job to the scheduler.
@@ -49,94 +222,561 @@ class TaskScheduler:
         """
         self.shutdown(wait=wait)
 
-def check_site(site, db_session, scraper, logger=None):
+def conditional_headers(site) -> dict:
+    """
+    Формирует заголовки условного GET по сохраненным валидаторам сайта.
+    :param site: объект Site
+    :return: dict с If-None-Match / If-Modified-Since (может быть пустым)
+    """
+    headers = {}
+    etag = getattr(site, 'etag', None)
+    last_modified = getattr(site, 'last_modified', None)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def page_digest(body) -> str:
+    """
+    Хеш тела страницы (для пропуска разбора неизменившихся страниц).
+    :param body: сырые байты ответа или текст
+    """
+    return hashlib.sha256(body if isinstance(body, bytes) else body.encode("utf-8")).hexdigest()
+
+def size_limit(site) -> dict:
+    """
+    Аргументы загрузки с лимитом размера тела сайта (Site.max_page_size, 0 — без лимита).
+    :return: {"max_bytes": ...} или {}, если у сайта нет своего лимита (действует FETCH_MAX_BYTES)
+    """
+    limit = getattr(site, 'max_page_size', None)
+    return {} if limit is None else {"max_bytes": limit}
+
+def fetch_target(site) -> tuple:
+    """Цель для scraper.fetch_pages: (site.id, URL, условные заголовки[, лимит размера])."""
+    return (site.id, ingest_url(site), conditional_headers(site), *size_limit(site).values())
+
+def save_new_posts(db_session, site_id, posts) -> int:
+    """
+    Сохраняет новые посты сайта: один IN-запрос по content_hash для всего набора
+    и одна пакетная вставка. Для SQLite/PostgreSQL вставка идет через
+    ON CONFLICT DO NOTHING по уникальному индексу (site_id, content_hash),
+    поэтому параллельные проверки одного сайта не создают дубликатов.
+    Коммит выполняет вызывающий код.
+    :param db_session: сессия БД
+    :param site_id: идентификатор сайта
+    :param posts: список словарей от WebScraper.extract_posts
+    :return: количество вставленных постов
+    """
+    return insert_post_rows(db_session, new_post_rows(db_session, site_id, posts))
+
+def new_post_rows(db_session, site_id, posts) -> list:
+    """
+    Строки таблицы posts для постов, чьих content_hash еще нет у сайта
+    (один IN-запрос на весь набор, без записи).
+    """
+    from app.models import Post
+    from app.scraper import compute_content_hash
+    candidates = {}
+    for post in posts:
+        content_hash = post.get('content_hash') or compute_content_hash(post.get('title'), post.get('description'), post.get('url'))
+        if content_hash and content_hash not in candidates:
+            candidates[content_hash] = post
+    if not candidates:
+        return []
+    existing = {
+        content_hash for (content_hash,) in db_session.query(Post.content_hash).filter(
+            Post.site_id == site_id,
+            Post.content_hash.in_(list(candidates)),
+        )
+    }
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return [
+        {
+            "site_id": site_id,
+            "title": post.get('title'),
+            "description": post.get('description'),
+            "url": post.get('url'),
+            "content_hash": content_hash,
+            "published_at": post.get('pub_date') or now,
+            "created_at": now,
+        }
+        for content_hash, post in candidates.items()
+        if content_hash not in existing
+    ]
+
+def insert_post_rows(db_session, rows) -> int:
+    """
+    Пакетная вставка строк new_post_rows (ON CONFLICT DO NOTHING для SQLite/PostgreSQL).
+    :return: количество вставленных постов
+    """
+    from app.models import Post
+    if not rows:
+        return 0
+    dialect = db_session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(Post.__table__).on_conflict_do_nothing(index_elements=["site_id", "content_hash"])
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(Post.__table__).on_conflict_do_nothing(index_elements=["site_id", "content_hash"])
+    else:
+        from sqlalchemy import insert
+        stmt = insert(Post.__table__)
+    return db_session.execute(stmt, rows).rowcount
+
+def skip_reason(site, fetched):
+    """
+    Решает, нужен ли разбор загруженной страницы.
+    :return: ("not_modified" / "unchanged" / None, хеш тела или None при 304)
+    """
+    if fetched.not_modified:
+        return "not_modified", None
+    digest = page_digest(fetched.markup)
+    if digest == getattr(site, 'content_digest', None):
+        return "unchanged", digest
+    return None, digest
+
+def host_guard_of(scraper):
+    """HostGuard движка загрузки скрапера (None, если его нет)."""
+    return getattr(getattr(scraper, 'engine', None), 'host_guard', None)
+
+def ingest_feed(site, fetched, scraper, deadline, known_hashes=None, stop_after: int = 0):
+    """
+    Путь загрузки постов для ответа проверки (app.feed_ingest).
+    Лента сайта (uses_feed) разбирается потоково; если ответ оказался не лентой,
+    в режиме auto сайт переходит на HTML, и страница загружается здесь же.
+    На HTML-странице без известной ленты ищется <link rel="alternate">,
+    и найденная лента сразу загружается вместо разбора страницы.
+    :param known_hashes: известные content_hash сайта (инкрементальный разбор ленты)
+    :param stop_after: после скольких известных записей подряд остановиться (см. stop_after_for)
+    :return: (посты ленты или None — разбирать HTML, ответ, чьи валидаторы и хеш сохранять)
+    :raises FeedParseError: в режиме feed, если ленты нет или она некорректна
+    """
+    mode = getattr(site, 'ingest_mode', None) or INGEST_AUTO
+    if uses_feed(site):
+        try:
+            posts = list(iter_feed_posts(fetched.markup, site.feed_url, known_hashes, stop_after))
+        except FeedParseError as e:
+            if mode == INGEST_FEED:
+                raise
+            print(f"[check_site] site.id={site.id}: {site.feed_url} — {e}; переход на HTML")
+            site.active_ingest = INGEST_HTML
+            page = scraper.fetch(site.url, timeout=deadline.remaining(), **size_limit(site))
+            if page.error is not None:
+                raise page.error
+            return None, page
+        site.active_ingest = INGEST_FEED
+        return posts, fetched
+    if not can_discover(site):
+        site.active_ingest = INGEST_HTML
+        return None, fetched
+    feed_url = discover_feed_url(fetched.text, site.url)
+    if feed_url is None:
+        if mode == INGEST_FEED:
+            raise FeedParseError("No RSS/Atom feed found on the page")
+        site.active_ingest = INGEST_HTML
+        return None, fetched
+    print(f"[check_site] site.id={site.id}: найдена лента {feed_url}")
+    site.feed_url = feed_url
+    feed = fetched if feed_url == site.url else scraper.fetch(feed_url, timeout=deadline.remaining(), **size_limit(site))
+    if feed.error is not None:
+        if mode == INGEST_FEED or isinstance(feed.error, DeadlineExceeded):
+            raise feed.error
+        # Лента будет загружена следующей проверкой, сейчас разбирается страница
+        print(f"[check_site] site.id={site.id}: лента недоступна ({feed.error}), разбор HTML")
+        return None, fetched
+    try:
+        posts = list(iter_feed_posts(feed.markup, feed_url, known_hashes, stop_after))
+    except FeedParseError as e:
+        if mode == INGEST_FEED:
+            raise
+        print(f"[check_site] site.id={site.id}: {feed_url} — {e}; остается HTML")
+        site.active_ingest = INGEST_HTML
+        return None, fetched
+    site.active_ingest = INGEST_FEED
+    return posts, feed
+
+def check_site(site, db_session, scraper, logger=None, fetched=None, parse_pool=None, extracted=None, deadline=None, pending_writes=None):
     """
     Проверяет сайт: скачивает страницу, извлекает посты, возвращает результат.
+    Если у сайта есть RSS/Atom-лента (feed_url или найдена на странице),
+    посты берутся из нее (ingest_feed), иначе — CSS-селекторами из HTML.
+    Страница запрашивается условным GET (ETag / Last-Modified). При ответе 304
+    или совпадении хеша тела с сохраненным разбор и дедупликация пропускаются.
+    error_count сайта сбрасывается при успехе и растет при ошибке (backoff
+    в next_check_time); изменившиеся состояния цепей хостов сохраняются в host_states.
+    Все фазы укладываются в deadline: загрузка отменяется, ожидание разбора
+    прерывается, а при истечении срока до коммита новые посты откатываются.
+    Время следующей проверки сохраняется в site.next_check_at вместе с
+    результатом, поэтому после перезапуска расписание продолжается с того же места.
+    Если для engine сессии запущен поток записи (app.result_writer), посты
+    и поля сайта записываются им одной транзакцией вместе с другими сайтами.
+    Разобранная HTML-страница сохраняется в хранилище страниц (SNAPSHOT_KEEP).
     :param site: объект Site (SQLAlchemy)
     :param db_session: сессия БД для записи результатов
     :param scraper: экземпляр WebScraper
     :param logger: опциональный логгер
-    :return: dict с результатом проверки
+    :param fetched: уже загруженная страница (FetchResult); если не задана — страница скачивается
+    :param parse_pool: ParsePool для разбора в отдельном процессе (по умолчанию — в текущем потоке)
+    :param extracted: Future из parse_pool.submit с уже запущенным разбором fetched
+    :param deadline: срок проверки (app.deadline.Deadline, по умолчанию CHECK_DEADLINE секунд)
+    :param pending_writes: список для Future записи в поток записи — проверка не ждет записи
+                           (прогон check_all_sites дожидается всех в конце); new_posts_count,
+                           сброс кеша фида и окно известных постов обновляются по ее завершении
+    :return: dict с результатом проверки (skipped: "not_modified" / "unchanged" / None,
+             next_check_at — время следующей проверки, naive UTC,
+             timings — длительность фаз fetch / parse / db в секундах)
     """
+    deadline = deadline if deadline is not None else Deadline(CHECK_DEADLINE)
+    writer = result_writer_for(db_session)
+    post_rows = []
+    posts_saved = True
+    written_digest = None
+    started = utcnow()
     print(f"[check_site] START: site.id={site.id}, url={site.url}")
     print(f"[check_site] SELECTORS: post={site.selector}, title={site.title_selector}, desc={site.desc_selector}, link={site.link_selector}")
-    result = {"site_id": site.id, "success": False, "error": None, "posts": []}
+    result = {"site_id": site.id, "success": False, "error": None, "posts": [], "skipped": None}
+    timings = result["timings"] = {}
+    mark = time.monotonic()
     try:
-        html = scraper.fetch_page(site.url)
-        print(f"[check_site] fetch_page OK, type(html)={type(html)}")
-        posts = scraper.extract_posts(
-            html,
-            post_selector=site.selector,
-            title_selector=site.title_selector,
-            desc_selector=site.desc_selector,
-            link_selector=site.link_selector,
-            base_url=site.url
-        )
-        print(f"[check_site] extract_posts OK, posts found: {len(posts)}")
-        # --- Сохранение новых постов в БД ---
-        from app.models import Post
-        from sqlalchemy.exc import IntegrityError
-        new_posts = []
-        for post in posts:
-            exists = db_session.query(Post).filter_by(site_id=site.id, content_hash=post.get('content_hash')).first()
-            if not exists:
-                new_post = Post(
-                    site_id=site.id,
-                    title=post.get('title'),
-                    description=post.get('description'),
-                    url=post.get('url'),
-                    content_hash=post.get('content_hash'),
-                    published_at=post.get('pub_date')  # <-- исправлено с pub_date на published_at
-                )
-                db_session.add(new_post)
-                new_posts.append(new_post)
-        try:
-            db_session.commit()
-            print(f"[check_site] DB commit OK, new_posts: {len(new_posts)}")
-        except IntegrityError as e:
-            db_session.rollback()
-            print(f"[check_site] DB IntegrityError: {e}")
-            if logger:
-                logger.error(f"DB integrity error for site {site.id}: {e}")
-        result["new_posts_count"] = len(new_posts)
-        # --- Обновление last_check и last_error ---
+        if fetched is None:
+            fetched = scraper.fetch(ingest_url(site), headers=conditional_headers(site), timeout=deadline.remaining(),
+                                    **size_limit(site))
+            timings["fetch"] = round(time.monotonic() - mark, 3)
+        else:
+            timings["fetch"] = round(fetched.elapsed, 3)
+        mark = time.monotonic()
+        if fetched.error is not None:
+            raise fetched.error
+        site.checks_count = (getattr(site, 'checks_count', 0) or 0) + 1
+        result["skipped"], digest = skip_reason(site, fetched)
+        if result["skipped"] == "not_modified":
+            site.not_modified_count = (getattr(site, 'not_modified_count', 0) or 0) + 1
+        elif result["skipped"] == "unchanged":
+            site.unchanged_count = (getattr(site, 'unchanged_count', 0) or 0) + 1
+        if result["skipped"]:
+            print(f"[check_site] SKIP ({result['skipped']}): site.id={site.id}")
+            posts = []
+            new_posts_count = 0
+        else:
+            stop_after = stop_after_for(site)
+            known = known_posts.hashes(db_session, site.id) if stop_after and extracted is None else None
+            posts = candidates = None
+            if extracted is None:
+                posts, page = ingest_feed(site, fetched, scraper, deadline, known, stop_after)
+                if page is not fetched:
+                    fetched = page
+                    digest = page_digest(fetched.markup)
+            else:
+                site.active_ingest = INGEST_HTML
+            if posts is not None:
+                print(f"[check_site] feed OK ({site.feed_url}), posts found: {len(posts)}")
+                # Посты, уже собранные из HTML до перехода на ленту, не вставляются повторно
+                candidates = drop_stored_urls(db_session, site.id, posts)
+            else:
+                # Страница остается для повторного извлечения без загрузки (app.snapshots)
+                snapshots.save(site.id, fetched.markup, fetched.url, fetched.encoding, digest)
+                if extracted is None and parse_pool is not None:
+                    extracted = parse_pool.submit(fetched.markup, site_selectors(site), getattr(site, 'parser', None), site.id, known,
+                                                  fetched.encoding, stop_after)
+                if extracted is not None:
+                    try:
+                        posts = records_to_posts(extracted.result(timeout=deadline.remaining()))
+                    except FutureTimeoutError:
+                        extracted.cancel()
+                        raise DeadlineExceeded("parse", deadline.budget)
+                else:
+                    html = scraper.parse_page(fetched.markup, parser=getattr(site, 'parser', None), encoding=fetched.encoding)
+                    print(f"[check_site] fetch_page OK, type(html)={type(html)}")
+                    posts = scraper.extract_posts(
+                        html,
+                        post_selector=site.selector,
+                        title_selector=site.title_selector,
+                        desc_selector=site.desc_selector,
+                        link_selector=site.link_selector,
+                        base_url=site.url,
+                        site_id=site.id,
+                        known_hashes=known,
+                        stop_after=stop_after
+                    )
+                print(f"[check_site] extract_posts OK, posts found: {len(posts)}")
+                candidates = posts
+            timings["parse"] = round(time.monotonic() - mark, 3)
+            mark = time.monotonic()
+            deadline.check("parse")
+            # --- Сохранение новых постов в БД ---
+            from sqlalchemy.exc import IntegrityError
+            if writer is not None:
+                # Посты вставит поток записи в одной транзакции с обновлением сайта;
+                # хеш страницы — только после их записи (written)
+                post_rows = new_post_rows(db_session, site.id, candidates)
+                new_posts_count = len(post_rows)
+                written_digest = digest
+            else:
+                try:
+                    new_posts_count = save_new_posts(db_session, site.id, candidates)
+                    deadline.check("db")
+                    db_session.commit()
+                    print(f"[check_site] DB commit OK, new_posts: {new_posts_count}")
+                except IntegrityError as e:
+                    db_session.rollback()
+                    new_posts_count = 0
+                    posts_saved = False
+                    print(f"[check_site] DB IntegrityError: {e}")
+                    if logger:
+                        logger.error(f"DB integrity error for site {site.id}: {e}")
+                # Хеш страницы запоминается, только если ее посты записаны: иначе
+                # следующие проверки пропускали бы страницу как unchanged
+                if posts_saved:
+                    site.content_digest = digest
+        result["new_posts_count"] = new_posts_count
+        record_check(site, new_posts_count, datetime.now(timezone.utc).replace(tzinfo=None))
+        # --- Обновление валидаторов, last_check и last_error ---
+        if not fetched.not_modified:
+            site.etag = fetched.headers.get("etag")
+            site.last_modified = fetched.headers.get("last-modified")
         site.last_check = datetime.now(timezone.utc)
         site.last_error = None
-        db_session.commit()
+        site.error_count = 0
+        site.next_check_at = result["next_check_at"] = next_check_time(site, started)
+        site_id = site.id
+
+        def written(count):
+            from app.feed_cache import feed_cache
+            result["new_posts_count"] = count
+            if count:
+                feed_cache.invalidate_site(site_id)
+            if written_digest is not None:
+                stored = writer.submit(site_id, values={"content_digest": written_digest})
+                if pending_writes is not None:
+                    pending_writes.append(stored)
+            if posts and posts_saved:
+                known_posts.remember(site_id, [post.get('content_hash') for post in posts])
+
+        if writer is None:
+            commit_check(db_session, site, scraper)
+            written(new_posts_count)
+        elif pending_writes is None:
+            new_posts_count = commit_check(db_session, site, scraper, writer, post_rows, deadline)
+            written(new_posts_count)
+        else:
+            future = commit_check(db_session, site, scraper, writer, post_rows, deadline, pending_writes)
+            future.add_done_callback(lambda done: written_or_failed(done, written, result))
+        if pending_writes is None:
+            # Записанная строка перечитывается: вызывающий код получает загруженный объект сайта
+            db_session.refresh(site)
+        timings["db"] = round(time.monotonic() - mark, 3)
         result["posts"] = posts
         result["success"] = True
-        print(f"[check_site] SUCCESS: site.id={site.id}, posts saved: {len(new_posts)}")
+        print(f"[check_site] SUCCESS: site.id={site_id}, posts saved: {new_posts_count}")
         if logger:
-            logger.info(f"Site {site.id} checked successfully: {len(posts)} posts found.")
+            logger.info(f"Site {site_id} checked successfully: {len(posts)} posts found.")
     except Exception as e:
         result["error"] = str(e)
+        if isinstance(e, DeadlineExceeded):
+            # Незакоммиченные посты не записываются после истечения срока
+            db_session.rollback()
+            deadline_stats.record_timeout(e.phase)
+            result["timeout"] = e.phase
         # --- Обновление last_error при ошибке ---
         site.last_error = str(e)
         site.last_check = datetime.now(timezone.utc)
-        db_session.commit()
+        site.error_count = (getattr(site, 'error_count', 0) or 0) + 1
+        site.next_check_at = result["next_check_at"] = next_check_time(site, started)
+        try:
+            commit_check(db_session, site, scraper, writer, pending_writes=pending_writes)
+        except Exception as commit_error:
+            # Ошибка записи не должна выходить из check_site: проверка уже завершилась ошибкой
+            db_session.rollback()
+            print(f"[check_site] Не удалось записать ошибку site.id={result['site_id']}: {commit_error}")
         print(f"[check_site] ERROR: {e}")
         if logger:
-            logger.error(f"Error checking site {site.id}: {e}")
+            logger.error(f"Error checking site {result['site_id']}: {e}")
     return result
 
-def check_all_sites(db_session, scraper, logger=None):
+def written_or_failed(future, written, result):
+    """Завершение отложенной записи: written(число постов) или ошибка записи в result."""
+    error = future.exception() if not future.cancelled() else DeadlineExceeded("db", None)
+    if error is None:
+        written(future.result())
+    else:
+        result["success"] = False
+        result["error"] = str(error)
+        print(f"[check_site] Ошибка записи site.id={result['site_id']}: {error}")
+
+def commit_check(db_session, site, scraper, writer=None, post_rows=(), deadline=None, pending_writes=None):
+    """
+    Записывает результат проверки сайта вместе с состояниями цепей хостов.
+    Без writer — коммитом сессии вызывающего кода. С writer изменения сайта
+    и post_rows уходят в поток записи, а сессия их отбрасывает (expire)
+    и при следующем обращении перечитает записанную строку.
+    :param deadline: срок ожидания записи; если запись не успела начаться — отменяется
+    :param pending_writes: с writer — не ждать: Future записи добавляется в список и возвращается
+    :return: число вставленных строк post_rows (без writer — 0) или Future (pending_writes)
+    :raises DeadlineExceeded: phase="db", если запись отменена по сроку
+    """
+    guard = host_guard_of(scraper)
+    if writer is None:
+        persist_host_states(db_session, guard)
+        db_session.commit()
+        return 0
+    future = writer.submit(
+        site.id, post_rows, pending_site_values(site),
+        guard.pop_dirty() if isinstance(guard, HostGuard) else ()
+    )
+    db_session.expire(site)
+    if pending_writes is not None:
+        pending_writes.append(future)
+        return future
+    try:
+        return future.result(timeout=deadline.remaining() if deadline is not None else None)
+    except FutureTimeoutError:
+        if future.cancel():
+            raise DeadlineExceeded("db", deadline.budget)
+        return future.result()
+
+def check_priority(site):
+    """
+    Ключ порядка проверки в прогоне: сначала самые просроченные сайты
+    (по next_check_at, затем last_check; никогда не проверенные — первыми).
+    """
+    due = getattr(site, 'next_check_at', None) or getattr(site, 'last_check', None)
+    if due is None:
+        return (0, datetime.min, site.id)
+    return (1, due.replace(tzinfo=None), site.id)
+
+def check_all_sites(db_session, scraper, logger=None, parse_pool=None, lease_owner=None, budget=None):
     """
     Проверяет все активные сайты из базы данных.
+    Страницы загружаются параллельно (scraper.fetch_pages), а разбор и запись
+    в БД выполняются по мере готовности каждой страницы, поэтому время
+    прогона близко к времени самого медленного сайта. С parse_pool разбор
+    идет в процессах пула одновременно с загрузкой остальных страниц,
+    а запись в БД — в текущем потоке по мере готовности разбора. Если для
+    сессии запущен поток записи (app.result_writer), результаты и освобождение
+    аренд ставятся в его очередь без ожидания (пакетами с другими сайтами),
+    а прогон дожидается всех записей в конце.
+    Загрузки отправляются в порядке check_priority. Когда общий бюджет
+    исчерпан, незавершенные загрузки отменяются, а их сайты пропускаются
+    (skipped="budget") и первыми попадают в следующий прогон.
     :param db_session: сессия БД
     :param scraper: экземпляр WebScraper
     :param logger: опциональный логгер
-    :return: список результатов по сайтам
+    :param parse_pool: опциональный ParsePool
+    :param lease_owner: если задан — проверяются только сайты, чью аренду удалось взять
+                        (время проверки наступило), после проверки аренда освобождается,
+                        а аренда еще не проверенных сайтов продлевается по ходу прогона;
+                        без него пропускаются сайты, которые проверяет другой поток процесса
+    :param budget: бюджет прогона в секундах (по умолчанию CYCLE_BUDGET, 0 — без ограничения)
+    :return: список результатов по сайтам (в порядке завершения)
     """
     from app.models import Site
     results = []
-    sites = db_session.query(Site).filter_by(is_active=True).all()
-    for site in sites:
-        result = check_site(site, db_session, scraper, logger)
+    started_at = utcnow()
+    if lease_owner is None:
+        # Сайты, которые сейчас проверяет другой поток процесса (ручная проверка), ждут следующего прогона
+        sites = [site for site in db_session.query(Site).filter_by(is_active=True).all() if hold_local_check(site.id)]
+    else:
+        claimed = claim_due_sites(db_session, lease_owner, limit=db_session.query(Site).count() or 1, now=started_at)
+        sites = db_session.query(Site).filter(Site.id.in_(claimed)).all() if claimed else []
+    sites.sort(key=check_priority)
+    sites_by_id = {site.id: site for site in sites}
+    cycle = Deadline(CYCLE_BUDGET if budget is None else budget)
+    started = time.monotonic()
+    slowest_fetch = 0.0
+    skipped = 0
+    pending = {}
+    writes = [] if result_writer_for(db_session) is not None else None
+    held = set(sites_by_id) if lease_owner is None else set()
+    # Сайты под арендой прогона, еще не получившие результат (их аренда продлевается)
+    leased = set(sites_by_id) if lease_owner is not None else set()
+    renewed_at = time.monotonic()
+
+    def keep_leases():
+        nonlocal renewed_at
+        # Прогон может идти дольше LEASE_SECONDS: аренда продлевается с запасом в половину срока
+        if leased and time.monotonic() - renewed_at >= LEASE_SECONDS / 2:
+            renewed_at = time.monotonic()
+            renew_leases(db_session, leased, lease_owner, pending_writes=writes)
+
+    def unhold(site_id):
+        if site_id in held:
+            held.discard(site_id)
+            release_local_check(site_id)
+
+    def done(result):
         results.append(result)
+        if lease_owner is None:
+            unhold(result["site_id"])
+        else:
+            leased.discard(result["site_id"])
+            # Сайт после записи через поток отброшен из сессии: время — из результата
+            release_site(db_session, result["site_id"], lease_owner, result.get("next_check_at"), writes)
+
+    def skip(site):
+        nonlocal skipped
+        skipped += 1
+        results.append({"site_id": site.id, "success": False, "error": None, "posts": [], "skipped": "budget"})
+        if lease_owner is None:
+            unhold(site.id)
+        else:
+            leased.discard(site.id)
+            release_site(db_session, site.id, lease_owner, None, writes)
+
+    def finish(futures):
+        for future in futures:
+            site, fetched, deadline = pending.pop(future)
+            done(check_site(site, db_session, scraper, logger, fetched=fetched, extracted=future, deadline=deadline,
+                            pending_writes=writes))
+            keep_leases()
+
+    try:
+        fetches = scraper.fetch_pages(
+            (fetch_target(site) for site in sites),
+            timeout=CHECK_DEADLINE or None, deadline=cycle
+        )
+        for fetched in fetches:
+            slowest_fetch = max(slowest_fetch, fetched.elapsed)
+            site = sites_by_id[fetched.key]
+            if isinstance(fetched.error, DeadlineExceeded) and fetched.error.phase == "cycle":
+                skip(site)
+                continue
+            # Срок проверки — CHECK_DEADLINE с момента отправки запроса, но не позже конца прогона
+            deadline = cycle.child(max(0.0, CHECK_DEADLINE - fetched.elapsed) if CHECK_DEADLINE else None)
+            # Ленты разбираются в check_site, HTML — в пуле
+            if parse_pool is not None and fetched.error is None and skip_reason(site, fetched)[0] is None \
+                    and not feed_response(site, fetched):
+                stop_after = stop_after_for(site)
+                known = known_posts.hashes(db_session, site.id) if stop_after else None
+                future = parse_pool.submit(fetched.markup, site_selectors(site), getattr(site, 'parser', None), site.id, known,
+                                           fetched.encoding, stop_after)
+                pending[future] = (site, fetched, deadline)
+            else:
+                done(check_site(site, db_session, scraper, logger, fetched=fetched, deadline=deadline, pending_writes=writes))
+            finish([future for future in pending if future.done()])
+            keep_leases()
+        # Ожидание каждого разбора ограничено сроком его проверки (check_site)
+        finish(list(pending))
+        if writes:
+            # Ошибки записи уже отражены в результатах (written_or_failed)
+            wait_futures(writes)
+            db_session.commit()
+    finally:
+        for site_id in list(held):
+            unhold(site_id)
+    deadline_stats.record_cycle(skipped)
+    elapsed = time.monotonic() - started
+    msg = f"[check_all_sites] {len(results) - skipped} sites checked in {elapsed:.2f}s (slowest fetch {slowest_fetch:.2f}s)"
+    if skipped:
+        msg += f", {skipped} skipped: cycle budget {cycle.budget:.0f}s exhausted"
+    print(msg)
+    if logger:
+        logger.info(msg)
     return results
 
 # --- Периодический запуск check_all_sites ---
-def schedule_periodic_check_all_sites(scheduler: TaskScheduler, db_session_factory, scraper, logger=None, interval_minutes=10):
+def schedule_periodic_check_all_sites(scheduler: TaskScheduler, db_session_factory, scraper, logger=None, interval_minutes=10, parse_pool=None, lease_owner=LEASE_OWNER):
     """
     Добавляет периодическую задачу проверки всех сайтов в планировщик.
     :param scheduler: экземпляр TaskScheduler
@@ -144,51 +784,179 @@ def schedule_periodic_check_all_sites(scheduler: TaskScheduler, db_session_facto
     :param scraper: экземпляр WebScraper
     :param logger: опциональный логгер
     :param interval_minutes: интервал в минутах
+    :param parse_pool: опциональный ParsePool для разбора страниц в процессах
+    :param lease_owner: владелец аренды проверок (None — без аренды, см. app.leases)
+    Бюджет прогона — CYCLE_BUDGET или 90% интервала, чтобы прогон не наезжал на следующий.
     """
+    budget = CYCLE_BUDGET or interval_minutes * 60 * 0.9
     def job():
         db = db_session_factory()
         try:
-            check_all_sites(db, scraper, logger)
+            check_all_sites(db, scraper, logger, parse_pool, lease_owner, budget=budget)
         finally:
             db.close()
     scheduler.add_job(job, 'interval', minutes=interval_minutes, id='check_all_sites')
 
-def schedule_individual_site_checks(scheduler: TaskScheduler, db_session_factory, scraper, logger=None):
+def next_check_time(site, now: datetime = None) -> datetime:
+    """
+    Время следующей плановой проверки сайта (naive UTC): check_interval
+    или выученный интервал в режиме ADAPTIVE_POLLING (app.adaptive).
+    После ошибок подряд интервал растет экспоненциально (get_backoff_delay).
+    """
+    interval = effective_interval(site)
+    error_count = getattr(site, 'error_count', 0) or 0
+    if error_count > 0:
+        interval = max(interval, get_backoff_delay(error_count, base=interval))
+    return (now or utcnow()) + timedelta(minutes=interval)
+
+def run_site_check(site_id, db_session_factory, scraper, logger=None, parse_pool=None, lease_owner=None, force=False,
+                   unchecked_since=None):
+    """
+    Проверяет один сайт в собственной сессии БД.
+    С lease_owner проверка выполняется, только если удалось взять аренду
+    (app.leases.claim_site); после проверки аренда освобождается
+    и назначается next_check_at. force — не ждать next_check_at (ручная проверка),
+    unchecked_since — не брать аренду сайта, проверенного после этого момента.
+    Проверки одного сайта в этом процессе (плановая, ручная, прогон
+    check_all_sites) не идут одновременно и без аренды (hold_local_check).
+    :return: результат check_site (skipped="leased", если сайт проверяет другой процесс
+             или поток этого процесса, или его время еще не наступило) или None,
+             если сайт удален или неактивен; next_check_at в результате — когда сайт проверять снова
+    """
+    from app.models import Site
+    db_local = db_session_factory()
+    try:
+        site_obj = db_local.get(Site, site_id)
+        if site_obj is None or not site_obj.is_active:
+            return None
+        if not hold_local_check(site_id):
+            print(f"[scheduler] SKIP (in progress): site.id={site_id}")
+            return {"site_id": site_id, "success": True, "error": None, "posts": [], "skipped": "leased",
+                    "next_check_at": None}
+        try:
+            started = utcnow()
+            if lease_owner is None:
+                return check_site(site_obj, db_local, scraper, logger, parse_pool=parse_pool)
+            if not claim_site(db_local, site_id, lease_owner, now=started, force=force, unchecked_since=unchecked_since):
+                db_local.refresh(site_obj)
+                busy_until = [t for t in (site_obj.next_check_at, site_obj.lease_until) if t is not None]
+                print(f"[scheduler] SKIP (leased): site.id={site_id}, owner={site_obj.lease_owner}")
+                return {"site_id": site_id, "success": True, "error": None, "posts": [], "skipped": "leased",
+                        "next_check_at": max(busy_until) if busy_until else None}
+            try:
+                result = check_site(site_obj, db_local, scraper, logger, parse_pool=parse_pool)
+            finally:
+                next_at = next_check_time(site_obj, started)
+                release_site(db_local, site_id, lease_owner, next_at)
+            result["next_check_at"] = next_at
+            return result
+        finally:
+            release_local_check(site_id)
+    finally:
+        db_local.close()
+
+def jitter_offset(site_id: int, interval_sec: float) -> float:
+    """
+    Детерминированное смещение первой проверки внутри интервала (секунды):
+    одинаково при каждом запуске и на каждом узле, но разное у разных сайтов.
+    """
+    digest = hashlib.sha1(f"site:{site_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32 * interval_sec
+
+def first_check_delay(site_id: int, interval_minutes, next_check_at: datetime = None, now: datetime = None) -> float:
+    """
+    Через сколько секунд после запуска процесса проверить сайт впервые.
+    Сохраненный next_check_at продолжает расписание с прежнего места
+    (просроченные — сразу, их параллельность ограничивает пул проверок);
+    сайты без него (новые или после миграции) распределяются по интервалу
+    через jitter_offset, а не срабатывают все на одном тике.
+    """
+    if next_check_at is not None:
+        return max(0.0, (next_check_at - (now or utcnow())).total_seconds())
+    return jitter_offset(site_id, (interval_minutes or 10) * 60)
+
+def schedule_individual_site_checks(scheduler: TaskScheduler, db_session_factory, scraper, logger=None, parse_pool=None, lease_owner=LEASE_OWNER):
     """
     Добавляет индивидуальные задачи проверки для каждого активного сайта с учетом их интервала.
+    В режиме "dispatcher" сайты ставятся в очередь DueQueueDispatcher
+    (загружаются только id, check_interval и next_check_at), иначе — по задаче APScheduler на сайт.
+    Первая проверка назначается по first_check_delay. Дальше расписание
+    следит за изменениями сайтов (TaskScheduler.watch_sites), а ручные
+    проверки из API забираются из check_requests (TaskScheduler.watch_check_requests).
     :param scheduler: экземпляр TaskScheduler
     :param db_session_factory: функция для создания новой сессии БД
     :param scraper: экземпляр WebScraper
     :param logger: опциональный логгер
+    :param parse_pool: опциональный ParsePool для разбора страниц в процессах
+    :param lease_owner: владелец аренды проверок (None — без аренды, см. app.leases)
     """
     db = db_session_factory()
+    try:
+        restore_host_states(db, host_guard_of(scraper))
+    finally:
+        db.close()
+    if scheduler.mode == "dispatcher":
+        schedule_dispatcher_site_checks(scheduler, db_session_factory, scraper, logger, parse_pool, lease_owner)
+        scheduler.watch_sites(db_session_factory)
+        scheduler.watch_check_requests(db_session_factory, scraper, lease_owner)
+        return
+    def make_job(site_id, interval):
+        def job():
+            msg = f"[scheduler] Scheduled check for site.id={site_id} (interval={interval} min)"
+            print(msg)
+            if logger:
+                logger.info(msg)
+            if run_site_check(site_id, db_session_factory, scraper, logger, parse_pool, lease_owner) is None:
+                scheduler.sync_site(SiteChange(site_id))  # сайт удален или выключен
+        return job
+    scheduler.site_job_factory = make_job
+    db = db_session_factory()
     try:
         from app.models import Site
-        sites = db.query(Site).filter_by(is_active=True).all()
-        for site in sites:
-            interval = getattr(site, 'check_interval', 10)  # default 10 min
-            def make_job(site_id, interval):
-                def job():
-                    msg = f"[scheduler] Scheduled check for site.id={site_id} (interval={interval} min)"
-                    print(msg)
-                    if logger:
-                        logger.info(msg)
-                    db_local = db_session_factory()
-                    try:
-                        site_obj = db_local.query(Site).get(site_id)
-                        check_site(site_obj, db_local, scraper, logger)
-                    finally:
-                        db_local.close()
-                return job
-            scheduler.add_job(
-                make_job(site.id, interval),
-                'interval',
-                minutes=interval,
-                id=f'check_site_{site.id}',
-                replace_existing=True
-            )
+        for site in db.query(Site).filter_by(is_active=True).all():
+            scheduler.sync_site(SiteChange.from_site(site))
     finally:
         db.close()
+    scheduler.watch_sites(db_session_factory)
+    scheduler.watch_check_requests(db_session_factory, scraper, lease_owner)
+
+def schedule_dispatcher_site_checks(scheduler: TaskScheduler, db_session_factory, scraper, logger=None, parse_pool=None, lease_owner=LEASE_OWNER):
+    """
+    Ставит все активные сайты в очередь диспетчера планировщика.
+    Первая проверка — по сохраненному next_check_at или со смещением
+    jitter_offset внутри интервала (first_check_delay).
+    Следующий запуск выравнивается по next_check_at из результата проверки
+    (адаптивный интервал; с арендой — срок из БД, поэтому сайт, проверенный
+    другим процессом, не запрашивается повторно раньше срока).
+    :return: количество запланированных сайтов
+    """
+    dispatcher = scheduler.dispatcher
+    if dispatcher is None:
+        def run_check(site_id):
+            result = run_site_check(site_id, db_session_factory, scraper, logger, parse_pool, lease_owner)
+            if result is None:
+                dispatcher.remove(site_id)
+            elif result.get("next_check_at") is not None:
+                dispatcher.defer(site_id, (result["next_check_at"] - utcnow()).total_seconds())
+        dispatcher = scheduler.set_site_check(run_check)
+    db = db_session_factory()
+    try:
+        from app.models import Site
+        rows = db.query(Site.id, Site.check_interval, Site.next_check_at).filter(Site.is_active == 1).all()
+    finally:
+        db.close()
+    now, clock_now = utcnow(), dispatcher.clock()
+    resumed = 0
+    for site_id, interval, next_check_at in rows:
+        resumed += next_check_at is not None
+        dispatcher.schedule(site_id, (interval or 10) * 60,
+                            next_due=clock_now + first_check_delay(site_id, interval, next_check_at, now))
+    msg = (f"[scheduler] Dispatcher: {len(rows)} sites scheduled ({resumed} resumed from next_check_at), "
+           f"max_workers={dispatcher.max_workers}")
+    print(msg)
+    if logger:
+        logger.info(msg)
+    return len(rows)
 
 def get_backoff_delay(error_count, base=10, max_delay=180):
     """
@@ -205,6 +973,7 @@ def get_backoff_delay(error_count, base=10, max_delay=180):
 def schedule_individual_site_checks_with_backoff(scheduler: TaskScheduler, db_session_factory, scraper, logger=None):
     """
     Добавляет задачи проверки для каждого сайта с поддержкой exponential backoff при ошибках.
+    Счетчик ошибок подряд (site.error_count) ведет check_site.
     """
     db = db_session_factory()
     try:
@@ -215,16 +984,12 @@ def schedule_individual_site_checks_with_backoff(scheduler: TaskScheduler, db_se
                 def job():
                     db_local = db_session_factory()
                     try:
-                        site_obj = db_local.query(Site).get(site_id)
-                        # Подсчет ошибок (например, site.error_count)
-                        error_count = getattr(site_obj, 'error_count', 0)
-                        result = check_site(site_obj, db_local, scraper, logger)
-                        if result.get('success'):
-                            site_obj.error_count = 0
-                        else:
-                            site_obj.error_count = error_count + 1
-                        db_local.commit()
-                        delay = get_backoff_delay(site_obj.error_count)
+                        site_obj = db_local.get(Site, site_id)
+                        if site_obj is None:
+                            return
+                        check_site(site_obj, db_local, scraper, logger)
+                        interval = getattr(site_obj, 'check_interval', 10) or 10
+                        delay = max(interval, get_backoff_delay(site_obj.error_count, base=interval))
                         # Переназначить задачу с новым интервалом
                         scheduler.add_job(
                             make_job(site_id),
@@ -236,50 +1001,34 @@ def schedule_individual_site_checks_with_backoff(scheduler: TaskScheduler, db_se
                     finally:
                         db_local.close()
                 return job
-            # Начальный запуск с обычным интервалом
+            # Начальный запуск с обычным интервалом (первый — по first_check_delay)
             interval = getattr(site, 'check_interval', 10)
+            delay = first_check_delay(site.id, interval, site.next_check_at)
             scheduler.add_job(
                 make_job(site.id),
                 'interval',
                 minutes=interval,
+                next_run_time=datetime.now(timezone.utc) + timedelta(seconds=delay),
                 id=f'check_site_{site.id}',
                 replace_existing=True
             )
     finally:
         db.close()
 
-def run_with_timeout(func, timeout_sec, *args, **kwargs):
-    """
-    Запускает функцию с таймаутом. Если функция не завершилась за timeout_sec, выбрасывает TimeoutError.
-    Работает в отдельном потоке, безопасно для I/O-bound задач.
-    """
-    result = {}
-    def target():
-        try:
-            result['value'] = func(*args, **kwargs)
-        except Exception as e:
-            result['error'] = e
-    thread = threading.Thread(target=target)
-    thread.start()
-    thread.join(timeout_sec)
-    if thread.is_alive():
-        raise TimeoutError(f"Task exceeded {timeout_sec} seconds")
-    if 'error' in result:
-        raise result['error']
-    return result.get('value')
-
 # --- Пример использования в планировщике ---
 def schedule_site_check_with_timeout(scheduler: TaskScheduler, db_session_factory, scraper, logger=None, timeout_sec=60):
     """
     Добавляет задачу проверки всех сайтов с ограничением по времени выполнения.
+    По истечении timeout_sec незавершенные загрузки отменяются, а оставшиеся
+    сайты пропускаются до следующего прогона (бюджет check_all_sites).
     """
     def job():
         db = db_session_factory()
         try:
-            run_with_timeout(lambda: check_all_sites(db, scraper, logger), timeout_sec)
-        except TimeoutError as e:
-            if logger:
-                logger.error(f"Site check timeout: {e}")
+            results = check_all_sites(db, scraper, logger, budget=timeout_sec)
+            skipped = sum(1 for result in results if result.get("skipped") == "budget")
+            if skipped and logger:
+                logger.error(f"Site check timeout: {skipped} sites skipped after {timeout_sec} seconds")
         finally:
             db.close()
     scheduler.add_job(job, 'interval', minutes=10, id='check_all_sites_with_timeout', replace_existing=True)
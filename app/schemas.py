@@ -4,6 +4,8 @@ Pydantic schemas for RSSify project.
 from pydantic import BaseModel, HttpUrl, Field, validator, field_validator
 from typing import Optional, Any, List
 from datetime import datetime
+from app.feed_ingest import INGEST_MODES
+from app.parsers import PARSER_NAMES
 
 class SiteBase(BaseModel):
     """
@@ -11,6 +13,12 @@ class SiteBase(BaseModel):
     name: Название сайта
     url: URL сайта (валидируется как HttpUrl)
     selector: CSS-селектор для поиска постов
+    parser: Бэкенд разбора HTML ("html.parser", "lxml", "selectolax"; опционально)
+    ingest_mode: Загрузка постов: "auto" (лента, если есть, иначе HTML), "feed" или "html"
+    feed_url: URL RSS/Atom-ленты (опционально; в режиме auto ищется на странице)
+    max_page_size: Лимит размера страницы в байтах (None — FETCH_MAX_BYTES, 0 — без лимита)
+    incremental_stop_after: Прекращать разбор после стольких известных постов подряд
+        (None — INCREMENTAL_STOP_AFTER, 0 — всегда вся страница)
     description: Описание сайта (опционально)
     is_active: Флаг активности сайта
     """
@@ -20,9 +28,16 @@ class SiteBase(BaseModel):
     title_selector: Optional[str] = Field(None, max_length=256)
     desc_selector: Optional[str] = Field(None, max_length=256)
     link_selector: Optional[str] = Field(None, max_length=256)
+    parser: Optional[str] = None
+    ingest_mode: Optional[str] = "auto"
+    feed_url: Optional[HttpUrl] = None
+    max_page_size: Optional[int] = Field(None, ge=0)
+    incremental_stop_after: Optional[int] = Field(None, ge=0)
     description: Optional[str] = None
     is_active: Optional[bool] = True
     check_interval: Optional[int] = 10  # Интервал проверки в минутах
+    min_interval: Optional[int] = Field(None, ge=1)  # Границы адаптивного интервала (минуты)
+    max_interval: Optional[int] = Field(None, ge=1)
     last_check: Optional[datetime] = None
     last_error: Optional[str] = None
 
@@ -40,6 +55,20 @@ class SiteBase(BaseModel):
             raise ValueError("Selector must be 1-256 characters long")
         return v
 
+    @field_validator("parser")
+    @classmethod
+    def parser_name(cls, v):
+        if v is not None and v not in PARSER_NAMES:
+            raise ValueError(f"Parser must be one of: {', '.join(PARSER_NAMES)}")
+        return v
+
+    @field_validator("ingest_mode")
+    @classmethod
+    def ingest_mode_name(cls, v):
+        if v is not None and v not in INGEST_MODES:
+            raise ValueError(f"Ingest mode must be one of: {', '.join(INGEST_MODES)}")
+        return v
+
 class SiteCreate(SiteBase):
     """
     Схема для создания нового сайта (наследует все поля SiteBase).
@@ -52,6 +81,11 @@ class SiteUpdate(BaseModel):
     name: Новое название сайта
     url: Новый URL сайта
     selector: Новый CSS-селектор
+    parser: Новый бэкенд разбора HTML
+    ingest_mode: Новый режим загрузки постов ("auto", "feed", "html")
+    feed_url: Новый URL RSS/Atom-ленты
+    max_page_size: Новый лимит размера страницы в байтах
+    incremental_stop_after: Новый порог инкрементального разбора
     description: Новое описание
     is_active: Новый флаг активности
     """
@@ -61,9 +95,30 @@ class SiteUpdate(BaseModel):
     title_selector: Optional[str] = Field(None, max_length=256)
     desc_selector: Optional[str] = Field(None, max_length=256)
     link_selector: Optional[str] = Field(None, max_length=256)
+    parser: Optional[str] = None
+    ingest_mode: Optional[str] = None
+    feed_url: Optional[HttpUrl] = None
+    max_page_size: Optional[int] = Field(None, ge=0)
+    incremental_stop_after: Optional[int] = Field(None, ge=0)
     description: Optional[str] = None
     is_active: Optional[bool] = None
     check_interval: Optional[int] = None
+    min_interval: Optional[int] = Field(None, ge=1)
+    max_interval: Optional[int] = Field(None, ge=1)
+
+    @field_validator("parser")
+    @classmethod
+    def parser_name(cls, v):
+        if v is not None and v not in PARSER_NAMES:
+            raise ValueError(f"Parser must be one of: {', '.join(PARSER_NAMES)}")
+        return v
+
+    @field_validator("ingest_mode")
+    @classmethod
+    def ingest_mode_name(cls, v):
+        if v is not None and v not in INGEST_MODES:
+            raise ValueError(f"Ingest mode must be one of: {', '.join(INGEST_MODES)}")
+        return v
 
 class PostBase(BaseModel):
     """
@@ -101,13 +156,66 @@ class Post(PostBase):
     class Config:
         orm_mode = True
 
-class SiteWithPosts(SiteBase):
+class Site(SiteBase):
     """
-    Схема сайта с вложенными постами (для вложенного отображения).
-    posts: Список постов, связанных с сайтом
+    Схема сайта для возврата из БД (без постов).
+    id: Идентификатор сайта
+    checks_count: Количество успешных загрузок страницы
+    not_modified_count: Сколько из них завершились ответом 304 (разбор пропущен)
+    unchanged_count: Сколько раз тело страницы не изменилось (разбор пропущен)
+    next_check_at: Время следующей плановой проверки (UTC)
+    lease_owner: Процесс, который сейчас проверяет сайт
+    lease_until: Время истечения аренды проверки (UTC)
+    adaptive_interval: Выученный интервал проверки (минуты)
+    avg_change_gap: Средний интервал между изменениями (минуты)
+    change_count: Сколько проверок нашли новые посты
+    last_change_at: Когда проверка последний раз нашла новые посты (UTC)
+    active_ingest: Каким путем загружались посты при последней проверке ("feed" / "html")
     """
     id: int
+    checks_count: Optional[int] = 0
+    not_modified_count: Optional[int] = 0
+    unchanged_count: Optional[int] = 0
+    next_check_at: Optional[datetime] = None
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    adaptive_interval: Optional[float] = None
+    avg_change_gap: Optional[float] = None
+    change_count: Optional[int] = 0
+    last_change_at: Optional[datetime] = None
+    active_ingest: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class SiteWithPosts(Site):
+    """
+    Схема сайта с вложенными постами (для вложенного отображения).
+    posts: Последние посты сайта (новые первыми)
+    """
     posts: List[Post] = []
 
     class Config:
         orm_mode = True
+
+class SelectorPreview(BaseModel):
+    """
+    Запрос предпросмотра селекторов по сохраненной странице сайта.
+    Не заданные селекторы и parser берутся из настроек сайта.
+    snapshot: хеш сохраненной страницы (по умолчанию последняя)
+    limit: сколько постов вернуть
+    """
+    selector: Optional[str] = Field(None, max_length=256)
+    title_selector: Optional[str] = Field(None, max_length=256)
+    desc_selector: Optional[str] = Field(None, max_length=256)
+    link_selector: Optional[str] = Field(None, max_length=256)
+    parser: Optional[str] = None
+    snapshot: Optional[str] = Field(None, max_length=64)
+    limit: Optional[int] = Field(20, ge=1, le=1000)
+
+    @field_validator("parser")
+    @classmethod
+    def parser_name(cls, v):
+        if v is not None and v not in PARSER_NAMES:
+            raise ValueError(f"Parser must be one of: {', '.join(PARSER_NAMES)}")
+        return v
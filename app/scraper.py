@@ -2,88 +2,224 @@
 Базовый модуль для веб-скрапинга.
 """
 
-import requests
 from bs4 import BeautifulSoup
 import hashlib
+import os
+import threading
 from urllib.parse import urljoin
 
+from app.fetch_engine import AsyncFetchEngine
+from app.known_posts import INCREMENTAL_STOP_AFTER
+from app.parsers import DEFAULT_PARSER, FALLBACK_PARSER, ExtractionPlan, ParsedPage, get_backend
+from app.selector_cache import selector_plans
+
+# Лимиты параллельной загрузки и пула соединений (из .env или по умолчанию)
+FETCH_MAX_CONCURRENCY = int(os.getenv("FETCH_MAX_CONCURRENCY", "50"))
+FETCH_PER_HOST_CONCURRENCY = int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "4"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "200"))
+FETCH_MAX_KEEPALIVE = int(os.getenv("FETCH_MAX_KEEPALIVE", "100"))
+FETCH_HTTP2 = os.getenv("FETCH_HTTP2", "0") == "1"
+
+def compute_content_hash(title=None, description=None, url=None):
+    """
+    Хеш поста для дедупликации (по title+description+url).
+    :return: hex-строка SHA-256 или None, если все поля пустые
+    """
+    hash_input = (title or "") + (description or "") + (url or "")
+    return hashlib.sha256(hash_input.encode("utf-8")).hexdigest() if hash_input else None
+
 class WebScraper:
     """
     Класс для базового веб-скрапинга страниц.
+    Держит долгоживущий HTTP-клиент с пулом соединений: один экземпляр
+    рассчитан на совместное использование планировщиком и API
+    (см. get_shared_scraper) и должен закрываться через close().
     """
-    def __init__(self, user_agent: str = None, timeout: int = 10):
+    def __init__(self, user_agent: str = None, timeout: int = 10, max_concurrency: int = None, per_host_concurrency: int = None, http2: bool = None, transport=None, parser: str = None):
         """
         :param user_agent: User-Agent для HTTP-запросов
         :param timeout: Таймаут для запросов (секунды)
+        :param max_concurrency: Общий лимит параллельных загрузок в fetch_pages
+        :param per_host_concurrency: Лимит параллельных загрузок на один хост
+        :param http2: Включить HTTP/2 (по умолчанию из FETCH_HTTP2)
+        :param transport: Опциональный httpx-транспорт для асинхронного движка (для тестов)
+        :param parser: Бэкенд разбора HTML по умолчанию (см. app.parsers, по умолчанию SCRAPER_PARSER)
         """
         self.user_agent = user_agent or "Mozilla/5.0 (compatible; RSSifyBot/1.0)"
         self.timeout = timeout
+        self.parser = parser or DEFAULT_PARSER
+        self.engine = AsyncFetchEngine(
+            self.user_agent,
+            timeout=timeout,
+            max_concurrency=max_concurrency or FETCH_MAX_CONCURRENCY,
+            per_host_concurrency=per_host_concurrency or FETCH_PER_HOST_CONCURRENCY,
+            max_connections=FETCH_MAX_CONNECTIONS,
+            max_keepalive_connections=FETCH_MAX_KEEPALIVE,
+            http2=FETCH_HTTP2 if http2 is None else http2,
+            transport=transport,
+        )
+
+    def start(self):
+        """Открывает HTTP-клиент заранее (иначе он откроется при первом запросе)."""
+        self.engine.start()
 
-    def fetch_page(self, url: str) -> BeautifulSoup:
+    def close(self):
+        """Закрывает HTTP-клиент и все соединения пула."""
+        self.engine.close()
+
+    def fetch_page(self, url: str, parser: str = None) -> ParsedPage:
         """
-        Загружает страницу по URL и возвращает объект BeautifulSoup.
+        Загружает и разбирает страницу по URL.
         :param url: URL страницы
-        :return: BeautifulSoup или возбуждает исключение при ошибке
+        :param parser: Бэкенд разбора (по умолчанию self.parser)
+        :return: ParsedPage или возбуждает исключение при ошибке
         """
-        headers = {"User-Agent": self.user_agent}
-        try:
-            response = requests.get(url, headers=headers, timeout=self.timeout)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            # Логируем ошибку и пробрасываем дальше
-            print(f"[WebScraper] Ошибка при запросе {url}: {e}")
-            raise
-        return BeautifulSoup(response.text, "html.parser")
+        # Ошибка уже залогирована движком, пробрасываем дальше
+        fetched = self.engine.fetch(url)
+        if fetched.error is not None:
+            raise fetched.error
+        return self.parse_page(fetched.markup, parser=parser, encoding=fetched.encoding)
+
+    def fetch(self, url: str, headers: dict = None, timeout: float = None, max_bytes: int = None):
+        """
+        Загружает страницу без разбора (с поддержкой условных заголовков).
+        :param url: URL страницы
+        :param headers: дополнительные заголовки (If-None-Match, If-Modified-Since)
+        :param timeout: срок запроса в секундах, после которого он отменяется
+        :param max_bytes: лимит размера тела (None — FETCH_MAX_BYTES, 0 — без лимита)
+        :return: FetchResult (ошибка — в FetchResult.error, 304 — в FetchResult.not_modified)
+        """
+        return self.engine.fetch(url, headers=headers, timeout=timeout, max_bytes=max_bytes)
+
+    def fetch_pages(self, targets, timeout: float = None, deadline=None):
+        """
+        Параллельно загружает несколько страниц через асинхронный движок.
+        :param targets: итерируемое кортежей (key, url), (key, url, headers) или (key, url, headers, max_bytes)
+        :param timeout: срок каждого запроса в секундах
+        :param deadline: общий срок прогона (app.deadline.Deadline)
+        :return: генератор FetchResult в порядке завершения загрузок
+        """
+        return self.engine.fetch_many(targets, timeout=timeout, deadline=deadline)
+
+    def parse_page(self, html, parser: str = None, encoding: str = None) -> ParsedPage:
+        """
+        Разбирает HTML страницы выбранным бэкендом.
+        :param html: HTML страницы (str или сырые байты ответа)
+        :param parser: Бэкенд разбора ("lxml", "selectolax", "html.parser"); по умолчанию self.parser
+        :param encoding: кодировка байтов (FetchResult.encoding)
+        :return: ParsedPage
+        """
+        return get_backend(parser or self.parser).parse(html, encoding=encoding)
 
-    def extract_posts(self, soup: BeautifulSoup, post_selector: str, title_selector=None, desc_selector=None, link_selector=None, base_url=None) -> list:
+    def extract_posts(self, page, post_selector: str, title_selector=None, desc_selector=None, link_selector=None, base_url=None, site_id: int = None, known_hashes=None, stop_after: int = INCREMENTAL_STOP_AFTER) -> list:
         """
         Извлекает список постов с заголовками, описаниями и ссылками.
-        :param soup: BeautifulSoup страницы
+        Селекторы компилируются один раз в ExtractionPlan; для site_id план
+        берется из общего кеша selector_plans. Если быстрый бэкенд не
+        поддерживает селектор, страница разбирается заново через
+        BeautifulSoup (html.parser).
+        :param page: ParsedPage (из parse_page) или BeautifulSoup страницы
         :param post_selector: CSS-селектор для контейнера поста
         :param title_selector: CSS-селектор для заголовка (относительно post_tag)
         :param desc_selector: CSS-селектор для описания (относительно post_tag)
         :param link_selector: CSS-селектор для ссылки (относительно post_tag)
         :param base_url: Базовый URL для обработки относительных ссылок
+        :param site_id: ID сайта для кеширования плана (None — план без кеша)
+        :param known_hashes: известные content_hash сайта (инкрементальный режим, см. iter_posts)
+        :param stop_after: после скольких известных постов подряд остановиться
         :return: Список словарей с ключами title, description, url
         """
-        posts = []
-        for tag in soup.select(post_selector):
-            post_data = self._extract_single_post(
-                tag,
-                title_selector=title_selector,
-                desc_selector=desc_selector,
-                link_selector=link_selector,
-                base_url=base_url
+        return list(self.iter_posts(
+            page, post_selector, title_selector=title_selector, desc_selector=desc_selector,
+            link_selector=link_selector, base_url=base_url, site_id=site_id,
+            known_hashes=known_hashes, stop_after=stop_after
+        ))
+
+    def iter_posts(self, page, post_selector: str, title_selector=None, desc_selector=None, link_selector=None, base_url=None, site_id: int = None, known_hashes=None, stop_after: int = INCREMENTAL_STOP_AFTER):
+        """
+        Генератор постов страницы (параметры — как у extract_posts).
+        С known_hashes обход прекращается после stop_after известных постов
+        подряд (они тоже отдаются): для лент «новые первыми» остальные элементы
+        уже известны, и их подселекторы и хеши не вычисляются.
+        """
+        if isinstance(page, BeautifulSoup):
+            page = ParsedPage(get_backend(FALLBACK_PARSER), page, None)
+        backend = page.backend
+        incremental = bool(known_hashes) and stop_after > 0
+        yielded = False
+        try:
+            if site_id is None:
+                plan = ExtractionPlan(backend, post_selector, title_selector, desc_selector, link_selector)
+            else:
+                plan = selector_plans.get_plan(site_id, backend, post_selector, title_selector, desc_selector, link_selector)
+            known_run = 0
+            for tag in backend.select(page.root, plan.post):
+                post = self._extract_single_post(tag, plan, base_url=base_url)
+                yielded = True
+                yield post
+                if incremental:
+                    known_run = known_run + 1 if post["content_hash"] in known_hashes else 0
+                    if known_run >= stop_after:
+                        return
+        except backend.selector_errors as e:
+            if yielded or backend.name == FALLBACK_PARSER or page.html is None:
+                raise
+            print(f"[WebScraper] Селектор не поддерживается бэкендом {backend.name}: {e}; разбор через {FALLBACK_PARSER}")
+            yield from self.iter_posts(
+                self.parse_page(page.html, parser=FALLBACK_PARSER, encoding=page.encoding), post_selector,
+                title_selector=title_selector, desc_selector=desc_selector,
+                link_selector=link_selector, base_url=base_url, site_id=site_id,
+                known_hashes=known_hashes, stop_after=stop_after
             )
-            posts.append(post_data)
-        return posts
 
-    def _extract_single_post(self, post_tag, title_selector=None, desc_selector=None, link_selector=None, base_url=None):
+    def _extract_single_post(self, post_tag, plan: ExtractionPlan, base_url=None):
         """
-        Извлекает данные одного поста из тега по селекторам.
-        :param post_tag: Tag (элемент поста)
-        :param title_selector: CSS-селектор для заголовка (относительно post_tag)
-        :param desc_selector: CSS-селектор для описания (относительно post_tag)
-        :param link_selector: CSS-селектор для ссылки (относительно post_tag)
+        Извлекает данные одного поста из тега по скомпилированным селекторам.
+        :param post_tag: Элемент поста (узел дерева бэкенда)
+        :param plan: ExtractionPlan (селекторы title / desc / link относительно post_tag)
         :param base_url: Базовый URL для обработки относительных ссылок
         :return: dict с ключами title, description, url
         """
+        backend = plan.backend
         title = None
         description = None
         url = None
-        if title_selector:
-            title_tag = post_tag.select_one(title_selector)
-            title = title_tag.get_text(strip=True) if title_tag else None
-        if desc_selector:
-            desc_tag = post_tag.select_one(desc_selector)
-            description = desc_tag.get_text(strip=True) if desc_tag else None
-        if link_selector:
-            link_tag = post_tag.select_one(link_selector)
-            if link_tag and link_tag.has_attr('href'):
-                url = link_tag['href']
+        if plan.title is not None:
+            title_tag = backend.select_one(post_tag, plan.title)
+            title = backend.text(title_tag) if title_tag is not None else None
+        if plan.desc is not None:
+            desc_tag = backend.select_one(post_tag, plan.desc)
+            description = backend.text(desc_tag) if desc_tag is not None else None
+        if plan.link is not None:
+            link_tag = backend.select_one(post_tag, plan.link)
+            href = backend.attr(link_tag, "href") if link_tag is not None else None
+            if href is not None:
+                url = href
                 if base_url and url and not url.lower().startswith(('http://', 'https://')):
                     url = urljoin(base_url, url)
-        # Генерация хеша для дедупликации (по title+description+url)
-        hash_input = (title or "") + (description or "") + (url or "")
-        content_hash = hashlib.sha256(hash_input.encode("utf-8")).hexdigest() if hash_input else None
+        content_hash = compute_content_hash(title, description, url)
         return {"title": title, "description": description, "url": url, "content_hash": content_hash}
+
+_shared_scraper = None
+_shared_scraper_lock = threading.Lock()
+
+def get_shared_scraper() -> WebScraper:
+    """
+    Возвращает общий для процесса экземпляр WebScraper (создается при первом вызове).
+    Используется планировщиком и API, чтобы они делили один пул соединений.
+    """
+    global _shared_scraper
+    with _shared_scraper_lock:
+        if _shared_scraper is None:
+            _shared_scraper = WebScraper()
+        return _shared_scraper
+
+def close_shared_scraper():
+    """
+    Закрывает общий WebScraper (вызывается при остановке приложения).
+    """
+    global _shared_scraper
+    with _shared_scraper_lock:
+        if _shared_scraper is not None:
+            _shared_scraper.close()
+            _shared_scraper = None
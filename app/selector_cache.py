@@ -0,0 +1,90 @@
+"""
+Кеш скомпилированных планов извлечения (ExtractionPlan) по сайтам.
+Ключ — (site_id, бэкенд разбора, хеш селекторов), поэтому измененные
+селекторы никогда не попадают на старый план; update_site / delete_site
+дополнительно сбрасывают планы сайта, чтобы не держать их в памяти.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from app.parsers import ExtractionPlan
+
+# Ограничение кеша (из .env или по умолчанию)
+SELECTOR_CACHE_MAX_ENTRIES = int(os.getenv("SELECTOR_CACHE_MAX_ENTRIES", "2048"))
+
+
+def selectors_hash(*selectors) -> str:
+    """
+    Хеш набора селекторов (post, title, desc, link); None и "" различаются.
+    """
+    raw = "\x1f".join("\x00" if s is None else s for s in selectors)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SelectorPlanCache:
+    """
+    Потокобезопасный LRU-кеш планов извлечения с метриками попаданий.
+    """
+    def __init__(self, max_entries: int = SELECTOR_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: Максимальное количество планов в кеше
+        """
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_plan(self, site_id: int, backend, post_selector: str, title_selector: str = None, desc_selector: str = None, link_selector: str = None) -> ExtractionPlan:
+        """
+        Возвращает план сайта для бэкенда, компилируя селекторы при промахе.
+        :raises backend.selector_errors: если бэкенд не поддерживает селектор (план не кешируется)
+        """
+        key = (site_id, backend.name, selectors_hash(post_selector, title_selector, desc_selector, link_selector))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        # Компиляция вне блокировки: одновременная сборка одного плана безвредна
+        plan = ExtractionPlan(backend, post_selector, title_selector, desc_selector, link_selector)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate_site(self, site_id: int):
+        """
+        Удаляет все планы сайта (для всех бэкендов и версий селекторов).
+        """
+        with self._lock:
+            for key in [key for key in self._plans if key[0] == site_id]:
+                del self._plans[key]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> dict:
+        """
+        Метрики кеша: hits, misses, invalidations, entries.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._plans),
+                "max_entries": self.max_entries,
+            }
+
+
+# Общий кеш планов процесса
+selector_plans = SelectorPlanCache()
@@ -0,0 +1,149 @@
+"""
+Синхронизация расписания проверок с изменениями сайтов.
+CRUD сайтов (routers/sites.py, /add-site) публикует изменения в site_changes,
+а планировщик процесса подписан на них и добавляет, перенастраивает или
+убирает ровно одну запись (TaskScheduler.sync_site). Правки в обход API
+(другой процесс, ручной SQL) подхватывает SiteReconciler: периодически
+выбирает только сайты с updated_at не раньше последнего водяного знака
+(индекс ix_sites_updated_at), а не все сайты. Удаленный в обход API сайт
+снимается с расписания при первой же его проверке (run_site_check → None).
+"""
+from datetime import datetime, timezone
+import os
+import threading
+
+# Как часто сверять расписание с БД по updated_at, секунд (0 — не сверять)
+SITE_SYNC_INTERVAL = int(os.getenv("SITE_SYNC_INTERVAL", "60"))
+
+
+def touch_site(site):
+    """Отмечает изменение настроек сайта (updated_at, naive UTC) перед коммитом."""
+    site.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class SiteChange:
+    """
+    Изменение сайта, влияющее на расписание.
+    active=False — сайт удален или выключен и снимается с расписания.
+    """
+    def __init__(self, site_id: int, check_interval: int = None, active: bool = False, next_check_at: datetime = None):
+        self.site_id = site_id
+        self.check_interval = check_interval
+        self.active = active
+        self.next_check_at = next_check_at
+
+    @classmethod
+    def from_site(cls, site) -> "SiteChange":
+        return cls(site.id, getattr(site, 'check_interval', None), bool(getattr(site, 'is_active', 1)),
+                   getattr(site, 'next_check_at', None))
+
+
+class SiteChangeFeed:
+    """
+    Потокобезопасная рассылка изменений сайтов подписчикам процесса.
+    Ошибка подписчика логируется и не ломает запрос, изменивший сайт.
+    """
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, listener):
+        """:param listener: функция listener(change: SiteChange)"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def publish(self, change: SiteChange):
+        with self._lock:
+            listeners = list(self._listeners)
+            self.published += 1
+        for listener in listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                print(f"[site_sync] Ошибка подписчика для site.id={change.site_id}: {e}")
+
+    def site_saved(self, site):
+        """Сайт создан или изменен (вызывать после коммита)."""
+        self.publish(SiteChange.from_site(site))
+
+    def site_deleted(self, site_id: int):
+        """Сайт удален (вызывать после коммита)."""
+        self.publish(SiteChange(site_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"listeners": len(self._listeners), "published": self.published}
+
+
+class SiteReconciler:
+    """
+    Сверка расписания с БД по водяному знаку updated_at.
+    Изменения применяются через apply(change) идемпотентно, поэтому строки
+    с updated_at, равным водяному знаку, можно безопасно перечитывать.
+    """
+    def __init__(self, db_session_factory, apply):
+        """
+        :param db_session_factory: фабрика сессий БД
+        :param apply: функция apply(change: SiteChange) -> действие или None
+        """
+        self.db_session_factory = db_session_factory
+        self.apply = apply
+        self.watermark = None
+        self.runs = 0
+        self.seen = 0
+        self.applied = 0
+
+    def mark(self, db_session):
+        """Ставит водяной знак на самое позднее updated_at (после полной загрузки сайтов)."""
+        from sqlalchemy import func
+        from app.models import Site
+        self.watermark = db_session.query(func.max(Site.updated_at)).scalar()
+
+    def run(self) -> int:
+        """
+        Применяет изменения сайтов с updated_at >= водяного знака.
+        :return: сколько записей расписания изменилось
+        """
+        from app.models import Site
+        db = self.db_session_factory()
+        try:
+            if self.watermark is None:
+                self.mark(db)
+                return 0
+            rows = (
+                db.query(Site.id, Site.check_interval, Site.is_active, Site.next_check_at, Site.updated_at)
+                .filter(Site.updated_at >= self.watermark)
+                .all()
+            )
+        finally:
+            db.close()
+        applied = 0
+        for site_id, interval, is_active, next_check_at, updated_at in rows:
+            if self.apply(SiteChange(site_id, interval, bool(is_active), next_check_at)):
+                applied += 1
+            self.watermark = max(self.watermark, updated_at)
+        self.runs += 1
+        self.seen += len(rows)
+        self.applied += applied
+        if applied:
+            print(f"[site_sync] Сверка по updated_at: {applied} изменений расписания")
+        return applied
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "seen": self.seen,
+            "applied": self.applied,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+
+# Глобальная рассылка изменений сайтов процесса
+site_changes = SiteChangeFeed()
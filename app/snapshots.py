@@ -0,0 +1,322 @@
+"""
+Хранилище сырых страниц сайтов для повторного извлечения без загрузки.
+check_site сохраняет тело каждой разобранной HTML-страницы (сжатое zstd,
+имя файла — page_digest тела, т.е. тот же хеш, что Site.content_digest),
+для сайта хранятся последние SNAPSHOT_KEEP страниц:
+
+    SNAPSHOT_DIR/<site_id>/index.json    — страницы от новых к старым
+    SNAPSHOT_DIR/<site_id>/<digest>.zst  — тело страницы
+
+Поверх хранилища работают повторное извлечение текущими селекторами сайта
+на пуле разбора (reextract_sites) и предпросмотр селекторов по сохраненной
+странице (preview_selectors) — без запроса к сайту.
+"""
+from collections import deque
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from app.parse_pool import ParsePool, extract_records, records_to_posts, site_selectors
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Сколько последних страниц хранить на сайт (0 — хранилище выключено, нужен пакет zstandard)
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "0"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+# Уровень сжатия zstd (1–22)
+SNAPSHOT_LEVEL = int(os.getenv("SNAPSHOT_LEVEL", "3"))
+
+INDEX_FILE = "index.json"
+
+
+class Snapshot:
+    """
+    Сохраненная страница сайта.
+    content: тело ответа (байты), encoding: его кодировка (FetchResult.encoding)
+    """
+    def __init__(self, site_id: int, digest: str, content: bytes, url: str = None, encoding: str = None, fetched_at: str = None):
+        self.site_id = site_id
+        self.digest = digest
+        self.content = content
+        self.url = url
+        self.encoding = encoding
+        self.fetched_at = fetched_at
+
+    def info(self) -> dict:
+        return {"digest": self.digest, "url": self.url, "encoding": self.encoding,
+                "fetched_at": self.fetched_at, "size": len(self.content)}
+
+
+class SnapshotStore:
+    """
+    Последние страницы сайтов на диске: одинаковые тела сайта хранятся один раз,
+    вытесненные из окна — удаляются.
+    """
+    def __init__(self, root: str = SNAPSHOT_DIR, keep: int = SNAPSHOT_KEEP, level: int = SNAPSHOT_LEVEL):
+        """
+        :param root: каталог хранилища
+        :param keep: страниц на сайт (0 — не сохранять)
+        :param level: уровень сжатия zstd
+        """
+        if keep > 0 and not ZSTD_AVAILABLE:
+            print("[snapshots] Пакет zstandard не установлен — хранилище страниц выключено")
+            keep = 0
+        self.root = root
+        self.keep = keep
+        self.level = level
+        self._lock = threading.Lock()  # счетчики и словарь блокировок сайтов
+        self._site_locks = {}
+        self.saved = 0
+        self.deduplicated = 0
+        self.pruned = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.keep > 0
+
+    def _site_dir(self, site_id: int) -> str:
+        return os.path.join(self.root, str(int(site_id)))
+
+    def _blob_path(self, site_id: int, digest: str) -> str:
+        return os.path.join(self._site_dir(site_id), f"{digest}.zst")
+
+    def _read_index(self, site_id: int) -> list:
+        try:
+            with open(os.path.join(self._site_dir(site_id), INDEX_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"[snapshots] Индекс site.id={site_id} не прочитан: {e}")
+            return []
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _site_lock(self, site_id: int) -> threading.Lock:
+        with self._lock:
+            return self._site_locks.setdefault(int(site_id), threading.Lock())
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def save(self, site_id: int, body, url: str = None, encoding: str = None, digest: str = None):
+        """
+        Сохраняет тело страницы сайта первым в его окне.
+        Сжатие идет без блокировок, запись на диск — под блокировкой сайта,
+        поэтому проверки разных сайтов сохраняют страницы параллельно.
+        Ошибки диска не прерывают проверку: страница просто не сохраняется.
+        :param body: сырые байты ответа или текст (сохраняется в UTF-8)
+        :param digest: page_digest тела, если уже посчитан
+        :return: digest сохраненной страницы или None
+        """
+        if not self.enabled or not body:
+            return None
+        if isinstance(body, str):
+            body, encoding = body.encode("utf-8"), "utf-8"
+        digest = digest or hashlib.sha256(body).hexdigest()
+        path = self._blob_path(site_id, digest)
+        compressed = None if os.path.exists(path) else zstandard.ZstdCompressor(level=self.level).compress(body)
+        with self._site_lock(site_id):
+            try:
+                os.makedirs(self._site_dir(site_id), exist_ok=True)
+                if os.path.exists(path):
+                    self._count(deduplicated=1)
+                else:
+                    if compressed is None:
+                        # Файл удален между проверкой и блокировкой (вытеснен из окна)
+                        compressed = zstandard.ZstdCompressor(level=self.level).compress(body)
+                    self._write_atomic(path, compressed)
+                    self._count(bytes_in=len(body), bytes_stored=len(compressed))
+                entries = [entry for entry in self._read_index(site_id) if entry["digest"] != digest]
+                entries.insert(0, {
+                    "digest": digest,
+                    "url": url,
+                    "encoding": encoding,
+                    "fetched_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+                    "size": len(body),
+                })
+                entries, dropped = entries[:self.keep], entries[self.keep:]
+                self._write_atomic(os.path.join(self._site_dir(site_id), INDEX_FILE),
+                                   json.dumps(entries).encode("utf-8"))
+                for entry in dropped:
+                    try:
+                        os.remove(self._blob_path(site_id, entry["digest"]))
+                    except FileNotFoundError:
+                        pass
+                self._count(pruned=len(dropped), saved=1)
+            except OSError as e:
+                self._count(errors=1)
+                print(f"[snapshots] Страница site.id={site_id} не сохранена: {e}")
+                return None
+        return digest
+
+    def entries(self, site_id: int) -> list:
+        """Сохраненные страницы сайта (без тел), от новых к старым."""
+        with self._site_lock(site_id):
+            return self._read_index(site_id)
+
+    def load(self, site_id: int, digest: str = None):
+        """
+        Читает сохраненную страницу сайта.
+        :param digest: хеш страницы (None — последняя)
+        :return: Snapshot или None, если страницы нет
+        """
+        if not ZSTD_AVAILABLE:
+            return None
+        for entry in self.entries(site_id):
+            if digest is not None and entry["digest"] != digest:
+                continue
+            try:
+                with open(self._blob_path(site_id, entry["digest"]), "rb") as f:
+                    content = zstandard.ZstdDecompressor().decompress(f.read(), max_output_size=entry.get("size") or 0)
+            except (OSError, zstandard.ZstdError) as e:
+                print(f"[snapshots] Страница {entry['digest']} site.id={site_id} не прочитана: {e}")
+                return None
+            return Snapshot(site_id, entry["digest"], content, entry.get("url"), entry.get("encoding"), entry.get("fetched_at"))
+        return None
+
+    def delete_site(self, site_id: int):
+        with self._site_lock(site_id):
+            shutil.rmtree(self._site_dir(site_id), ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "keep": self.keep,
+            "saved": self.saved,
+            "deduplicated": self.deduplicated,
+            "pruned": self.pruned,
+            "errors": self.errors,
+            "compression_ratio": round(self.bytes_in / self.bytes_stored, 2) if self.bytes_stored else None,
+        }
+
+
+# Глобальное хранилище страниц процесса
+snapshots = SnapshotStore()
+
+
+def preview_selectors(site, selectors: dict = None, parser: str = None, digest: str = None, store: SnapshotStore = None):
+    """
+    Извлекает посты из сохраненной страницы сайта селекторами site с заменами из selectors.
+    План селекторов не кешируется (site_id не передается), сайт не загружается.
+    :param selectors: замены аргументов extract_posts (post_selector, title_selector, ...)
+    :param parser: бэкенд разбора (None — Site.parser)
+    :param digest: страница (None — последняя)
+    :return: (Snapshot, список постов) или None, если страницы нет
+    :raises Exception: ошибка селектора или разбора
+    """
+    store = store if store is not None else snapshots
+    snapshot = store.load(site.id, digest)
+    if snapshot is None:
+        return None
+    merged = {**site_selectors(site), **{key: value for key, value in (selectors or {}).items() if value is not None}}
+    records = extract_records(snapshot.content, merged, parser or getattr(site, 'parser', None), None, None, snapshot.encoding)
+    return snapshot, records_to_posts(records)
+
+
+def fetched_time(snapshot: Snapshot):
+    """:return: время загрузки страницы (datetime UTC без tzinfo) или None"""
+    try:
+        return datetime.fromisoformat(snapshot.fetched_at) if snapshot.fetched_at else None
+    except ValueError:
+        return None
+
+
+def reextract_sites(db_session, sites, parse_pool: ParsePool = None, store: SnapshotStore = None) -> list:
+    """
+    Повторное извлечение постов из сохраненных страниц текущими селекторами
+    сайтов (WebScraper.extract_posts в процессах parse_pool) с записью новых постов.
+    Страницы сайтов отправляются в пул с опережением на несколько сайтов,
+    а результаты записываются по сайтам в порядке списка.
+    :param sites: объекты Site
+    :param parse_pool: ParsePool (None — разбор в текущем потоке)
+    :return: список {"site_id", "snapshots", "posts_found", "new_posts_count", "error"}
+    """
+    from app.feed_cache import feed_cache
+    from app.known_posts import known_posts
+    from app.scheduler import save_new_posts
+    store = store if store is not None else snapshots
+    pool = parse_pool if parse_pool is not None else ParsePool(max_workers=0)
+    ahead = max(1, pool.max_workers) * 2
+    pending = deque()
+    results = []
+
+    def submit(site):
+        futures = []
+        for entry in store.entries(site.id):
+            snapshot = store.load(site.id, entry["digest"])
+            if snapshot is not None:
+                futures.append((pool.submit(snapshot.content, site_selectors(site), getattr(site, 'parser', None),
+                                            site.id, None, snapshot.encoding), fetched_time(snapshot)))
+        pending.append((site, futures))
+
+    def finish():
+        site, futures = pending.popleft()
+        result = {"site_id": site.id, "snapshots": len(futures), "posts_found": 0, "new_posts_count": 0, "error": None}
+        try:
+            posts = []
+            seen = set()
+            # Страницы от новых к старым: посты идут в порядке, как их показал бы сайт
+            for future, fetched_at in futures:
+                for post in records_to_posts(future.result()):
+                    if post["content_hash"] in seen:
+                        continue
+                    seen.add(post["content_hash"])
+                    # Пост был на странице уже при ее загрузке, а не в момент повторного извлечения
+                    post["pub_date"] = post.get("pub_date") or fetched_at
+                    posts.append(post)
+            result["posts_found"] = len(posts)
+            if posts:
+                result["new_posts_count"] = save_new_posts(db_session, site.id, posts)
+                db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            result["error"] = str(e)
+            print(f"[reextract] site.id={site.id}: {e}")
+        if result["new_posts_count"]:
+            feed_cache.invalidate_site(site.id)
+            known_posts.invalidate_site(site.id)
+        results.append(result)
+
+    for site in sites:
+        submit(site)
+        if len(pending) > ahead:
+            finish()
+    while pending:
+        finish()
+    print(f"[reextract] {len(results)} sites, {sum(r['new_posts_count'] for r in results)} new posts")
+    return results
+
+
+def reextract_in_background(db_session_factory, site_ids: list, parse_pool: ParsePool = None, store: SnapshotStore = None):
+    """
+    Повторное извлечение для фоновой задачи API: в собственной сессии БД,
+    сайты перечитываются по id (удаленные к этому моменту пропускаются).
+    """
+    from app.models import Site
+    db = db_session_factory()
+    try:
+        sites = db.query(Site).filter(Site.id.in_(site_ids)).order_by(Site.id).all() if site_ids else []
+        return reextract_sites(db, sites, parse_pool, store)
+    except Exception as e:
+        print(f"[reextract] Ошибка фонового извлечения: {e}")
+        return []
+    finally:
+        db.close()
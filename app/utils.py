@@ -2,6 +2,8 @@
 Утилиты для валидации и вспомогательных операций в RSSify.
 """
 import re
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from urllib.parse import urlparse
 
 def validate_url(url: str) -> bool:
@@ -60,3 +62,50 @@ def truncate_text(text: str, max_length: int = 256, suffix: str = '...') -> str:
     if not text or len(text) <= max_length:
         return text
     return text[:max_length - len(suffix)] + suffix
+
+def format_http_date(dt) -> str:
+    """
+    Форматирует datetime в HTTP-дату (RFC 7231), например для Last-Modified.
+    Наивные datetime считаются UTC.
+    :param dt: datetime
+    :return: строка вида 'Wed, 01 Jan 2025 00:00:00 GMT'
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+def parse_http_date(value: str):
+    """
+    Разбирает HTTP-дату (If-Modified-Since и т.п.).
+    :param value: строка заголовка
+    :return: datetime с tzinfo=UTC или None, если строка невалидна
+    """
+    if not value:
+        return None
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Проверяет заголовок If-None-Match против ETag (слабое сравнение, RFC 7232).
+    :param if_none_match: значение заголовка If-None-Match
+    :param etag: текущий ETag ресурса (в кавычках)
+    :return: True если ETag совпадает или передан '*'
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
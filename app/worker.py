@@ -0,0 +1,170 @@
+"""
+Отдельный процесс проверки сайтов (без веб-сервера).
+Запускает тот же цикл проверок, что и API (app.scheduler), со своими
+настройками параллельности, и отдает /health и /metrics по HTTP.
+Несколько таких процессов делят сайты через аренду в БД (app.leases),
+а API можно запустить с ENABLE_SCHEDULER=0.
+
+Запуск: python -m app.worker [--max-workers N] [--parse-workers N] [--metrics-port PORT]
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import signal
+import threading
+import time
+
+from app.database import SessionLocal
+from app.dispatcher import DISPATCHER_MAX_WORKERS
+from app.leases import LEASE_OWNER, WORKER_ID
+from app.parse_pool import PARSE_WORKERS, ParsePool
+from app.result_writer import close_shared_result_writer, get_shared_result_writer
+from app.scheduler import SCHEDULER_MODE, TaskScheduler, schedule_individual_site_checks
+from app.scraper import FETCH_MAX_CONCURRENCY, WebScraper
+
+# Настройки воркера (из .env или по умолчанию — как у планировщика API)
+WORKER_MAX_WORKERS = int(os.getenv("WORKER_MAX_WORKERS", str(DISPATCHER_MAX_WORKERS)))
+WORKER_PARSE_WORKERS = int(os.getenv("WORKER_PARSE_WORKERS", str(PARSE_WORKERS)))
+WORKER_FETCH_CONCURRENCY = int(os.getenv("WORKER_FETCH_CONCURRENCY", str(FETCH_MAX_CONCURRENCY)))
+WORKER_METRICS_HOST = os.getenv("WORKER_METRICS_HOST", "0.0.0.0")
+# 0 — не поднимать HTTP /health и /metrics
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+
+class ScrapeWorker:
+    """
+    Процесс-воркер: WebScraper + ParsePool + TaskScheduler без FastAPI.
+    """
+    def __init__(self, max_workers: int = WORKER_MAX_WORKERS, parse_workers: int = WORKER_PARSE_WORKERS,
+                 fetch_concurrency: int = WORKER_FETCH_CONCURRENCY, mode: str = SCHEDULER_MODE,
+                 db_session_factory=SessionLocal, scraper=None, lease_owner=LEASE_OWNER):
+        """
+        :param max_workers: одновременных проверок сайтов (пул диспетчера)
+        :param parse_workers: процессов разбора HTML (0 — разбор в потоках проверок)
+        :param fetch_concurrency: общий лимит параллельных загрузок
+        :param mode: режим планировщика ("dispatcher" или "jobs")
+        :param db_session_factory: фабрика сессий БД
+        :param scraper: готовый WebScraper (по умолчанию создается свой)
+        :param lease_owner: владелец аренды проверок (None — без аренды)
+        """
+        self.db_session_factory = db_session_factory
+        self.scraper = scraper or WebScraper(max_concurrency=fetch_concurrency)
+        self.parse_pool = ParsePool(max_workers=parse_workers) if parse_workers > 0 else None
+        self.scheduler = TaskScheduler(mode=mode, max_workers=max_workers)
+        self.lease_owner = lease_owner
+        self.result_writer = None
+        self.started_at = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Открывает HTTP-клиент, запускает планировщик и ставит сайты в очередь."""
+        self.started_at = time.time()
+        self.scraper.start()
+        if self.db_session_factory is SessionLocal:
+            # Один поток записи результатов проверок (SQLite в режиме wal)
+            self.result_writer = get_shared_result_writer()
+        self.scheduler.start()
+        schedule_individual_site_checks(
+            self.scheduler, self.db_session_factory, self.scraper,
+            parse_pool=self.parse_pool, lease_owner=self.lease_owner
+        )
+        print(f"[worker] {WORKER_ID} started: mode={self.scheduler.mode}, max_workers={self.scheduler.max_workers}, "
+              f"parse_workers={self.parse_pool.max_workers if self.parse_pool else 0}")
+
+    def stop(self):
+        """Просит основной цикл завершиться (безопасно из обработчика сигнала)."""
+        self._stop.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._stop.wait(timeout)
+
+    def shutdown(self):
+        """Останавливает планировщик, дожидаясь текущих проверок, и закрывает ресурсы."""
+        self.scheduler.shutdown(wait=True)
+        self.scraper.close()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+        if self.result_writer is not None:
+            close_shared_result_writer()
+            self.result_writer = None
+        print(f"[worker] {WORKER_ID} stopped")
+
+    def healthy(self) -> bool:
+        dispatcher = self.scheduler.dispatcher
+        return self.scheduler.scheduler.running and (dispatcher is None or dispatcher.running)
+
+    def metrics(self) -> dict:
+        """
+        Метрики воркера: идентификатор, аптайм, параллельность и метрики планировщика.
+        """
+        return {
+            "worker_id": WORKER_ID,
+            "lease_owner": self.lease_owner,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "healthy": self.healthy(),
+            "parse_workers": self.parse_pool.max_workers if self.parse_pool else 0,
+            "fetch_concurrency": self.scraper.engine.max_concurrency,
+            "scheduler": self.scheduler.stats(),
+            "hosts": self.scraper.engine.host_guard.stats(),
+            "writer": self.result_writer.stats() if self.result_writer is not None else None,
+        }
+
+
+def make_metrics_server(worker: ScrapeWorker, host: str = WORKER_METRICS_HOST, port: int = WORKER_METRICS_PORT) -> ThreadingHTTPServer:
+    """
+    HTTP-сервер с GET /health (200 / 503) и GET /metrics (JSON).
+    Запускается вызывающим кодом: threading.Thread(target=server.serve_forever).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                healthy = worker.healthy()
+                status, body = (200 if healthy else 503), {"status": "ok" if healthy else "unavailable"}
+            elif self.path == "/metrics":
+                status, body = 200, worker.metrics()
+            else:
+                status, body = 404, {"detail": "Not Found"}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # не засоряем лог запросами проб
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="RSSify: процесс проверки сайтов без API")
+    arg_parser.add_argument("--max-workers", type=int, default=WORKER_MAX_WORKERS, help="одновременных проверок сайтов")
+    arg_parser.add_argument("--parse-workers", type=int, default=WORKER_PARSE_WORKERS, help="процессов разбора HTML (0 — без пула)")
+    arg_parser.add_argument("--fetch-concurrency", type=int, default=WORKER_FETCH_CONCURRENCY, help="параллельных загрузок")
+    arg_parser.add_argument("--mode", choices=("dispatcher", "jobs"), default=SCHEDULER_MODE, help="режим планировщика")
+    arg_parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="порт /health и /metrics (0 — выключить)")
+    args = arg_parser.parse_args(argv)
+
+    worker = ScrapeWorker(max_workers=args.max_workers, parse_workers=args.parse_workers,
+                          fetch_concurrency=args.fetch_concurrency, mode=args.mode)
+    server = None
+    if args.metrics_port:
+        server = make_metrics_server(worker, port=args.metrics_port)
+        threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+        print(f"[worker] metrics on http://{WORKER_METRICS_HOST}:{args.metrics_port}/metrics")
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: worker.stop())
+    worker.start()
+    try:
+        while not worker.wait(1.0):
+            pass
+    finally:
+        if server is not None:
+            server.shutdown()
+        worker.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models  # noqa: F401  (регистрирует таблицы)
+from app.database import Base
+from app.known_posts import known_posts
+
+
+@pytest.fixture
+def memory_session_factory():
+    """Фабрика сессий поверх отдельной in-memory SQLite БД со всеми таблицами."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    # Окно известных постов процесса не должно переживать БД теста
+    known_posts.clear()
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+    known_posts.clear()
+
+
+@pytest.fixture
+def memory_db(memory_session_factory):
+    """Сессия in-memory SQLite БД (закрывается после теста)."""
+    db = memory_session_factory()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def api_client(memory_session_factory):
+    """TestClient приложения, у которого get_db смотрит в in-memory БД."""
+    from fastapi.testclient import TestClient
+    from app import database
+    from app.feed_cache import feed_cache
+    from app.selector_cache import selector_plans
+    from app.main import app
+
+    def override_get_db():
+        db = memory_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    app.dependency_overrides[database.get_db] = override_get_db
+    feed_cache.clear()
+    selector_plans.clear()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    feed_cache.clear()
+    selector_plans.clear()
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.adaptive import effective_interval, record_check
+from app.fetch_engine import FetchResult
+from app.models import Site
+from app.scheduler import check_site
+
+START = datetime(2025, 1, 1)
+
+
+def make_site(**kwargs):
+    fields = dict(check_interval=10, min_interval=None, max_interval=None, adaptive_interval=None,
+                  avg_change_gap=None, change_count=0, last_change_at=None)
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+def test_interval_shrinks_on_change_and_grows_when_idle_within_bounds():
+    site = make_site(min_interval=4, max_interval=30)
+    assert record_check(site, 0, START) == 12.5
+    assert record_check(site, 3, START + timedelta(minutes=12)) == 6.25
+    assert site.change_count == 1
+    assert record_check(site, 1, START + timedelta(minutes=20)) == 4  # min_interval
+    assert site.avg_change_gap == 8
+    for i in range(30):
+        record_check(site, 0, START + timedelta(hours=i))
+    assert site.adaptive_interval == 30  # max_interval
+    assert effective_interval(site, adaptive=True) == 30
+    assert effective_interval(site, adaptive=False) == 10
+
+
+def simulate(post_every_minutes, adaptive, days=3):
+    """Возвращает (число проверок, максимальная задержка обнаружения поста в минутах)."""
+    site = make_site()
+    end = START + timedelta(days=days)
+    posts = []
+    t = START + timedelta(minutes=post_every_minutes)
+    while t < end:
+        posts.append(t)
+        t += timedelta(minutes=post_every_minutes)
+    now, seen, checks, worst = START, 0, 0, 0.0
+    while now < end:
+        checks += 1
+        new = [p for p in posts[seen:] if p <= now]
+        for p in new:
+            worst = max(worst, (now - p).total_seconds() / 60)
+        seen += len(new)
+        record_check(site, len(new), now)
+        now += timedelta(minutes=effective_interval(site, adaptive=adaptive))
+    return checks, worst
+
+
+def test_adaptive_polling_cuts_fetches_without_hurting_active_sites():
+    fixed_idle, _ = simulate(post_every_minutes=24 * 60, adaptive=False)
+    adaptive_idle, _ = simulate(post_every_minutes=24 * 60, adaptive=True)
+    assert adaptive_idle * 4 < fixed_idle
+
+    _, fixed_latency = simulate(post_every_minutes=7, adaptive=False)
+    _, adaptive_latency = simulate(post_every_minutes=7, adaptive=True)
+    assert adaptive_latency <= fixed_latency
+
+
+def test_check_site_stores_change_statistics(memory_db):
+    site = Site(name="Adaptive", url="https://adaptive.test", selector="div", check_interval=20)
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = MagicMock()
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200, text="<html>1</html>")
+    scraper.extract_posts.return_value = [{"title": "New", "url": "https://adaptive.test/1", "content_hash": "a1"}]
+    check_site(site, memory_db, scraper)
+    assert site.change_count == 1
+    assert site.last_change_at is not None
+    assert site.adaptive_interval == 10
+
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=304)
+    check_site(site, memory_db, scraper)
+    assert site.change_count == 1
+    assert site.adaptive_interval == 12.5
@@ -0,0 +1,161 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.check_queue import CheckRequestPoller, check_status, run_manual_check, run_requested_check, submit_check
+from app.database import Base
+from app.fetch_engine import FetchResult
+from app.leases import claim_site, hold_local_check, release_local_check, release_site, utcnow
+from app.models import Site
+from app.scheduler import TaskScheduler
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def add_site(factory, url="https://manual.test"):
+    db = factory()
+    site = Site(name="Manual", url=url, selector="div")
+    db.add(site)
+    db.commit()
+    site_id = site.id
+    db.close()
+    return site_id
+
+
+def test_api_only_enqueues_and_reports_status(api_client, memory_session_factory):
+    site_id = add_site(memory_session_factory)
+    other_id = add_site(memory_session_factory, "https://other.test")
+    assert api_client.post(f"/api/sites/{other_id}/check").json()["position"] == 0
+    response = api_client.post(f"/api/sites/{site_id}/check")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["detail"].startswith("Check started")
+    assert body["status"] == "queued" and body["position"] == 1
+    again = api_client.post(f"/api/sites/{site_id}/check").json()
+    assert again["job_id"] == body["job_id"] and again["detail"] == "Check already in progress"
+    status = api_client.get(f"/api/sites/checks/{body['job_id']}").json()
+    assert status["status"] == "queued" and status["requests"] == 2
+    assert api_client.get("/api/sites/checks/unknown").status_code == 404
+    assert api_client.post("/api/sites/9999/check").status_code == 404
+
+    # Проверку выполняет процесс планировщика: опрос очереди и запуск задания
+    scraper = MagicMock()
+    scraper.fetch.return_value = FetchResult(site_id, "https://manual.test", status_code=304)
+    dispatched = []
+    poller = CheckRequestPoller(memory_session_factory, lambda request_id, sid: dispatched.append((request_id, sid)))
+    assert poller.run() == 2 and poller.run() == 0
+    assert [sid for _, sid in dispatched] == [other_id, site_id]
+    for request_id, _ in dispatched:
+        assert run_requested_check(request_id, memory_session_factory, scraper, lease_owner=None, worker="w1") is not None
+        # Задание уже взято: второй воркер его не выполняет
+        assert run_requested_check(request_id, memory_session_factory, scraper, lease_owner=None, worker="w2") is None
+    status = api_client.get(f"/api/sites/checks/{body['job_id']}").json()
+    assert status["status"] == "done" and status["worker"] == "w1" and status["position"] is None
+    assert status["outcome"]["skipped"] == "not_modified"
+    assert {"queued", "fetch", "db", "total"} <= set(status["timings"])
+    assert scraper.fetch.call_count == 2
+    assert api_client.post(f"/api/sites/{site_id}/check").json()["job_id"] != body["job_id"]
+
+
+def test_worker_runs_manual_checks_before_due_scheduled_ones(memory_session_factory):
+    site_id = add_site(memory_session_factory)
+    db = memory_session_factory()
+    job_id = submit_check(db, site_id)[0].job_id
+    db.close()
+    order = []
+    release = threading.Event()
+    scraper = MagicMock()
+    scraper.fetch.side_effect = lambda url, **kwargs: order.append(("manual", site_id)) or FetchResult(site_id, url, status_code=304)
+    scheduler = TaskScheduler(mode="dispatcher", max_workers=1)
+    dispatcher = scheduler.set_site_check(lambda sid: (order.append(("scheduled", sid)), release.wait(2)))
+    scheduler.watch_check_requests(memory_session_factory, scraper, lease_owner=None, poll_interval=0)
+    # Единственный воркер занят, еще одна плановая проверка уже наступила
+    dispatcher.schedule(100, 60, next_due=dispatcher.clock())
+    dispatcher.schedule(101, 60, next_due=dispatcher.clock() + 0.01)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: order)
+        assert scheduler.check_requests.run() == 1
+        time.sleep(0.05)
+        release.set()
+        assert wait_until(lambda: len(order) == 3)
+        db = memory_session_factory()
+        assert wait_until(lambda: check_status(db, job_id)["status"] == "done")
+        db.close()
+    finally:
+        release.set()
+        scheduler.shutdown()
+    assert order == [("scheduled", 100), ("manual", site_id), ("scheduled", 101)]
+    assert dispatcher.stats()["urgent_dispatched"] == 1
+
+
+def test_manual_check_reuses_concurrent_scheduled_check(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'manual.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    site = Site(name="Busy", url="https://busy.test", selector="div", next_check_at=utcnow())
+    db.add(site)
+    db.commit()
+    site_id = site.id
+    assert claim_site(db, site_id, "scheduler")
+    scraper = MagicMock()
+    requested_at = utcnow()
+    results = []
+    manual = threading.Thread(target=lambda: results.append(
+        run_manual_check(site_id, requested_at, factory, scraper, lease_owner="manual", poll=0.05)
+    ))
+    manual.start()
+    time.sleep(0.2)
+    # Плановая проверка завершается и освобождает аренду
+    db.get(Site, site_id).last_check = utcnow()
+    db.commit()
+    release_site(db, site_id, "scheduler", next_check_at=utcnow())
+    manual.join(5)
+    db.close()
+    engine.dispose()
+    assert results[0]["skipped"] == "deduplicated"
+    scraper.fetch.assert_not_called()
+
+
+def test_manual_check_without_leases_waits_for_in_process_check(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'local.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    site = Site(name="Local", url="https://local.test", selector="div")
+    db.add(site)
+    db.commit()
+    site_id = site.id
+    scraper = MagicMock()
+    requested_at = utcnow()
+    # Плановая проверка этого процесса (SITE_LEASES=0) уже идет
+    assert hold_local_check(site_id)
+    results = []
+    manual = threading.Thread(target=lambda: results.append(
+        run_manual_check(site_id, requested_at, factory, scraper, lease_owner=None, poll=0.05)
+    ))
+    try:
+        manual.start()
+        time.sleep(0.2)
+        assert not results
+        # Плановая проверка записала результат: ручная засчитывает его, не дожидаясь снятия отметки
+        db.get(Site, site_id).last_check = utcnow()
+        db.commit()
+        manual.join(5)
+    finally:
+        release_local_check(site_id)
+    db.close()
+    engine.dispose()
+    assert results[0]["skipped"] == "deduplicated"
+    scraper.fetch.assert_not_called()
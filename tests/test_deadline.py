@@ -0,0 +1,100 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import httpx
+
+from app.deadline import Deadline, DeadlineExceeded, deadline_stats
+from app.fetch_engine import AsyncFetchEngine, FetchResult
+from app.models import Post, Site
+from app.scheduler import check_all_sites, check_site
+from app.scraper import WebScraper
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_transport(slow_hosts, cancelled):
+    async def handler(request):
+        try:
+            if request.url.host in slow_hosts:
+                await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(request.url.host)
+            raise
+        return httpx.Response(200, text=f'<html><body><div class="post"><a href="/p">{request.url.host}</a></div></body></html>')
+    return httpx.MockTransport(handler)
+
+
+def test_deadline_child_never_outlives_parent():
+    clock = FakeClock()
+    parent = Deadline(10, clock=clock)
+    assert parent.child(60).remaining() == 10
+    assert parent.child(3).remaining() == 3
+    assert Deadline(None).remaining() is None
+    clock.now = 11
+    assert parent.expired
+
+
+def test_fetch_timeout_cancels_request():
+    cancelled = []
+    engine = AsyncFetchEngine("test-agent", transport=make_transport({"slow.test"}, cancelled))
+    try:
+        started = time.monotonic()
+        result = engine.fetch("https://slow.test/", timeout=0.2)
+        assert time.monotonic() - started < 1
+        assert isinstance(result.error, DeadlineExceeded) and result.error.phase == "fetch"
+        # Запрос действительно отменен в event loop, а не брошен в фоне
+        assert cancelled == ["slow.test"]
+        assert engine.fetch("https://fast.test/", timeout=0.2).ok
+    finally:
+        engine.close()
+
+
+def test_cycle_budget_skips_remaining_sites(memory_db):
+    deadline_stats.reset()
+    cancelled = []
+    sites = [Site(name=f"S{i}", url=f"https://site{i}.test/", selector="div.post", check_interval=10) for i in range(4)]
+    sites += [Site(name=f"Slow{i}", url=f"https://slow{i}.test/", selector="div.post", check_interval=10) for i in range(2)]
+    memory_db.add_all(sites)
+    memory_db.commit()
+    scraper = WebScraper(transport=make_transport({"slow0.test", "slow1.test"}, cancelled), parser="html.parser")
+    try:
+        started = time.monotonic()
+        results = check_all_sites(memory_db, scraper, budget=0.5)
+        assert time.monotonic() - started < 2
+    finally:
+        scraper.close()
+    skipped = sorted(r["site_id"] for r in results if r["skipped"] == "budget")
+    assert skipped == sorted(site.id for site in sites if site.name.startswith("Slow"))
+    assert sorted(cancelled) == ["slow0.test", "slow1.test"]
+    assert sum(1 for r in results if r["success"]) == 4
+    stats = deadline_stats.stats()
+    assert stats["skipped"] == 2 and stats["cycles_over_budget"] == 1
+
+
+def test_expired_deadline_rolls_back_unsaved_posts(memory_db):
+    deadline_stats.reset()
+    site = Site(name="Late", url="https://late.test", selector="div", check_interval=10)
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = MagicMock()
+    scraper.extract_posts.return_value = [{"title": "Late", "url": "https://late.test/1", "content_hash": "late1"}]
+    clock = FakeClock()
+    deadline = Deadline(5, clock=clock)
+
+    def slow_parse(*args, **kwargs):
+        clock.now = 6
+    scraper.parse_page.side_effect = slow_parse
+    fetched = FetchResult(site.id, site.url, status_code=200, text="<html>late</html>")
+
+    result = check_site(site, memory_db, scraper, fetched=fetched, deadline=deadline)
+    assert not result["success"] and result["timeout"] == "parse"
+    assert memory_db.query(Post).count() == 0
+    assert site.error_count == 1
+    assert deadline_stats.stats()["timeouts_by_phase"] == {"parse": 1}
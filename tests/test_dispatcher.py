@@ -0,0 +1,144 @@
+import threading
+import time
+
+from app.dispatcher import DueQueueDispatcher
+from app.models import Site
+from app.scheduler import TaskScheduler, schedule_individual_site_checks
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_dispatcher_runs_due_sites_repeatedly_without_overlap():
+    runs = {}
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def run_check(site_id):
+        with lock:
+            if site_id in active:
+                overlaps.append(site_id)
+            active.add(site_id)
+            runs[site_id] = runs.get(site_id, 0) + 1
+        time.sleep(0.01)
+        with lock:
+            active.discard(site_id)
+
+    dispatcher = DueQueueDispatcher(run_check, max_workers=4)
+    for site_id in range(10):
+        dispatcher.schedule(site_id, 0.05, next_due=time.monotonic())
+    dispatcher.start()
+    try:
+        assert wait_until(lambda: len(runs) == 10 and min(runs.values()) >= 3)
+    finally:
+        dispatcher.shutdown()
+    assert overlaps == []
+    stats = dispatcher.stats()
+    assert stats["sites"] == 10
+    assert stats["completed"] == stats["dispatched"]
+
+
+def test_dispatcher_reports_queue_depth_lag_and_misfires():
+    release = threading.Event()
+    dispatcher = DueQueueDispatcher(lambda site_id: release.wait(2), max_workers=1, misfire_grace=0.05)
+    now = time.monotonic()
+    for site_id in range(5):
+        dispatcher.schedule(site_id, 60, next_due=now)
+    dispatcher.start()
+    try:
+        assert wait_until(lambda: dispatcher.stats()["in_flight"] == 1)
+        stats = dispatcher.stats()
+        assert stats["queue_depth"] == 4
+        time.sleep(0.1)
+        release.set()
+        assert wait_until(lambda: dispatcher.stats()["completed"] == 5)
+    finally:
+        dispatcher.shutdown()
+    stats = dispatcher.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["misfires"] >= 4
+    assert stats["lag_max"] >= 0.1
+
+
+def test_queue_depth_follows_rescheduled_and_removed_waiting_sites():
+    release = threading.Event()
+    dispatcher = DueQueueDispatcher(lambda site_id: release.wait(2), max_workers=1)
+    now = time.monotonic()
+    dispatcher.schedule(0, 60, next_due=now)
+    dispatcher.start()
+    try:
+        assert wait_until(lambda: dispatcher.stats()["in_flight"] == 1)
+        # Проверки, наступившие при занятом воркере, попадают в очередь без опроса stats
+        for site_id in range(1, 4):
+            dispatcher.schedule(site_id, 60, next_due=time.monotonic() + 0.05)
+        assert wait_until(lambda: len(dispatcher._ready) == 3)
+        dispatcher.remove(1)
+        dispatcher.defer(2, 60)
+        assert dispatcher.stats()["queue_depth"] == 1
+        release.set()
+        assert wait_until(lambda: dispatcher.stats()["completed"] == 2)
+        assert dispatcher.stats()["queue_depth"] == 0
+    finally:
+        dispatcher.shutdown()
+
+
+def test_removed_site_is_not_rescheduled():
+    calls = []
+    dispatcher = DueQueueDispatcher(calls.append, max_workers=2)
+    dispatcher.schedule(1, 0.02, next_due=time.monotonic())
+    dispatcher.schedule(2, 0.02, next_due=time.monotonic())
+    dispatcher.remove(2)
+    dispatcher.start()
+    try:
+        assert wait_until(lambda: calls.count(1) >= 3)
+    finally:
+        dispatcher.shutdown()
+    assert 2 not in calls
+
+
+def test_dispatcher_mode_schedules_sites_without_apscheduler_jobs(memory_session_factory):
+    db = memory_session_factory()
+    db.add_all([Site(name=f"S{i}", url=f"https://d{i}.test", selector="div", check_interval=5) for i in range(50)])
+    db.add(Site(name="off", url="https://off.test", selector="div", is_active=0))
+    db.commit()
+    db.close()
+    scheduler = TaskScheduler(mode="dispatcher", max_workers=3)
+    schedule_individual_site_checks(scheduler, memory_session_factory, scraper=None)
+    scheduler.start()
+    try:
+        stats = scheduler.stats()
+        # Задачи APScheduler — сверка расписания и опрос ручных проверок, не по задаче на сайт
+        assert sorted(job.id for job in scheduler.scheduler.get_jobs()) == ["check_requests", "reconcile_sites"]
+        assert stats["dispatcher"]["sites"] == 50
+        assert stats["dispatcher"]["max_workers"] == 3
+        assert stats["dispatcher"]["queue_depth"] == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_run_now_waits_for_running_check_of_the_same_site():
+    release = threading.Event()
+    events = []
+    dispatcher = DueQueueDispatcher(lambda site_id: (events.append(("scheduled", site_id)), release.wait(2)), max_workers=2)
+    dispatcher.schedule(1, 60, next_due=time.monotonic())
+    dispatcher.start()
+    try:
+        assert wait_until(lambda: dispatcher.stats()["in_flight"] == 1)
+        dispatcher.run_now(1, lambda: events.append(("manual", 1)))
+        time.sleep(0.05)
+        assert events == [("scheduled", 1)] and dispatcher.stats()["urgent"] == 1
+        release.set()
+        assert wait_until(lambda: events[-1] == ("manual", 1))
+        # Плановое расписание сайта сохранилось
+        assert wait_until(lambda: dispatcher.stats()["in_flight"] == 0)
+        assert dispatcher.entry(1) is not None
+    finally:
+        release.set()
+        dispatcher.shutdown()
@@ -0,0 +1,83 @@
+from unittest.mock import MagicMock
+
+from app.feed_cache import FeedCache
+from app.fetch_engine import FetchResult
+from app.models import Site, Post
+from app.scheduler import check_site
+
+
+def test_feed_cache_hit_miss_and_lru_eviction():
+    cache = FeedCache(max_entries=2, max_bytes=1024)
+    assert cache.get((1, "rss", None)) is None
+    cache.set((1, "rss", None), "a")
+    cache.set((2, "rss", None), "b")
+    assert cache.get((1, "rss", None)) == "a"
+    cache.set((3, "rss", None), "c")  # вытесняет (2, ...)
+    assert cache.get((2, "rss", None)) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+
+
+def test_feed_cache_size_limit_and_site_invalidation():
+    cache = FeedCache(max_entries=10, max_bytes=10)
+    cache.set((1, "rss", None), "x" * 6)
+    cache.set((1, "atom", 5), "y" * 6)
+    assert cache.stats()["entries"] == 1
+    cache.set((2, "rss", None), "z" * 100)  # больше лимита — не кешируется
+    assert cache.get((2, "rss", None)) is None
+    cache.set((2, "rss", None), "z")
+    cache.invalidate_site(1)
+    assert cache.get((1, "atom", 5)) is None
+    assert cache.get((2, "rss", None)) == "z"
+    assert cache.stats()["bytes"] == 1
+
+
+def test_feed_endpoint_served_from_cache_until_new_posts(api_client, memory_session_factory):
+    db = memory_session_factory()
+    site = Site(name="Cached", url="https://cached.test", selector="div")
+    db.add(site)
+    db.commit()
+    db.add(Post(site_id=site.id, title="First", url="https://cached.test/1", content_hash="h1"))
+    db.commit()
+
+    first = api_client.get(f"/feed/{site.id}")
+    assert first.status_code == 200
+    assert first.headers["X-Feed-Cache"] == "MISS"
+    second = api_client.get(f"/feed/{site.id}")
+    assert second.headers["X-Feed-Cache"] == "HIT"
+    assert second.text == first.text
+
+    scraper = MagicMock()
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200, text="<html>new</html>")
+    scraper.extract_posts.return_value = [{"title": "Second", "url": "https://cached.test/2", "content_hash": "h2"}]
+    check_site(site, db, scraper)
+    db.close()
+
+    third = api_client.get(f"/feed/{site.id}")
+    assert third.headers["X-Feed-Cache"] == "MISS"
+    assert "Second" in third.text
+
+
+def test_feed_cache_misses_when_posts_written_by_another_process(api_client, memory_session_factory):
+    db = memory_session_factory()
+    site = Site(name="Worker", url="https://worker.test", selector="div")
+    db.add(site)
+    db.commit()
+    site_id = site.id
+    db.add(Post(site_id=site_id, title="First", url="https://worker.test/1", content_hash="w1"))
+    db.commit()
+    first = api_client.get(f"/feed/{site_id}")
+    assert api_client.get(f"/feed/{site_id}").headers["X-Feed-Cache"] == "HIT"
+
+    # Вставка процессом worker: кеш API не сбрасывается, меняется только ETag из БД
+    db.add(Post(site_id=site_id, title="Second", url="https://worker.test/2", content_hash="w2"))
+    db.commit()
+    db.close()
+    second = api_client.get(f"/feed/{site_id}")
+    assert second.headers["X-Feed-Cache"] == "MISS"
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert "Second" in second.text
+    assert api_client.get(f"/feed/{site_id}").headers["X-Feed-Cache"] == "HIT"
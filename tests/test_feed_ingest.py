@@ -0,0 +1,158 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.feed_ingest import FeedParseError, discover_feed_url, iter_feed_posts, parse_feed_date
+from app.fetch_engine import FetchResult
+from app.models import Post, Site
+from app.scheduler import check_site
+from app.scraper import WebScraper, compute_content_hash
+
+RSS = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel><title>Blog</title><link>https://feed.test/</link>
+{items}
+</channel></rss>"""
+
+ITEM = """<item><title>Post {i}</title><link>/posts/{i}</link><guid>urn:post:{i}</guid>
+<description>Summary {i}</description><pubDate>Mon, 0{day} Jun 2025 10:00:00 +0200</pubDate></item>"""
+
+ATOM = """<?xml version="1.0"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>Atom</title>
+<entry><title>Entry</title><id>tag:atom.test,2025:1</id>
+<link rel="edit" href="https://atom.test/edit/1"/><link href="https://atom.test/1"/>
+<summary>Short</summary><published>2025-06-03T08:30:00Z</published></entry>
+</feed>"""
+
+PAGE = """<html><head><title>Blog</title>
+<link rel="alternate" type="application/rss+xml" href="/feed.xml"></head>
+<body><div class="p"><h2>HTML post</h2><a href="/html-post">more</a></div></body></html>"""
+
+
+def rss(ids):
+    return RSS.format(items="".join(ITEM.format(i=i, day=i % 9 + 1) for i in ids))
+
+
+def test_rss_items_become_posts_with_real_dates():
+    posts = list(iter_feed_posts(rss([2, 1]), "https://feed.test/"))
+    assert [post["title"] for post in posts] == ["Post 2", "Post 1"]
+    assert posts[0]["url"] == "https://feed.test/posts/2"
+    assert posts[0]["description"] == "Summary 2"
+    assert posts[0]["pub_date"] == datetime(2025, 6, 3, 8, 0)
+    assert posts[0]["content_hash"] == compute_content_hash(None, None, "urn:post:2")
+
+
+def test_atom_entries_and_date_formats():
+    [post] = iter_feed_posts(ATOM)
+    assert post["url"] == "https://atom.test/1"
+    assert post["description"] == "Short"
+    assert post["pub_date"] == datetime(2025, 6, 3, 8, 30)
+    assert parse_feed_date("not a date") is None
+
+
+def test_feed_stream_stops_after_known_entries_and_rejects_html():
+    known = {compute_content_hash(None, None, f"urn:post:{i}") for i in range(1, 9)}
+    posts = list(iter_feed_posts(rss(range(10, 0, -1)), known_hashes=known, stop_after=2))
+    assert [post["title"] for post in posts] == ["Post 10", "Post 9", "Post 8", "Post 7"]
+    with pytest.raises(FeedParseError):
+        list(iter_feed_posts(PAGE))
+    with pytest.raises(FeedParseError):
+        list(iter_feed_posts("<rss><channel><item>"))
+
+
+def test_discover_feed_url_in_head():
+    assert discover_feed_url(PAGE, "https://feed.test/blog/") == "https://feed.test/feed.xml"
+    assert discover_feed_url("<html><body><link rel='alternate' type='application/rss+xml' href='/x'></body></html>") is None
+    assert discover_feed_url(rss([1]), "https://feed.test/rss") == "https://feed.test/rss"
+
+
+def test_check_site_discovers_feed_and_ingests_it(memory_db, monkeypatch):
+    monkeypatch.setattr("app.feed_ingest.FEED_DISCOVERY", True)
+    site = Site(name="Feed", url="https://feed.test/", selector="div.p", title_selector="h2")
+    memory_db.add(site)
+    memory_db.commit()
+    bodies = {"https://feed.test/": PAGE, "https://feed.test/feed.xml": rss([2, 1])}
+    scraper = MagicMock()
+    scraper.fetch.side_effect = lambda url, **kwargs: FetchResult(site.id, url, status_code=200, text=bodies[url],
+                                                                  headers={"etag": f'"{url}"'})
+
+    result = check_site(site, memory_db, scraper)
+    assert result["success"] and result["new_posts_count"] == 2
+    scraper.extract_posts.assert_not_called()
+    assert site.feed_url == "https://feed.test/feed.xml" and site.active_ingest == "feed"
+    assert site.etag == '"https://feed.test/feed.xml"'
+    published = {post.title: post.published_at for post in memory_db.query(Post).filter_by(site_id=site.id)}
+    assert published == {"Post 2": datetime(2025, 6, 3, 8, 0), "Post 1": datetime(2025, 6, 2, 8, 0)}
+
+    bodies["https://feed.test/feed.xml"] = rss([3, 2, 1])
+    result = check_site(site, memory_db, scraper)
+    assert scraper.fetch.call_args.args[0] == "https://feed.test/feed.xml"
+    assert result["new_posts_count"] == 1
+
+
+def test_auto_sites_do_not_discover_feeds_by_default(memory_db):
+    site = Site(name="Html", url="https://feed.test/", selector="div.p", title_selector="h2", link_selector="a")
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(return_value=FetchResult(site.id, site.url, status_code=200, text=PAGE))
+    assert check_site(site, memory_db, scraper)["new_posts_count"] == 1
+    assert site.feed_url is None and site.active_ingest == "html"
+    assert scraper.fetch.call_count == 1
+
+
+def test_html_site_switching_to_feed_does_not_duplicate_posts(memory_db):
+    site = Site(name="Switch", url="https://feed.test/", selector="div.p", title_selector="h2", link_selector="a")
+    memory_db.add(site)
+    memory_db.commit()
+    listing = "".join(f'<div class="p"><h2>Post {i}</h2><a href="/posts/{i}">more</a></div>' for i in (2, 1))
+    bodies = {"https://feed.test/": f"<html><body>{listing}</body></html>", "https://feed.test/feed.xml": rss([3, 2, 1])}
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(side_effect=lambda url, **kwargs: FetchResult(site.id, url, status_code=200, text=bodies[url]))
+    assert check_site(site, memory_db, scraper)["new_posts_count"] == 2
+
+    site.feed_url = "https://feed.test/feed.xml"
+    site.active_ingest = None
+    result = check_site(site, memory_db, scraper)
+    assert site.active_ingest == "feed"
+    # Посты 1 и 2 уже собраны из HTML (другой content_hash, та же ссылка)
+    assert result["new_posts_count"] == 1 and len(result["posts"]) == 3
+    bodies["https://feed.test/feed.xml"] = rss([4, 3, 2, 1])
+    assert check_site(site, memory_db, scraper)["new_posts_count"] == 1
+    assert sorted(post.url for post in memory_db.query(Post).filter_by(site_id=site.id)) == [
+        f"https://feed.test/posts/{i}" for i in (1, 2, 3, 4)
+    ]
+
+
+def test_broken_feed_falls_back_to_html_selectors(memory_db):
+    site = Site(name="Broken", url="https://broken.test/", selector="div.p", title_selector="h2", link_selector="a",
+                feed_url="https://broken.test/feed")
+    memory_db.add(site)
+    memory_db.commit()
+    bodies = {"https://broken.test/feed": "<html>moved</html>", "https://broken.test/": PAGE}
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(side_effect=lambda url, **kwargs: FetchResult(site.id, url, status_code=200, text=bodies[url]))
+
+    result = check_site(site, memory_db, scraper)
+    assert result["success"]
+    assert [post["title"] for post in result["posts"]] == ["HTML post"]
+    assert site.active_ingest == "html"
+    check_site(site, memory_db, scraper)
+    assert scraper.fetch.call_args.args[0] == "https://broken.test/"
+
+    site.ingest_mode = "feed"
+    result = check_site(site, memory_db, scraper)
+    assert not result["success"] and "Not a feed" in result["error"]
+
+
+def test_site_api_accepts_ingest_settings(api_client):
+    response = api_client.post("/api/sites/", json={
+        "name": "Api", "url": "https://api-feed.test", "selector": "div",
+        "ingest_mode": "feed", "feed_url": "https://api-feed.test/rss",
+    })
+    assert response.status_code == 201
+    body = response.json()
+    assert body["ingest_mode"] == "feed" and body["feed_url"] == "https://api-feed.test/rss"
+    assert api_client.put(f"/api/sites/{body['id']}", json={"ingest_mode": "bogus"}).status_code == 422
+    assert api_client.put(f"/api/sites/{body['id']}", json={"ingest_mode": "html"}).json()["active_ingest"] is None
@@ -0,0 +1,72 @@
+import re
+from datetime import datetime, timezone
+
+import pytest
+
+from app.feed_writer import StreamingFeedWriter
+from app.rss_generator import RSSGenerator
+
+ITEMS = [
+    {"title": "Newest & <best>", "link": "https://e.test/3?a=1&b=\"2\"", "description": "Line1\nLine2\r\n",
+     "guid": "h3", "pubdate": datetime(2025, 1, 3, 10, 0, 0)},
+    {"title": "Middle", "link": "https://e.test/2", "description": None, "guid": None,
+     "pubdate": datetime(2025, 1, 2, 10, 0, 0, tzinfo=timezone.utc)},
+    {"title": "Oldest 'q'", "link": "https://e.test/1", "description": "<b>html</b>", "guid": "h1", "pubdate": None},
+]
+
+# Время сборки feedgen берет сам — приводим его к фиксированному значению
+TIMESTAMPS = re.compile(r"(<lastBuildDate>|<updated>)[^<]*(</)")
+
+
+def normalize(xml):
+    return TIMESTAMPS.sub(r"\1NOW\2", xml)
+
+
+def feedgen_output(fmt, pretty):
+    gen = RSSGenerator(title="Site & Co", link="https://e.test/?x=1&y=2", description="Desc <d>")
+    # RSSGenerator выводит последний добавленный элемент первым
+    for item in reversed(ITEMS):
+        gen.add_item(**item)
+    gen.fg._FeedGenerator__feed_entries = []
+    for item in gen._items:
+        gen._add_entry_to_feed(**item)
+    return (gen.fg.rss_str if fmt == "rss" else gen.fg.atom_str)(pretty=pretty).decode("utf-8")
+
+
+@pytest.mark.parametrize("fmt", ["rss", "atom"])
+@pytest.mark.parametrize("pretty", [True, False])
+def test_streaming_writer_matches_feedgen(fmt, pretty):
+    writer = StreamingFeedWriter(title="Site & Co", link="https://e.test/?x=1&y=2", description="Desc <d>", pretty=pretty)
+    assert normalize(writer.render(ITEMS, fmt)) == normalize(feedgen_output(fmt, pretty))
+
+
+def test_streaming_writer_yields_one_chunk_per_item():
+    writer = StreamingFeedWriter(title="T", link="https://e.test/", description="D")
+    chunks = list(writer.iter_rss(iter(ITEMS)))
+    assert len(chunks) == len(ITEMS) + 2
+    assert chunks[1].strip().startswith("<item>")
+
+
+@pytest.mark.parametrize("path", ["/feed/{id}", "/feed/{id}/atom"])
+def test_feeds_router_stream_renderer_matches_feedgen(api_client, memory_db, monkeypatch, path):
+    from app.feed_cache import feed_cache
+    from app.models import Site, Post
+    from app.routers import feeds
+    site = Site(name="S & S", url="https://s.test", selector="div", description="About <s>")
+    memory_db.add(site)
+    memory_db.commit()
+    for i in range(3):
+        memory_db.add(Post(site_id=site.id, title=f"P{i} & more", url=f"https://s.test/{i}", description=f"D{i}",
+                           content_hash=f"h{i}", published_at=datetime(2025, 1, 1 + i)))
+    memory_db.commit()
+    url = path.format(id=site.id)
+    expected = api_client.get(url).text
+    feed_cache.clear()
+    monkeypatch.setattr(feeds, "FEED_RENDERER", "stream")
+    streamed = api_client.get(url)
+    assert streamed.status_code == 200
+    assert streamed.headers["X-Feed-Cache"] == "MISS"
+    assert normalize(streamed.text) == normalize(expected)
+    # Поток отдается без сборки документа для кеша
+    assert api_client.get(url).headers["X-Feed-Cache"] == "MISS"
+    assert feed_cache.stats()["entries"] == 0
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from app.models import Site, Post
+
+
+def make_site(db, posts=1):
+    site = Site(name="Feed", url="https://feed.test", selector="div")
+    db.add(site)
+    db.commit()
+    for i in range(posts):
+        db.add(Post(site_id=site.id, title=f"Post {i}", url=f"https://feed.test/{i}",
+                    content_hash=f"h{i}", created_at=datetime(2025, 1, 1 + i, 12, 0, 0)))
+    db.commit()
+    return site.id
+
+
+def test_feed_sets_validators_and_cache_control(api_client, memory_db):
+    site_id = make_site(memory_db, posts=2)
+    response = api_client.get(f"/feed/{site_id}")
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"')
+    assert response.headers["Last-Modified"] == "Thu, 02 Jan 2025 12:00:00 GMT"
+    assert "max-age=" in response.headers["Cache-Control"]
+    atom = api_client.get(f"/feed/{site_id}/atom")
+    assert atom.headers["ETag"] != response.headers["ETag"]
+
+
+def test_feed_if_none_match_returns_304(api_client, memory_db):
+    site_id = make_site(memory_db)
+    etag = api_client.get(f"/feed/{site_id}").headers["ETag"]
+    response = api_client.get(f"/feed/{site_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    # Новый пост меняет ETag
+    memory_db.add(Post(site_id=site_id, title="New", url="https://feed.test/new", content_hash="new"))
+    memory_db.commit()
+    assert api_client.get(f"/feed/{site_id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_feed_if_modified_since(api_client, memory_db):
+    site_id = make_site(memory_db)
+    fresh = api_client.get(f"/feed/{site_id}", headers={"If-Modified-Since": "Wed, 01 Jan 2025 12:00:00 GMT"})
+    assert fresh.status_code == 304
+    stale = api_client.get(f"/feed/{site_id}", headers={"If-Modified-Since": "Tue, 31 Dec 2024 00:00:00 GMT"})
+    assert stale.status_code == 200
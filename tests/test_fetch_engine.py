@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+import time
+
+import httpx
+
+from app.fetch_engine import ACCEPT_ENCODING, AsyncFetchEngine, ResponseTooLarge, sniff_charset
+from app.host_guard import HostGuard
+from app.scraper import WebScraper
+
+
+def make_transport(delays, active, peak):
+    async def handler(request):
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        try:
+            await asyncio.sleep(delays.get(str(request.url), 0.05))
+        finally:
+            active[host] -= 1
+        if request.url.path == "/missing":
+            return httpx.Response(404, text="not found")
+        return httpx.Response(200, text=f"<html><body>{request.url}</body></html>")
+    return httpx.MockTransport(handler)
+
+
+def test_fetch_many_runs_concurrently():
+    delays = {f"https://host{i}.test/": 0.3 for i in range(10)}
+    engine = AsyncFetchEngine("test-agent", transport=make_transport(delays, {}, {}))
+    started = time.monotonic()
+    results = list(engine.fetch_many((i, f"https://host{i}.test/") for i in range(10)))
+    elapsed = time.monotonic() - started
+    engine.close()
+    assert len(results) == 10
+    assert all(r.ok and r.status_code == 200 for r in results)
+    assert sorted(r.key for r in results) == list(range(10))
+    # Последовательно было бы ~3 секунды
+    assert elapsed < 1.5
+
+
+def test_fetch_many_respects_per_host_limit():
+    active, peak = {}, {}
+    engine = AsyncFetchEngine("test-agent", per_host_concurrency=2, transport=make_transport({}, active, peak))
+    results = list(engine.fetch_many((i, f"https://same.test/page{i}") for i in range(8)))
+    engine.close()
+    assert len(results) == 8
+    assert peak["same.test"] == 2
+
+
+def test_fetch_many_reports_errors_per_url():
+    engine = AsyncFetchEngine("test-agent", transport=make_transport({}, {}, {}))
+    results = {r.key: r for r in engine.fetch_many([(1, "https://a.test/"), (2, "https://a.test/missing")])}
+    engine.close()
+    assert results[1].ok
+    assert not results[2].ok
+    assert isinstance(results[2].error, httpx.HTTPStatusError)
+
+
+def test_fetch_many_isolates_malformed_urls():
+    guard = HostGuard(rate=0, failure_threshold=1, reset_timeout=0)
+    guard.record("bad.test", ok=False)  # цепь разомкнута, следующий запрос — пробный
+    engine = AsyncFetchEngine("test-agent", transport=make_transport({}, {}, {}), host_guard=guard)
+    try:
+        results = {r.key: r for r in engine.fetch_many([
+            (1, "https://a.test/"), (2, "https://[::1"), (3, "https://bad.test/\x00"), (4, "https://b.test/"),
+        ])}
+        assert results[1].ok and results[4].ok
+        assert isinstance(results[2].error, ValueError)
+        assert isinstance(results[3].error, httpx.InvalidURL)
+        # Пробный слот полуоткрытой цепи освобожден: хост можно проверить снова
+        assert engine.fetch("https://bad.test/").ok
+        assert guard.state("bad.test") == "closed"
+    finally:
+        engine.close()
+
+
+def test_engine_keeps_client_between_calls_and_restarts_after_close():
+    engine = AsyncFetchEngine("test-agent", transport=make_transport({}, {}, {}))
+    assert not engine.running
+    engine.fetch("https://a.test/")
+    client = engine._client
+    assert engine.fetch("https://b.test/").ok
+    assert engine._client is client
+    engine.close()
+    assert not engine.running
+    assert engine.fetch("https://a.test/").ok
+    assert engine._client is not client
+    engine.close()
+
+
+def test_compressed_body_is_decoded_and_kept_as_bytes():
+    seen = {}
+    page = "<html><head><meta charset='windows-1251'></head><body><h2>Привет</h2></body></html>".encode("cp1251")
+
+    def handler(request):
+        seen["accept"] = request.headers["accept-encoding"]
+        return httpx.Response(200, content=gzip.compress(page),
+                              headers={"content-encoding": "gzip", "content-type": "text/html"})
+    engine = AsyncFetchEngine("test-agent", transport=httpx.MockTransport(handler))
+    result = engine.fetch("https://gz.test/")
+    engine.close()
+    assert seen["accept"] == ACCEPT_ENCODING and "gzip" in ACCEPT_ENCODING
+    assert result.content == page and result.encoding == "cp1251"
+    assert "Привет" in result.text
+    parsed = WebScraper().parse_page(result.markup, encoding=result.encoding)
+    assert parsed.backend.text(parsed.backend.select_one(parsed.root, parsed.backend.compile("h2"))) == "Привет"
+
+
+def test_body_over_limit_is_aborted():
+    async def stream():
+        for _ in range(100):
+            yield b"x" * 1024
+
+    def handler(request):
+        if request.url.path == "/declared":
+            return httpx.Response(200, content=b"x" * 4096)
+        return httpx.Response(200, content=stream())
+    engine = AsyncFetchEngine("test-agent", transport=httpx.MockTransport(handler), max_bytes=2048)
+    try:
+        declared = engine.fetch("https://big.test/declared")
+        assert isinstance(declared.error, ResponseTooLarge) and declared.error.size == 4096
+        streamed = engine.fetch("https://big.test/stream")
+        assert isinstance(streamed.error, ResponseTooLarge) and "2048 bytes" in str(streamed.error)
+        assert engine.fetch("https://big.test/stream", max_bytes=0).content == b"x" * 100 * 1024
+        assert engine.host_guard.state("big.test") == "closed"
+    finally:
+        engine.close()
+
+
+def test_sniff_charset_sources():
+    assert sniff_charset("text/html; charset=KOI8-R", b"") == "koi8-r"
+    assert sniff_charset("text/html; charset=bogus", b"<meta charset=utf-8>") == "utf-8"
+    assert sniff_charset(None, b'<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-5">') == "iso8859-5"
+    assert sniff_charset("application/xml", b'<?xml version="1.0" encoding="windows-1252"?><rss/>') == "cp1252"
+    assert sniff_charset("text/html; charset=latin-1", "\ufeff<p>".encode("utf-8")) == "utf-8"
+    assert sniff_charset(None, b"<p>plain</p>") == "utf-8"
+
+
+def test_check_site_applies_site_page_size_limit(memory_db):
+    from app.models import Site
+    from app.scheduler import check_site
+    site = Site(name="Big", url="https://huge.test/", selector="div", max_page_size=1024)
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"<div>x</div>" * 200)))
+    try:
+        result = check_site(site, memory_db, scraper)
+    finally:
+        scraper.close()
+    assert not result["success"] and "exceeds limit of 1024 bytes" in result["error"]
+    assert site.error_count == 1
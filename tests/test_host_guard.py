@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.fetch_engine import AsyncFetchEngine
+from app.host_guard import CircuitBreaker, CircuitOpenError, HostGuard, TokenBucket, restore_host_states
+from app.models import HostState, Site
+from app.scheduler import check_site, next_check_time
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure("timeout")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += 61
+    assert breaker.allow()          # один пробный запрос
+    assert not breaker.allow()
+    breaker.record_failure("timeout")
+    assert breaker.state == "open"
+
+    clock.now += 61
+    assert breaker.allow()
+    assert breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_dead_host_costs_one_rejection_instead_of_timeouts():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.host)
+        if request.url.host == "dead.test":
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/missing":
+            return httpx.Response(404, text="not found")
+        return httpx.Response(200, text="ok")
+
+    guard = HostGuard(rate=0, failure_threshold=2, reset_timeout=300)
+    engine = AsyncFetchEngine("test-agent", transport=httpx.MockTransport(handler), host_guard=guard)
+    try:
+        results = [engine.fetch(f"https://dead.test/{i}") for i in range(5)]
+        assert calls.count("dead.test") == 2
+        assert all(isinstance(r.error, CircuitOpenError) for r in results[2:])
+        # 404 — ошибка страницы, а не хоста: цепь не размыкается
+        for _ in range(3):
+            assert isinstance(engine.fetch("https://alive.test/missing").error, httpx.HTTPStatusError)
+        assert engine.fetch("https://alive.test/").ok
+        assert guard.state("alive.test") == "closed"
+        assert guard.stats()["open"] == 1
+        assert guard.stats()["rejected"] == 3
+    finally:
+        engine.close()
+
+
+def test_error_count_and_host_state_are_persisted(memory_db):
+    async def handler(request):
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    guard = HostGuard(rate=0, failure_threshold=1, reset_timeout=300)
+    engine = AsyncFetchEngine("test-agent", transport=httpx.MockTransport(handler), host_guard=guard)
+
+    class Scraper:
+        def fetch(self, url, headers=None, timeout=None):
+            return engine.fetch(url, headers=headers, timeout=timeout)
+
+    scraper = Scraper()
+    scraper.engine = engine
+    site = Site(name="Down", url="https://down.test/news", selector="div", check_interval=10)
+    memory_db.add(site)
+    memory_db.commit()
+    try:
+        assert not check_site(site, memory_db, scraper)["success"]
+        assert not check_site(site, memory_db, scraper)["success"]
+    finally:
+        engine.close()
+    assert site.error_count == 2
+    assert "Circuit open" in site.last_error
+    row = memory_db.get(HostState, "down.test")
+    assert row.state == "open" and row.opened_at is not None
+
+    # Новый процесс восстанавливает разомкнутую цепь и не ходит на хост
+    restored = HostGuard(rate=0, failure_threshold=1, reset_timeout=300)
+    restore_host_states(memory_db, restored)
+    with pytest.raises(CircuitOpenError):
+        restored.before_request("down.test")
+
+
+def test_next_check_time_backs_off_after_errors():
+    site = Site(check_interval=10, error_count=0)
+    now = datetime(2025, 1, 1)
+    assert next_check_time(site, now) == now + timedelta(minutes=10)
+    site.error_count = 3
+    assert next_check_time(site, now) == now + timedelta(minutes=40)
+    site.error_count = 20
+    assert next_check_time(site, now) == now + timedelta(minutes=180)
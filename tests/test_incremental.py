@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock
+
+from app.fetch_engine import FetchResult
+from app.known_posts import KnownPostWindow, known_posts
+from app.models import Post, Site
+from app.scheduler import check_site
+from app.scraper import WebScraper, compute_content_hash
+
+
+def listing(ids):
+    items = "".join(f'<div class="p"><h2>Post {i}</h2><a href="/p/{i}">more</a></div>' for i in ids)
+    return f"<html><body>{items}</body></html>"
+
+
+def post_hash(i):
+    return compute_content_hash(f"Post {i}", None, f"https://inc.test/p/{i}")
+
+
+def extract(scraper, html, **kwargs):
+    return scraper.extract_posts(scraper.parse_page(html), "div.p", title_selector="h2", link_selector="a",
+                                 base_url="https://inc.test", **kwargs)
+
+
+def test_extraction_stops_after_consecutive_known_posts():
+    scraper = WebScraper()
+    html = listing(range(12, 0, -1))
+    assert len(extract(scraper, html)) == 12
+    known = frozenset(post_hash(i) for i in range(1, 11))
+    posts = extract(scraper, html, known_hashes=known, stop_after=3)
+    assert [post["title"] for post in posts] == ["Post 12", "Post 11", "Post 10", "Post 9", "Post 8"]
+    # Известный пост между новыми не прерывает обход
+    interleaved = listing([12, 10, 11, 9, 8, 7, 6])
+    posts = extract(scraper, interleaved, known_hashes=known, stop_after=3)
+    assert [post["title"] for post in posts][:4] == ["Post 12", "Post 10", "Post 11", "Post 9"]
+    assert len(posts) == 6
+    assert len(extract(scraper, html, known_hashes=known, stop_after=0)) == 12
+
+
+def test_check_site_passes_known_window_and_saves_only_new(memory_db):
+    site = Site(name="Inc", url="https://inc.test", selector="div.p", title_selector="h2", link_selector="a",
+                incremental_stop_after=3)
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(return_value=FetchResult(site.id, site.url, status_code=200, text=listing(range(30, 0, -1))))
+    first = check_site(site, memory_db, scraper)
+    assert first["new_posts_count"] == 30 and len(first["posts"]) == 30
+
+    known_posts.clear()  # новый процесс: окно заполняется из БД
+    seeded = known_posts.stats()["seeded"]
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200, text=listing(range(32, 0, -1)))
+    second = check_site(site, memory_db, scraper)
+    assert second["new_posts_count"] == 2
+    assert len(second["posts"]) == 5
+    assert memory_db.query(Post).filter_by(site_id=site.id).count() == 32
+    assert known_posts.stats()["seeded"] == seeded + 1
+    assert {post_hash(32), post_hash(31)} <= known_posts.hashes(memory_db, site.id)
+
+
+def test_pinned_known_posts_do_not_hide_new_ones_by_default(memory_db):
+    site = Site(name="Inc", url="https://inc.test", selector="div.p", title_selector="h2", link_selector="a")
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(return_value=FetchResult(site.id, site.url, status_code=200, text=listing([100, 101, 102, 3, 2, 1])))
+    assert check_site(site, memory_db, scraper)["new_posts_count"] == 6
+
+    # Закрепленные посты 100–102 остаются наверху, новый пост 4 — под ними
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200, text=listing([100, 101, 102, 4, 3, 2, 1]))
+    result = check_site(site, memory_db, scraper)
+    assert result["new_posts_count"] == 1
+    assert memory_db.query(Post).filter_by(site_id=site.id, content_hash=post_hash(4)).count() == 1
+
+    # С порогом сайта обход останавливается на закрепленных постах
+    site.incremental_stop_after = 3
+    memory_db.commit()
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200, text=listing([100, 101, 102, 5, 4, 3, 2, 1]))
+    result = check_site(site, memory_db, scraper)
+    assert result["new_posts_count"] == 0 and len(result["posts"]) == 3
+
+
+def test_window_keeps_newest_hashes_per_site():
+    window = KnownPostWindow(window=4, max_sites=2)
+    window.remember(1, ["c", "b", "a"])
+    window.remember(1, ["e", "d", "c"])
+    assert window.hashes(None, 1) == frozenset("edcb")
+    window.remember(2, ["x"])
+    window.remember(3, ["y"])
+    assert window.stats()["sites"] == 2
+    window.invalidate_site(3)
+    assert window.stats()["sites"] == 1
@@ -0,0 +1,152 @@
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.fetch_engine import FetchResult
+from app.leases import claim_due_sites, claim_site, release_site, utcnow
+from app.models import Site
+from app.scheduler import check_all_sites, run_site_check
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """Файловая SQLite: у каждой сессии свое соединение, как у разных процессов."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def add_sites(factory, count):
+    db = factory()
+    sites = [Site(name=f"L{i}", url=f"https://lease{i}.test", selector="div", check_interval=10) for i in range(count)]
+    db.add_all(sites)
+    db.commit()
+    ids = [site.id for site in sites]
+    db.close()
+    return ids
+
+
+def test_only_one_worker_claims_a_site(file_session_factory):
+    (site_id,) = add_sites(file_session_factory, 1)
+    worker_a, worker_b = file_session_factory(), file_session_factory()
+    now = utcnow()
+    assert claim_site(worker_a, site_id, "a", lease_seconds=60, now=now)
+    assert not claim_site(worker_b, site_id, "b", lease_seconds=60, now=now)
+    # Аренда упавшего воркера истекает — сайт подхватывает другой
+    assert claim_site(worker_b, site_id, "b", lease_seconds=60, now=now + timedelta(seconds=61))
+    assert not release_site(worker_a, site_id, "a", now + timedelta(minutes=10))
+    assert release_site(worker_b, site_id, "b", now + timedelta(minutes=10))
+    # До next_check_at сайт не выдается никому
+    assert not claim_site(worker_a, site_id, "a", now=now + timedelta(minutes=5))
+    assert claim_site(worker_a, site_id, "a", now=now + timedelta(minutes=10))
+    worker_a.close()
+    worker_b.close()
+
+
+def test_workers_split_due_sites_without_overlap(file_session_factory):
+    ids = add_sites(file_session_factory, 10)
+    worker_a, worker_b = file_session_factory(), file_session_factory()
+    first = claim_due_sites(worker_a, "a", limit=6)
+    second = claim_due_sites(worker_b, "b", limit=100)
+    assert len(first) == 6
+    assert sorted(first + second) == ids
+    worker_a.close()
+    worker_b.close()
+
+
+def test_due_sites_are_claimed_in_one_statement(file_session_factory):
+    ids = add_sites(file_session_factory, 5)
+    db = file_session_factory()
+    statements = []
+    engine = db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper())
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert claim_due_sites(db, "a") == ids
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements.count("UPDATE") == 1
+    assert claim_due_sites(db, "b") == []
+    db.close()
+
+
+def test_run_site_check_skips_site_leased_elsewhere(file_session_factory):
+    (site_id,) = add_sites(file_session_factory, 1)
+    other = file_session_factory()
+    assert claim_site(other, site_id, "other")
+    scraper = MagicMock()
+
+    result = run_site_check(site_id, file_session_factory, scraper, lease_owner="me")
+    assert result["skipped"] == "leased"
+    assert result["next_check_at"] > utcnow()
+    scraper.fetch.assert_not_called()
+
+    release_site(other, site_id, "other", next_check_at=None)
+    other.close()
+    scraper.fetch.return_value = FetchResult(site_id, "https://lease0.test", status_code=304)
+    result = run_site_check(site_id, file_session_factory, scraper, lease_owner="me")
+    assert result["success"] and result["skipped"] == "not_modified"
+    db = file_session_factory()
+    site = db.get(Site, site_id)
+    assert site.lease_owner is None
+    assert site.next_check_at - utcnow() > timedelta(minutes=9)
+    db.close()
+
+
+def test_check_all_sites_with_lease_checks_each_site_once(file_session_factory):
+    add_sites(file_session_factory, 4)
+    scraper = MagicMock()
+    scraper.fetch_pages.side_effect = lambda targets, **kwargs: [
+        FetchResult(key, url, status_code=304) for key, url, _ in targets
+    ]
+    db_a, db_b = file_session_factory(), file_session_factory()
+    first = check_all_sites(db_a, scraper, lease_owner="a")
+    second = check_all_sites(db_b, scraper, lease_owner="b")
+    assert len(first) == 4
+    assert second == []
+    db_a.close()
+    db_b.close()
+
+
+def test_long_cycle_renews_leases_of_sites_not_checked_yet(file_session_factory, monkeypatch):
+    add_sites(file_session_factory, 3)
+    monkeypatch.setattr("app.scheduler.LEASE_SECONDS", 0.1)
+    observer = file_session_factory()
+    seen = []
+
+    def lease_of_last():
+        observer.expire_all()
+        return observer.query(Site).order_by(Site.id.desc()).first().lease_until
+
+    def fetch_pages(targets, **kwargs):
+        for key, url, _ in sorted(targets):
+            seen.append(lease_of_last())
+            time.sleep(0.06)
+            yield FetchResult(key, url, status_code=304)
+
+    scraper = MagicMock()
+    scraper.fetch_pages.side_effect = fetch_pages
+    db = file_session_factory()
+    assert len(check_all_sites(db, scraper, lease_owner="slow")) == 3
+    db.close()
+    # Аренда последнего сайта продлевалась, пока проверялись первые
+    assert seen[-1] > seen[0]
+    assert lease_of_last() is None
+    observer.close()
+
+
+def test_manual_claim_skips_site_checked_after_the_request(file_session_factory):
+    (site_id,) = add_sites(file_session_factory, 1)
+    db = file_session_factory()
+    requested_at = utcnow()
+    db.get(Site, site_id).last_check = requested_at + timedelta(seconds=1)
+    db.commit()
+    assert not claim_site(db, site_id, "manual", force=True, unchecked_since=requested_at)
+    assert claim_site(db, site_id, "manual", force=True, unchecked_since=requested_at + timedelta(seconds=2))
+    db.close()
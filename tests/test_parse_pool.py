@@ -0,0 +1,63 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.benchmark_parsers import FIXTURES, FIXTURES_DIR
+from app.fetch_engine import FetchResult
+from app.models import Site, Post
+from app.parse_pool import ParsePool, extract_records, records_to_posts
+from app.scheduler import check_all_sites
+from app.scraper import WebScraper
+
+BLOG = "blog_listing.html"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_records_match_scraper_extract_posts():
+    html = load_fixture(BLOG)
+    scraper = WebScraper()
+    expected = scraper.extract_posts(scraper.parse_page(html), **FIXTURES[BLOG])
+    records = extract_records(html.encode("utf-8"), FIXTURES[BLOG])
+    assert all(isinstance(record, tuple) for record in records)
+    assert records_to_posts(records) == expected
+
+
+@pytest.fixture(scope="module")
+def process_pool():
+    pool = ParsePool(max_workers=2)
+    yield pool
+    pool.close()
+
+
+def test_process_pool_extracts_same_posts(process_pool):
+    html = load_fixture(BLOG)
+    inline = ParsePool(max_workers=0).extract_posts(html, FIXTURES[BLOG], parser="html.parser")
+    futures = [process_pool.submit(html, FIXTURES[BLOG], parser, 7) for parser in ("html.parser", "lxml")]
+    assert [records_to_posts(f.result(timeout=60)) for f in futures] == [inline, inline]
+
+
+def test_check_all_sites_parses_in_pool(memory_db, process_pool):
+    html = load_fixture(BLOG)
+    selectors = FIXTURES[BLOG]
+    sites = [
+        Site(name=f"P{i}", url=f"https://pool{i}.test/", selector=selectors["post_selector"],
+             title_selector=selectors["title_selector"], desc_selector=selectors["desc_selector"],
+             link_selector=selectors["link_selector"])
+        for i in range(3)
+    ]
+    memory_db.add_all(sites)
+    memory_db.commit()
+    scraper = MagicMock()
+    scraper.fetch_pages.return_value = [FetchResult(site.id, site.url, status_code=200, text=html) for site in sites]
+
+    results = check_all_sites(memory_db, scraper, parse_pool=process_pool)
+
+    assert sorted(r["site_id"] for r in results) == sorted(site.id for site in sites)
+    assert all(r["success"] and r["new_posts_count"] == 40 for r in results)
+    scraper.extract_posts.assert_not_called()
+    assert memory_db.query(Post).count() == 120
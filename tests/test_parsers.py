@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from app.benchmark_parsers import FIXTURES, FIXTURES_DIR
+from app.parsers import FALLBACK_PARSER, available_backends, get_backend
+from app.scraper import WebScraper
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+@pytest.mark.parametrize("parser", available_backends())
+def test_backends_extract_same_posts_as_html_parser(name, parser):
+    scraper = WebScraper(parser=FALLBACK_PARSER)
+    html = load_fixture(name)
+    expected = scraper.extract_posts(scraper.parse_page(html), **FIXTURES[name])
+    posts = scraper.extract_posts(scraper.parse_page(html, parser=parser), **FIXTURES[name])
+    assert len(expected) > 0
+    assert posts == expected
+
+
+def test_text_skips_script_style_and_comments():
+    post = load_fixture("blog_listing.html")
+    scraper = WebScraper()
+    posts = scraper.extract_posts(scraper.parse_page(post, parser=FALLBACK_PARSER), **FIXTURES["blog_listing.html"])
+    fifth = posts[4]
+    assert "track" not in fifth["description"]
+    assert "комментарий" not in fifth["description"]
+    assert fifth["title"] == "Пост №5:важное& «новое»"
+    assert fifth["url"] == "https://blog.example.com/posts/5?ref=list&page=1"
+
+
+@pytest.mark.parametrize("parser", available_backends())
+def test_content_hash_does_not_depend_on_backend(parser):
+    html = ('<div class="p"><h2>Пост<template><b>черновик</b></template> №1</h2>'
+            '<p>Текст<script>var x = "<b>";</script><style>p {}</style><!-- c --> &amp; еще</p>'
+            '<a href="/p/1">далее</a></div>')
+    selectors = {"post_selector": "div.p", "title_selector": "h2", "desc_selector": "p", "link_selector": "a",
+                 "base_url": "https://hash.test"}
+    scraper = WebScraper()
+    expected = scraper.extract_posts(scraper.parse_page(html, parser=FALLBACK_PARSER), **selectors)
+    posts = scraper.extract_posts(scraper.parse_page(html, parser=parser), **selectors)
+    assert expected[0]["title"] == "Пост№1"
+    assert [post["content_hash"] for post in posts] == [post["content_hash"] for post in expected]
+
+
+def test_migration_keeps_html_parser_for_existing_sites(memory_db):
+    from app.models import Site
+    memory_db.add_all([Site(name="Old", url="https://old.test", selector="div"),
+                       Site(name="Own", url="https://own.test", selector="div", parser="selectolax")])
+    memory_db.commit()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "alembic_migration_pin_site_parser.sql")
+    with open(path, encoding="utf-8") as f:
+        memory_db.connection().connection.executescript(f.read())
+    memory_db.expire_all()
+    assert [site.parser for site in memory_db.query(Site).order_by(Site.id)] == ["html.parser", "selectolax"]
+
+
+def test_extract_posts_accepts_beautifulsoup():
+    html = '<div class="p"><a href="/a">A</a></div>'
+    scraper = WebScraper()
+    posts = scraper.extract_posts(BeautifulSoup(html, "html.parser"), "div.p", title_selector="a",
+                                  link_selector="a", base_url="https://x.test/")
+    assert posts[0]["title"] == "A"
+    assert posts[0]["url"] == "https://x.test/a"
+
+
+@pytest.mark.skipif("lxml" not in available_backends(), reason="lxml/cssselect не установлены")
+def test_unsupported_selector_falls_back_to_html_parser():
+    html = '<div class="p"><h2>Today</h2></div><div class="p"><h2>no</h2></div>'
+    scraper = WebScraper(parser="lxml")
+    posts = scraper.extract_posts(scraper.parse_page(html), 'div.p:-soup-contains("Today")', title_selector="h2")
+    assert [p["title"] for p in posts] == ["Today"]
+
+
+def test_unknown_backend_falls_back_to_html_parser():
+    assert get_backend("no-such-parser").name == FALLBACK_PARSER
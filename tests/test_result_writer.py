@@ -0,0 +1,153 @@
+import threading
+from unittest.mock import MagicMock
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, make_engine
+from app.fetch_engine import FetchResult
+from app.models import Post, Site
+from app.result_writer import ResultWriter, register_result_writer, result_writer_for, unregister_result_writer
+from app.scheduler import check_all_sites, check_site
+
+
+def file_engine(tmp_path, name="wal.db"):
+    engine = make_engine(f"sqlite:///{tmp_path / name}")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def test_wal_pragmas_are_applied_on_connect(tmp_path):
+    engine = file_engine(tmp_path)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -65536
+    engine.dispose()
+
+
+def test_concurrent_checks_are_written_in_shared_transactions(tmp_path):
+    engine = file_engine(tmp_path)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    sites = [Site(name=f"W{i}", url=f"https://w{i}.test", selector="div") for i in range(12)]
+    db.add_all(sites)
+    db.commit()
+    site_ids = [site.id for site in sites]
+    db.close()
+
+    scraper = MagicMock()
+    scraper.fetch.side_effect = lambda url, **kwargs: FetchResult(None, url, status_code=200, text=f"<p>{url}</p>")
+    scraper.extract_posts.side_effect = lambda html, site_id, **kwargs: [
+        {"title": f"{site_id}-{n}", "url": f"https://w.test/{site_id}/{n}", "content_hash": f"{site_id}-{n}"}
+        for n in range(2)
+    ]
+    writer = ResultWriter(factory, max_delay=0.2)
+    writer.start()
+    register_result_writer(engine, writer)
+    results = []
+    barrier = threading.Barrier(len(site_ids))
+
+    def run(site_id):
+        session = factory()
+        try:
+            site = session.get(Site, site_id)
+            barrier.wait(2)
+            results.append(check_site(site, session, scraper))
+            # Изменения сайта записал поток записи, сессии нечего коммитить
+            assert not session.dirty
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=run, args=(site_id,)) for site_id in site_ids]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        unregister_result_writer(engine)
+        writer.close()
+
+    assert len(results) == len(site_ids)
+    assert all(result["success"] and result["new_posts_count"] == 2 for result in results)
+    stats = writer.stats()
+    # Результат проверки и, после записи постов, хеш страницы
+    assert stats["ops"] == 2 * len(site_ids) and stats["posts"] == 2 * len(site_ids)
+    assert stats["batches"] < len(site_ids)
+    db = factory()
+    assert db.query(Post).count() == 2 * len(site_ids)
+    for site in db.query(Site).all():
+        assert site.last_check is not None and site.error_count == 0
+        assert site.checks_count == 1 and site.next_check_at is not None
+        assert site.content_digest is not None
+    db.close()
+    engine.dispose()
+
+
+def test_failed_operation_does_not_lose_the_rest_of_the_batch(tmp_path):
+    engine = file_engine(tmp_path)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    site = Site(name="Ok", url="https://ok.test", selector="div")
+    db.add(site)
+    db.commit()
+    writer = ResultWriter(factory, max_delay=0.2)
+    writer.start()
+    try:
+        bad = writer.submit(site.id, values={"no_such_column": 1})
+        good = writer.submit(site.id, values={"last_error": "boom"})
+        assert good.result(2) == 0
+        assert isinstance(bad.exception(2), Exception)
+    finally:
+        writer.close()
+    db.expire_all()
+    assert db.get(Site, site.id).last_error == "boom"
+    assert writer.stats()["errors"] == 1
+    db.close()
+    engine.dispose()
+
+
+def test_sessions_without_registered_writer_commit_themselves(memory_db):
+    assert result_writer_for(memory_db) is None
+    assert result_writer_for(MagicMock()) is None
+
+
+def test_cycle_queues_results_and_lease_releases_without_waiting(tmp_path):
+    engine = file_engine(tmp_path)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add_all([Site(name=f"C{i}", url=f"https://c{i}.test", selector="div") for i in range(6)])
+    db.commit()
+    db.close()
+
+    scraper = MagicMock()
+    scraper.fetch_pages.side_effect = lambda targets, **kwargs: [
+        FetchResult(key, url, status_code=200, text=f"<p>{url}</p>") for key, url, _ in targets
+    ]
+    scraper.extract_posts.side_effect = lambda html, site_id, **kwargs: [
+        {"title": f"{site_id}", "url": f"https://c.test/{site_id}", "content_hash": f"c-{site_id}"}
+    ]
+    writer = ResultWriter(factory, max_delay=0.2)
+    writer.start()
+    register_result_writer(engine, writer)
+    session = factory()
+    try:
+        results = check_all_sites(session, scraper, lease_owner="cycle")
+    finally:
+        session.close()
+        unregister_result_writer(engine)
+        writer.close()
+
+    assert all(result["success"] and result["new_posts_count"] == 1 for result in results)
+    stats = writer.stats()
+    # Захват аренд + результат, хеш страницы и освобождение аренды каждого сайта
+    assert stats["ops"] == 1 + 3 * len(results) and stats["posts"] == len(results)
+    # Проверки не ждали своих записей: результаты сайтов ушли общими транзакциями
+    assert stats["batches"] < len(results)
+    db = factory()
+    assert db.query(Post).count() == len(results)
+    assert all(site.lease_owner is None and site.next_check_at is not None for site in db.query(Site).all())
+    db.close()
+    engine.dispose()
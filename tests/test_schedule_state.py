@@ -0,0 +1,108 @@
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from app.dispatcher import DueQueueDispatcher
+from app.fetch_engine import FetchResult
+from app.leases import utcnow
+from app.models import Site
+from app.scheduler import TaskScheduler, first_check_delay, jitter_offset, schedule_individual_site_checks
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_new_sites_are_spread_deterministically_across_interval():
+    offsets = [jitter_offset(site_id, 600) for site_id in range(1, 3001)]
+    assert offsets == [jitter_offset(site_id, 600) for site_id in range(1, 3001)]
+    assert all(0 <= offset < 600 for offset in offsets)
+    # Ни в одну 10-секундную щель не попадает больше ~3% сайтов (равномерно — 1.7%)
+    buckets = [0] * 60
+    for offset in offsets:
+        buckets[int(offset // 10)] += 1
+    assert max(buckets) < 90
+
+
+def test_first_check_delay_resumes_saved_schedule():
+    now = utcnow()
+    assert first_check_delay(1, 10, now + timedelta(seconds=90), now) == 90
+    assert first_check_delay(1, 10, now - timedelta(hours=1), now) == 0
+    assert first_check_delay(1, 10, None, now) == jitter_offset(1, 600)
+
+
+def test_restart_resumes_from_next_check_at(memory_session_factory):
+    db = memory_session_factory()
+    now = utcnow()
+    overdue = Site(name="Overdue", url="https://overdue.test", selector="div", check_interval=10,
+                   next_check_at=now - timedelta(minutes=3))
+    later = Site(name="Later", url="https://later.test", selector="div", check_interval=10,
+                 next_check_at=now + timedelta(minutes=7))
+    db.add_all([overdue, later])
+    db.commit()
+    overdue_id, later_id = overdue.id, later.id
+    db.close()
+
+    scraper = MagicMock()
+    scraper.fetch.side_effect = lambda url, **kwargs: FetchResult(None, url, status_code=304)
+    scheduler = TaskScheduler(mode="dispatcher", max_workers=2)
+    schedule_individual_site_checks(scheduler, memory_session_factory, scraper, lease_owner=None)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: scheduler.stats()["dispatcher"]["completed"] == 1)
+    finally:
+        scheduler.shutdown()
+    assert [call.args[0] for call in scraper.fetch.call_args_list] == ["https://overdue.test"]
+
+    db = memory_session_factory()
+    assert db.get(Site, overdue_id).next_check_at - utcnow() > timedelta(minutes=9)
+    assert db.get(Site, later_id).next_check_at == now + timedelta(minutes=7)
+    db.close()
+
+
+def test_jobs_mode_uses_saved_next_check_at(memory_session_factory):
+    db = memory_session_factory()
+    site = Site(name="Jobs", url="https://jobs.test", selector="div", check_interval=10,
+                next_check_at=utcnow() + timedelta(minutes=4))
+    db.add(site)
+    db.commit()
+    site_id = site.id
+    db.close()
+    scheduler = TaskScheduler(mode="jobs")
+    scheduler.start()
+    try:
+        schedule_individual_site_checks(scheduler, memory_session_factory, scraper=None)
+        job = scheduler.scheduler.get_job(f"check_site_{site_id}")
+        remaining = (job.next_run_time.timestamp() - time.time()) / 60
+        assert 3.9 < remaining <= 4
+    finally:
+        scheduler.shutdown()
+
+
+def test_shutdown_drains_in_flight_checks():
+    started, finished = threading.Event(), []
+
+    def run_check(site_id):
+        started.set()
+        time.sleep(0.3)
+        finished.append(site_id)
+
+    dispatcher = DueQueueDispatcher(run_check, max_workers=2)
+    dispatcher.schedule(1, 600, next_due=time.monotonic())
+    dispatcher.start()
+    assert started.wait(2)
+    assert dispatcher.shutdown(wait=True) == 0
+    assert finished == [1]
+    assert dispatcher.stats()["dispatched"] == 1
+
+    slow = DueQueueDispatcher(lambda site_id: time.sleep(1), max_workers=1)
+    slow.schedule(1, 600, next_due=time.monotonic())
+    slow.start()
+    assert wait_until(lambda: slow.stats()["in_flight"] == 1)
+    assert slow.shutdown(wait=True, timeout=0.1) == 1
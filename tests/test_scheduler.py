@@ -1,12 +1,19 @@
 import pytest
 from app.scheduler import TaskScheduler, check_site, check_all_sites
-from unittest.mock import MagicMock, patch
+from app.fetch_engine import FetchResult
+from unittest.mock import ANY, MagicMock, patch
 
 class DummySite:
     def __init__(self, id, url, selector):
         self.id = id
         self.url = url
         self.selector = selector
+        self.title_selector = None
+        self.desc_selector = None
+        self.link_selector = None
+        self.etag = None
+        self.last_modified = None
+        self.content_digest = None
         self.last_check = None
         self.last_error = None
 
@@ -39,6 +46,8 @@ def dummy_db_session():
             self.committed = True
         def rollback(self):
             pass
+        def refresh(self, obj):
+            pass
     return DummySession()
 
 @pytest.fixture
@@ -74,50 +83,99 @@ def test_start_scheduler_alias(scheduler):
     assert scheduler.scheduler.running
     scheduler.shutdown()
 
-def test_check_site_saves_new_posts(dummy_db_session):
-    # Patch app.models.Post and datetime.now(datetime.UTC) to avoid DeprecationWarning
-    import sys
-    import types
-    dummy_models = types.ModuleType('app.models')
-    class DummyPost:
-        def __init__(self, **kwargs):
-            for k, v in kwargs.items():
-                setattr(self, k, v)
-    dummy_models.Post = DummyPost
-    sys.modules['app.models'] = dummy_models
-    import datetime
-    sys.modules['sqlalchemy.exc'] = types.SimpleNamespace(IntegrityError=Exception)
-    # Patch datetime.now(datetime.UTC)
-    orig_datetime = datetime.datetime
-    class DummyDatetime(orig_datetime):
-        @classmethod
-        def now(cls, tz=None):
-            return orig_datetime(2025, 1, 1, tzinfo=tz)
-    datetime.datetime = DummyDatetime
-
-    site = DummySite(1, 'http://test', 'div.post')
+def test_check_site_saves_new_posts(memory_db):
+    from app.models import Site, Post
+    site = Site(name='Test', url='http://test', selector='div.post')
+    memory_db.add(site)
+    memory_db.commit()
     scraper = MagicMock()
-    scraper.fetch_page.return_value = '<html></html>'
+    scraper.fetch.return_value = FetchResult(1, 'http://test', status_code=200, text='<html></html>')
     scraper.extract_posts.return_value = [
-        {'title': 't', 'description': 'd', 'link': 'l', 'content_hash': 'h', 'pub_date': None}
+        {'title': 't', 'description': 'd', 'url': 'l', 'content_hash': 'h', 'pub_date': None},
+        {'title': 't', 'description': 'd', 'url': 'l', 'content_hash': 'h', 'pub_date': None},
     ]
     logger = MagicMock()
-    result = check_site(site, dummy_db_session, scraper, logger)
+    result = check_site(site, memory_db, scraper, logger)
     assert result['success']
     assert result['new_posts_count'] == 1
-    assert dummy_db_session.committed
     logger.info.assert_called()
-    # Cleanup
-    datetime.datetime = orig_datetime
-    del sys.modules['app.models']
-    del sys.modules['sqlalchemy.exc']
+    post = memory_db.query(Post).filter_by(site_id=site.id).one()
+    assert post.content_hash == 'h'
+    assert post.published_at is not None
+
+def test_failed_save_does_not_mark_page_unchanged(memory_db):
+    from app.models import Site, Post
+    site = Site(name='Broken', url='http://broken', selector='div.post')
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = MagicMock()
+    scraper.fetch.return_value = FetchResult(1, 'http://broken', status_code=200, text='<html>same</html>')
+    # title=None нарушает NOT NULL: посты страницы не записываются
+    scraper.extract_posts.return_value = [{'title': None, 'description': 'd', 'url': 'l', 'content_hash': 'h'}]
+    assert check_site(site, memory_db, scraper)['new_posts_count'] == 0
+    assert site.content_digest is None
+    # Та же страница разбирается снова, а не пропускается как unchanged
+    scraper.extract_posts.return_value = [{'title': 't', 'description': 'd', 'url': 'l', 'content_hash': 'h'}]
+    result = check_site(site, memory_db, scraper)
+    assert result['skipped'] is None and result['new_posts_count'] == 1
+    assert site.content_digest is not None
+    assert memory_db.query(Post).filter_by(site_id=site.id).count() == 1
+
+def test_save_new_posts_inserts_only_unknown_hashes(memory_db):
+    from app.models import Site, Post
+    from app.scheduler import save_new_posts
+    site = Site(name='Test', url='http://test', selector='div.post')
+    memory_db.add(site)
+    memory_db.commit()
+    first = [{'title': f't{i}', 'url': f'u{i}', 'content_hash': f'h{i}'} for i in range(3)]
+    assert save_new_posts(memory_db, site.id, first) == 3
+    memory_db.commit()
+    second = first + [{'title': 't3', 'url': 'u3', 'content_hash': 'h3'}]
+    assert save_new_posts(memory_db, site.id, second) == 1
+    memory_db.commit()
+    assert memory_db.query(Post).filter_by(site_id=site.id).count() == 4
 
 def test_check_all_sites_calls_check_site(dummy_db_session):
     scraper = MagicMock()
     scraper.fetch_page.return_value = '<html></html>'
+    scraper.fetch_pages.return_value = [FetchResult(1, 'http://test', status_code=200, text='<html></html>')]
     scraper.extract_posts.return_value = []
     logger = MagicMock()
     with patch('app.scheduler.check_site', wraps=check_site) as check_site_mock:
         results = check_all_sites(dummy_db_session, scraper, logger)
         assert isinstance(results, list)
         check_site_mock.assert_called()
+
+def test_check_site_sends_validators_and_skips_on_304(dummy_db_session):
+    site = DummySite(1, 'http://test', 'div.post')
+    site.etag = '"v1"'
+    site.last_modified = 'Wed, 01 Jan 2025 00:00:00 GMT'
+    scraper = MagicMock()
+    scraper.fetch.return_value = FetchResult(1, 'http://test', status_code=304)
+    result = check_site(site, dummy_db_session, scraper)
+    scraper.fetch.assert_called_once_with('http://test', headers={
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT',
+    }, timeout=ANY)
+    assert result['success']
+    assert result['skipped'] == 'not_modified'
+    scraper.parse_page.assert_not_called()
+    scraper.extract_posts.assert_not_called()
+    assert site.not_modified_count == 1
+    assert site.etag == '"v1"'
+
+def test_check_site_skips_unchanged_body(dummy_db_session):
+    site = DummySite(1, 'http://test', 'div.post')
+    scraper = MagicMock()
+    scraper.extract_posts.return_value = []
+    scraper.fetch.return_value = FetchResult(1, 'http://test', status_code=200, text='<html>same</html>', headers={'etag': '"v2"'})
+    first = check_site(site, dummy_db_session, scraper)
+    assert first['skipped'] is None
+    assert site.etag == '"v2"'
+    assert site.content_digest is not None
+    second = check_site(site, dummy_db_session, scraper)
+    assert second['success']
+    assert second['skipped'] == 'unchanged'
+    assert scraper.extract_posts.call_count == 1
+    assert site.checks_count == 2
+    assert site.unchanged_count == 1
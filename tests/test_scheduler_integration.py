@@ -2,12 +2,13 @@ import pytest
 from app.scheduler import TaskScheduler, check_site
 from app.models import Site
 from app.scraper import WebScraper
+from app.fetch_engine import FetchResult
 from app.database import SessionLocal
 
 class DummyScraper(WebScraper):
-    def fetch_page(self, url, timeout=10):
+    def fetch(self, url, headers=None):
         # Возвращаем заранее подготовленный HTML
-        return "<html><body><h2>Mock Post</h2><p>Mock Desc</p><a href='https://mock/post'></a></body></html>"
+        return FetchResult(None, url, status_code=200, text="<html><body><h2>Mock Post</h2><p>Mock Desc</p><a href='https://mock/post'></a></body></html>")
 
     def extract_posts(self, html, *args, **kwargs):
         # Возвращаем один мок-пост
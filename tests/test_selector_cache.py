@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from app.models import Site
+from app.parsers import FALLBACK_PARSER, get_backend
+from app.scraper import WebScraper
+from app.selector_cache import SelectorPlanCache, selector_plans
+
+PAGE = ''.join(f'<div class="p"><h2>T{i}</h2><a href="/{i}">x</a></div>' for i in range(20))
+
+
+def test_plan_compiled_once_per_site_and_selectors():
+    cache = SelectorPlanCache(max_entries=10)
+    backend = get_backend(FALLBACK_PARSER)
+    with patch.object(backend, "compile", wraps=backend.compile) as compile_spy:
+        first = cache.get_plan(1, backend, "div.p", "h2", None, "a")
+        assert cache.get_plan(1, backend, "div.p", "h2", None, "a") is first
+        assert compile_spy.call_count == 3
+        assert cache.get_plan(1, backend, "div.p", "h3", None, "a") is not first
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    cache.invalidate_site(1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_extract_posts_reuses_plan_across_posts_and_pages():
+    selector_plans.clear()
+    scraper = WebScraper()
+    backend = get_backend(scraper.parser)
+    with patch.object(backend, "compile", wraps=backend.compile) as compile_spy:
+        for _ in range(3):
+            posts = scraper.extract_posts(scraper.parse_page(PAGE), "div.p", title_selector="h2",
+                                          link_selector="a", base_url="https://x.test/", site_id=42)
+            assert len(posts) == 20
+    assert compile_spy.call_count == 3  # post, title, link — один раз
+    assert posts[3]["url"] == "https://x.test/3"
+
+
+def test_update_site_invalidates_selector_plans(api_client, memory_db):
+    site = Site(name="Plans", url="https://plans.test", selector="div.p")
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper()
+    scraper.extract_posts(scraper.parse_page(PAGE), site.selector, title_selector="h2", site_id=site.id)
+    assert any(key[0] == site.id for key in selector_plans._plans)
+
+    response = api_client.put(f"/api/sites/{site.id}", json={"title_selector": "a"})
+    assert response.status_code == 200
+    assert not any(key[0] == site.id for key in selector_plans._plans)
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.models import Site
+from app.scheduler import TaskScheduler
+from app.site_sync import SiteChange, touch_site
+
+
+def watching_scheduler(memory_session_factory, mode="dispatcher"):
+    scheduler = TaskScheduler(mode=mode, max_workers=2)
+    if mode == "dispatcher":
+        scheduler.set_site_check(lambda site_id: None)
+    else:
+        scheduler.site_job_factory = lambda site_id, interval: (lambda: None)
+    scheduler.watch_sites(memory_session_factory, sync_interval=0)
+    return scheduler
+
+
+def test_site_crud_updates_only_affected_dispatcher_entries(api_client, memory_session_factory):
+    scheduler = watching_scheduler(memory_session_factory)
+    dispatcher = scheduler.dispatcher
+    try:
+        response = api_client.post("/api/sites/", json={
+            "name": "Fresh", "url": "https://fresh.test", "selector": "div", "check_interval": 15,
+        })
+        assert response.status_code == 201
+        site_id = response.json()["id"]
+        due, interval = dispatcher.entry(site_id)
+        assert interval == 15 * 60
+        assert due - dispatcher.clock() <= 15 * 60
+
+        response = api_client.put(f"/api/sites/{site_id}", json={"check_interval": 5})
+        assert response.status_code == 200
+        due, interval = dispatcher.entry(site_id)
+        assert interval == 5 * 60
+        assert due - dispatcher.clock() <= 5 * 60
+
+        api_client.put(f"/api/sites/{site_id}", json={"is_active": False})
+        assert dispatcher.entry(site_id) is None
+        api_client.put(f"/api/sites/{site_id}", json={"is_active": True})
+        assert dispatcher.entry(site_id) is not None
+
+        assert api_client.delete(f"/api/sites/{site_id}").status_code == 204
+        assert dispatcher.entry(site_id) is None
+        assert scheduler.stats()["dispatcher"]["sites"] == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_reconciler_picks_up_out_of_band_edits_by_watermark(memory_session_factory):
+    db = memory_session_factory()
+    sites = [Site(name=f"R{i}", url=f"https://r{i}.test", selector="div", check_interval=10) for i in range(20)]
+    db.add_all(sites)
+    db.commit()
+    scheduler = watching_scheduler(memory_session_factory)
+    try:
+        for site in sites:
+            scheduler.sync_site(SiteChange.from_site(site))
+        # Правка в обход API: другой процесс меняет интервал и выключает сайт
+        sites[3].check_interval = 30
+        sites[3].updated_at = sites[3].updated_at + timedelta(seconds=5)
+        sites[7].is_active = 0
+        touch_site(sites[7])
+        db.commit()
+
+        assert scheduler.reconciler.run() == 2
+        assert scheduler.dispatcher.entry(sites[3].id)[1] == 30 * 60
+        assert scheduler.dispatcher.entry(sites[7].id) is None
+        # Читаются только строки от водяного знака, а не все сайты
+        assert scheduler.reconciler.stats()["seen"] < 5
+        assert scheduler.reconciler.run() == 0
+    finally:
+        scheduler.shutdown()
+        db.close()
+
+
+def test_create_all_databases_bump_updated_at_on_raw_sql_edits(memory_db):
+    site = Site(name="Raw", url="https://raw.test", selector="div", check_interval=10, updated_at=datetime(2020, 1, 1))
+    memory_db.add(site)
+    memory_db.commit()
+    # Ручной SQL без updated_at: триггер из after_create сдвигает водяной знак сам
+    memory_db.execute(text("UPDATE sites SET check_interval = 30 WHERE id = :id"), {"id": site.id})
+    memory_db.commit()
+    memory_db.expire_all()
+    assert memory_db.get(Site, site.id).updated_at > datetime(2020, 1, 1)
+
+
+def test_raw_sql_edit_in_the_same_second_passes_the_watermark(memory_session_factory):
+    db = memory_session_factory()
+    site = Site(name="Sub", url="https://sub.test", selector="div", check_interval=10)
+    touch_site(site)
+    db.add(site)
+    db.commit()
+    scheduler = watching_scheduler(memory_session_factory)
+    try:
+        scheduler.sync_site(SiteChange.from_site(site))
+        scheduler.reconciler.run()
+        # Водяной знак с микросекундами, правка триггером — сразу после него
+        db.execute(text("UPDATE sites SET check_interval = 45 WHERE id = :id"), {"id": site.id})
+        db.commit()
+        stored = db.execute(text("SELECT updated_at FROM sites WHERE id = :id"), {"id": site.id}).scalar()
+        assert len(stored) == len("2026-01-01 00:00:00.000000")
+        assert scheduler.reconciler.run() == 1
+        assert scheduler.dispatcher.entry(site.id)[1] == 45 * 60
+    finally:
+        scheduler.shutdown()
+        db.close()
+
+
+def test_jobs_mode_sync_retimes_and_removes_jobs(memory_session_factory):
+    scheduler = watching_scheduler(memory_session_factory, mode="jobs")
+    scheduler.start()
+    try:
+        assert scheduler.sync_site(SiteChange(1, 20, True)) == "added"
+        assert scheduler.sync_site(SiteChange(1, 20, True)) is None
+        assert scheduler.sync_site(SiteChange(1, 5, True)) == "updated"
+        job = scheduler.scheduler.get_job("check_site_1")
+        assert job.trigger.interval == timedelta(minutes=5)
+        assert scheduler.sync_site(SiteChange(1)) == "removed"
+        assert scheduler.scheduler.get_job("check_site_1") is None
+    finally:
+        scheduler.shutdown()
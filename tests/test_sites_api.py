@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from app.models import Site, Post
+
+
+def make_sites(db, count, posts_per_site=3):
+    ids = []
+    for i in range(count):
+        site = Site(name=f"Site {i}", url=f"https://s{i}.test", selector="div")
+        db.add(site)
+        db.commit()
+        for j in range(posts_per_site):
+            db.add(Post(site_id=site.id, title=f"P{i}-{j}", url=f"https://s{i}.test/{j}",
+                        content_hash=f"{i}-{j}", published_at=datetime(2025, 1, 1 + j)))
+        db.commit()
+        ids.append(site.id)
+    return ids
+
+
+def test_list_sites_keyset_pagination(api_client, memory_db):
+    ids = make_sites(memory_db, 5, posts_per_site=0)
+    first = api_client.get("/api/sites/", params={"limit": 2})
+    assert first.status_code == 200
+    assert [s["id"] for s in first.json()] == ids[:2]
+    cursor = first.headers["X-Next-Cursor"]
+    second = api_client.get("/api/sites/", params={"limit": 2, "after_id": cursor})
+    assert [s["id"] for s in second.json()] == ids[2:4]
+    last = api_client.get("/api/sites/", params={"limit": 2, "after_id": second.headers["X-Next-Cursor"]})
+    assert [s["id"] for s in last.json()] == ids[4:]
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_list_sites_posts_are_bounded_or_omitted(api_client, memory_db):
+    make_sites(memory_db, 2, posts_per_site=3)
+    bounded = api_client.get("/api/sites/", params={"posts_limit": 2}).json()
+    assert [p["title"] for p in bounded[0]["posts"]] == ["P0-2", "P0-1"]
+    assert len(bounded[1]["posts"]) == 2
+    without = api_client.get("/api/sites/", params={"include_posts": "false"}).json()
+    assert all(site["posts"] == [] for site in without)
+
+
+def test_feed_contains_only_newest_posts(api_client, memory_db):
+    site_id = make_sites(memory_db, 1, posts_per_site=3)[0]
+    xml = api_client.get(f"/feed/{site_id}", params={"limit": 2}).text
+    assert xml.count("<item>") == 2
+    assert "P0-0" not in xml
+    assert xml.index("P0-2") < xml.index("P0-1")
@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from app import snapshots as snapshots_module
+from app.fetch_engine import FetchResult
+from app.models import Post, Site
+from app.routers.sites import get_reextract_pool
+from app.scheduler import check_site, page_digest
+from app.scraper import WebScraper
+from app.snapshots import SnapshotStore, reextract_sites
+
+
+def listing(ids, cls="p"):
+    items = "".join(f'<div class="{cls}"><h2>Post {i}</h2><a href="/p/{i}">more</a></div>' for i in ids)
+    return f"<html><body>{items}</body></html>".encode("utf-8")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / "snapshots"), keep=2)
+    monkeypatch.setattr(snapshots_module, "snapshots", store)
+    monkeypatch.setattr("app.scheduler.snapshots", store)
+    monkeypatch.setattr("app.routers.sites.snapshots", store)
+    return store
+
+
+def test_store_keeps_last_pages_content_addressed(store, tmp_path):
+    first = store.save(1, listing([1]), "https://s.test/", "utf-8")
+    assert first == page_digest(listing([1]))
+    assert store.save(1, listing([1]), "https://s.test/") == first
+    second = store.save(1, listing([2]))
+    third = store.save(1, "<p>текст</p>")
+    assert [entry["digest"] for entry in store.entries(1)] == [third, second]
+    assert not (tmp_path / "snapshots" / "1" / f"{first}.zst").exists()
+    assert store.load(1).content == "<p>текст</p>".encode("utf-8")
+    assert store.load(1, second).content == listing([2])
+    assert store.load(1, first) is None and store.load(2) is None
+    assert store.stats()["deduplicated"] == 1 and store.stats()["pruned"] == 1
+    store.delete_site(1)
+    assert store.entries(1) == []
+    assert SnapshotStore(str(tmp_path / "off"), keep=0).save(1, b"x") is None
+
+
+def test_check_site_snapshots_html_and_reextract_backfills(store, memory_db):
+    site = Site(name="Snap", url="https://snap.test", selector="div.p", title_selector="h2", link_selector="a")
+    memory_db.add(site)
+    memory_db.commit()
+    scraper = WebScraper()
+    scraper.fetch = MagicMock(return_value=FetchResult(site.id, site.url, status_code=200, content=listing([2, 1]),
+                                                       encoding="utf-8"))
+    assert check_site(site, memory_db, scraper)["new_posts_count"] == 2
+    scraper.fetch.return_value = FetchResult(site.id, site.url, status_code=200,
+                                             content=listing([4, 3], cls="q") + listing([2, 1]), encoding="utf-8")
+    check_site(site, memory_db, scraper)
+    assert [entry["digest"] for entry in store.entries(site.id)] == [site.content_digest, page_digest(listing([2, 1]))]
+
+    # Исправленный селектор: посты 3 и 4 достаются из сохраненных страниц без загрузки
+    site.selector = "div.p, div.q"
+    memory_db.commit()
+    [result] = reextract_sites(memory_db, [site], store=store)
+    assert result == {"site_id": site.id, "snapshots": 2, "posts_found": 4, "new_posts_count": 2, "error": None}
+    assert memory_db.query(Post).filter_by(site_id=site.id).count() == 4
+    # Дата добавленных постов — время загрузки страницы, где они нашлись
+    fetched_at = store.entries(site.id)[0]["fetched_at"]
+    backfilled = memory_db.query(Post).filter(Post.site_id == site.id, Post.title.in_(["Post 3", "Post 4"])).all()
+    assert [post.published_at.isoformat() for post in backfilled] == [fetched_at, fetched_at]
+    assert scraper.fetch.call_count == 2
+
+
+def test_preview_and_reextract_endpoints(store, api_client):
+    from app.main import app
+    site = api_client.post("/api/sites/", json={"name": "Prev", "url": "https://prev.test", "selector": "div.p",
+                                                "title_selector": "h2", "link_selector": "a"}).json()
+    assert api_client.post(f"/api/sites/{site['id']}/preview", json={}).status_code == 404
+    store.save(site["id"], listing([3, 2, 1]), "https://prev.test")
+
+    response = api_client.post(f"/api/sites/{site['id']}/preview", json={"title_selector": "a", "limit": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 3 and body["new_count"] == 3
+    assert [post["title"] for post in body["posts"]] == ["more", "more"]
+    assert body["snapshot"]["digest"] == page_digest(listing([3, 2, 1]))
+    assert api_client.post(f"/api/sites/{site['id']}/preview", json={"selector": "div:::"}).status_code == 400
+    assert api_client.get(f"/api/sites/{site['id']}/snapshots").json()["snapshots"][0]["url"] == "https://prev.test"
+
+    app.dependency_overrides[get_reextract_pool] = lambda: None
+    try:
+        response = api_client.post("/api/sites/reextract", params={"site_id": site["id"]})
+    finally:
+        app.dependency_overrides.pop(get_reextract_pool, None)
+    assert response.status_code == 202 and response.json()["site_ids"] == [site["id"]]
+    preview = api_client.post(f"/api/sites/{site['id']}/preview", json={}).json()
+    assert preview["new_count"] == 0
@@ -0,0 +1,33 @@
+import json
+import threading
+from urllib.request import urlopen
+
+from app.models import Site
+from app.worker import ScrapeWorker, make_metrics_server
+
+
+def test_worker_serves_health_and_metrics(memory_session_factory):
+    db = memory_session_factory()
+    db.add_all([Site(name=f"W{i}", url=f"https://w{i}.test", selector="div") for i in range(3)])
+    db.commit()
+    db.close()
+    worker = ScrapeWorker(max_workers=2, parse_workers=0, fetch_concurrency=5, mode="dispatcher",
+                          db_session_factory=memory_session_factory, lease_owner="test-worker")
+    server = make_metrics_server(worker, host="127.0.0.1", port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    worker.start()
+    try:
+        with urlopen(f"{base}/health") as response:
+            assert response.status == 200
+        with urlopen(f"{base}/metrics") as response:
+            metrics = json.load(response)
+        assert metrics["lease_owner"] == "test-worker"
+        assert metrics["fetch_concurrency"] == 5
+        assert metrics["scheduler"]["dispatcher"]["sites"] == 3
+        assert metrics["scheduler"]["dispatcher"]["max_workers"] == 2
+    finally:
+        worker.stop()
+        worker.shutdown()
+        server.shutdown()
+    assert not worker.healthy()